@@ -0,0 +1,159 @@
+"""
+Pipeline analytics kept in rollup tables instead of aggregating `transactions` per request.
+
+pipeline_rollup holds count / offer / close sums per (stage, side); pipeline_history holds the
+same per creation day (cohorts by current stage). Every write path that creates or changes a
+transaction applies a signed delta in the same database transaction as the write, so the
+rollups never drift; `python -m app.cli rebuild-analytics` recomputes both from scratch.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+CLOSED = "closed"
+FALLEN_THROUGH = "fallen_through"
+STAGES = ("lead", "showing", "offer", "conditional", "pending", CLOSED, FALLEN_THROUGH)
+
+class TxFacts(NamedTuple):
+    stage: str
+    side: str
+    offer_price: Optional[float]
+    close_price: Optional[float]
+    bucket: date  # UTC creation day
+
+def facts(tx) -> TxFacts:
+    created = tx.created_at or datetime.now(timezone.utc)
+    return TxFacts(tx.stage, tx.side, tx.offer_price, tx.close_price, created.astimezone(timezone.utc).date())
+
+# ---------- deltas ----------
+
+SUMS = ("count", "offer_count", "offer_total", "close_count", "close_total")
+
+def _aggregate(changes: Iterable[Tuple[TxFacts, int]]) -> Dict[tuple, List[float]]:
+    """(bucket, stage, side) -> summed deltas, from (facts, +1 / -1) pairs."""
+    out: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0, 0.0, 0, 0.0])
+    for f, sign in changes:
+        d = out[(f.bucket, f.stage, f.side)]
+        d[0] += sign
+        if f.offer_price is not None:
+            d[1] += sign
+            d[2] += sign * f.offer_price
+        if f.close_price is not None:
+            d[3] += sign
+            d[4] += sign * f.close_price
+    return out
+
+def _upsert_sql(table: str, keys: Tuple[str, ...], params: List[str]) -> str:
+    cols = keys + SUMS
+    updates = ", ".join(f"{c} = {table}.{c} + EXCLUDED.{c}" for c in SUMS)
+    return (
+        f"INSERT INTO {table} ({', '.join(cols)}) SELECT * FROM unnest({', '.join(params)}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+
+_ARRAY_TYPES = ("text[]", "text[]", "bigint[]", "bigint[]", "float8[]", "bigint[]", "float8[]")
+# one statement per table whatever the batch size; SQLAlchemy and raw asyncpg (COPY import) flavours
+ROLLUP_SQL = _upsert_sql("pipeline_rollup", ("stage", "side"), [f"CAST(:a{i} AS {t})" for i, t in enumerate(_ARRAY_TYPES)])
+HISTORY_SQL = _upsert_sql("pipeline_history", ("bucket", "stage", "side"),
+                          ["CAST(:b AS date[])"] + [f"CAST(:a{i} AS {t})" for i, t in enumerate(_ARRAY_TYPES)])
+ROLLUP_SQL_RAW = _upsert_sql("pipeline_rollup", ("stage", "side"), [f"${i + 1}::{t}" for i, t in enumerate(_ARRAY_TYPES)])
+HISTORY_SQL_RAW = _upsert_sql("pipeline_history", ("bucket", "stage", "side"),
+                              ["$8::date[]"] + [f"${i + 1}::{t}" for i, t in enumerate(_ARRAY_TYPES)])
+
+def _columns(agg: Dict[tuple, List[float]], with_bucket: bool):
+    if not with_bucket:  # fold the days together for pipeline_rollup
+        folded: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0, 0.0, 0, 0.0])
+        for (_, stage, side), d in agg.items():
+            folded[(stage, side)] = [a + b for a, b in zip(folded[(stage, side)], d)]
+        keys, values = list(folded), list(folded.values())
+        arrays = [[k[0] for k in keys], [k[1] for k in keys]]
+    else:
+        keys, values = list(agg), list(agg.values())
+        arrays = [[k[1] for k in keys], [k[2] for k in keys]]
+    arrays += [list(col) for col in zip(*values)] if values else [[] for _ in SUMS]
+    if with_bucket:
+        arrays.append([k[0] for k in keys])
+    return arrays
+
+async def apply(db, changes: Iterable[Tuple[TxFacts, int]]) -> None:
+    """Apply (facts, +1 / -1) deltas through an AsyncSession, inside the caller's transaction."""
+    agg = _aggregate(changes)
+    if not agg:
+        return
+    rollup = _columns(agg, with_bucket=False)
+    await db.execute(text(ROLLUP_SQL), {f"a{i}": v for i, v in enumerate(rollup)})
+    history = _columns(agg, with_bucket=True)
+    await db.execute(text(HISTORY_SQL), {**{f"a{i}": v for i, v in enumerate(history[:-1])}, "b": history[-1]})
+
+async def apply_raw(conn, changes: Iterable[Tuple[TxFacts, int]]) -> None:
+    """Same as apply() on a raw asyncpg connection (the COPY importer's)."""
+    agg = _aggregate(changes)
+    if not agg:
+        return
+    await conn.execute(ROLLUP_SQL_RAW, *_columns(agg, with_bucket=False))
+    await conn.execute(HISTORY_SQL_RAW, *_columns(agg, with_bucket=True))
+
+async def record_created(db, txs) -> None:
+    """Count new transactions; call after flush (defaults applied) and before commit."""
+    await apply(db, [(facts(tx), 1) for tx in txs])
+
+# ---------- rebuild ----------
+
+REBUILD_SQL = [
+    "LOCK TABLE pipeline_rollup, pipeline_history IN EXCLUSIVE MODE",  # writers queue behind the rebuild
+    "DELETE FROM pipeline_rollup",
+    "DELETE FROM pipeline_history",
+    "INSERT INTO pipeline_history (bucket, stage, side, count, offer_count, offer_total, close_count, close_total) "
+    "SELECT (created_at AT TIME ZONE 'UTC')::date, stage, side, count(*), count(offer_price), coalesce(sum(offer_price), 0), "
+    "count(close_price), coalesce(sum(close_price), 0) FROM transactions GROUP BY 1, 2, 3",
+    "INSERT INTO pipeline_rollup (stage, side, count, offer_count, offer_total, close_count, close_total) "
+    "SELECT stage, side, sum(count), sum(offer_count), sum(offer_total), sum(close_count), sum(close_total) "
+    "FROM pipeline_history GROUP BY 1, 2",
+]
+
+def rebuild_sync(conn) -> None:
+    for stmt in REBUILD_SQL:
+        conn.execute(text(stmt))
+
+async def rebuild(db) -> None:
+    for stmt in REBUILD_SQL:
+        await db.execute(text(stmt))
+    await db.commit()
+
+# ---------- reading ----------
+
+def ratio(num: float, den: float) -> Optional[float]:
+    return round(num / den, 4) if den else None
+
+def summarize(rows) -> dict:
+    """Stage/side breakdown plus conversion figures from rollup-shaped rows."""
+    by_stage: Dict[str, dict] = {}
+    totals = {c: 0 for c in SUMS}
+    for r in rows:
+        entry = by_stage.setdefault(r.stage, {"stage": r.stage, "count": 0, "offer_total": 0.0, "close_total": 0.0, "by_side": {}})
+        entry["count"] += r.count
+        entry["offer_total"] += r.offer_total
+        entry["close_total"] += r.close_total
+        entry["by_side"][r.side] = {
+            "count": r.count,
+            "offer_total": r.offer_total,
+            "avg_offer": ratio(r.offer_total, r.offer_count),
+            "close_total": r.close_total,
+            "avg_close": ratio(r.close_total, r.close_count),
+        }
+        for c in SUMS:
+            totals[c] += getattr(r, c)
+    closed = by_stage.get(CLOSED, {}).get("count", 0)
+    fallen = by_stage.get(FALLEN_THROUGH, {}).get("count", 0)
+    order = {s: i for i, s in enumerate(STAGES)}
+    return {
+        "total": totals["count"],
+        "offer_total": totals["offer_total"],
+        "close_total": totals["close_total"],
+        "conversion_rate": ratio(closed, totals["count"]),         # lead -> closed, over everything that entered
+        "fallen_through_ratio": ratio(fallen, closed + fallen),    # of the deals that finished
+        "open": totals["count"] - closed - fallen,
+        "stages": sorted(by_stage.values(), key=lambda e: (order.get(e["stage"], len(order)), e["stage"])),
+    }
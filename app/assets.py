@@ -0,0 +1,90 @@
+"""
+The sheet UI's static files (app/static), served from memory with long-lived caching.
+
+Everything is read once at import. Each asset gets a content-hashed name (app.<hash>.js), so
+its URL changes whenever its bytes do and browsers may cache it forever (immutable).
+index.html, the only file at a fixed URL, has the hashed names filled in and is revalidated on
+every load with its ETag, which costs a 304 and no body when nothing changed.
+
+Gzip (and brotli, when the optional `brotli` package is installed) variants are compressed
+once, at the highest level, rather than per request.
+"""
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+STATIC_DIR = Path(__file__).parent / "static"
+INDEX = "index.html"
+URL_PREFIX = "/static/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+MIN_COMPRESS = 256  # smaller files aren't worth a Content-Encoding
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+class Asset:
+    def __init__(self, name: str, body: bytes, media_type: str):
+        self.name, self.media_type = name, media_type
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = f'"{digest[:16]}"'
+        stem, dot, ext = name.rpartition(".")
+        self.hashed = f"{stem}.{digest[:12]}{dot}{ext}" if stem else name
+        self.bodies: Dict[str, bytes] = {"identity": body}
+        if len(body) >= MIN_COMPRESS:
+            self.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=11)
+
+    def response(self, accept_encoding: Optional[str], if_none_match: Optional[str], cache_control: str) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if if_none_match and self.etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        encoding = _pick_encoding(accept_encoding, self.bodies)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+def _pick_encoding(accept_encoding: Optional[str], available) -> str:
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = re.search(r"q=([0-9.]+)", params)
+        offered[name.strip().lower()] = float(q.group(1)) if q else 1.0
+    for encoding in ("br", "gzip"):
+        if encoding in available and offered.get(encoding, offered.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+def _media_type(name: str) -> str:
+    guessed = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return guessed + "; charset=utf-8" if guessed.startswith("text/") or guessed.endswith("javascript") else guessed
+
+def _load():
+    assets = {}
+    for path in sorted(STATIC_DIR.iterdir()):
+        if path.is_file() and path.name != INDEX:
+            asset = Asset(path.name, path.read_bytes(), _media_type(path.name))
+            assets[asset.hashed] = asset
+    html = (STATIC_DIR / INDEX).read_text()
+    for asset in assets.values():  # {{app.js}} -> /static/app.<hash>.js
+        html = html.replace("{{%s}}" % asset.name, URL_PREFIX + asset.hashed)
+    return Asset(INDEX, html.encode(), "text/html; charset=utf-8"), assets
+
+index, by_hashed_name = _load()
+
+def serve_index(accept_encoding: Optional[str], if_none_match: Optional[str]) -> Response:
+    return index.response(accept_encoding, if_none_match, "no-cache")
+
+def serve(name: str, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Response:
+    asset = by_hashed_name.get(name)
+    if asset is None:  # includes names from an older deploy: the page that asked for them is stale
+        raise HTTPException(status_code=404, detail="Not found")
+    return asset.response(accept_encoding, if_none_match, IMMUTABLE)
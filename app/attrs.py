@@ -0,0 +1,188 @@
+"""
+Query helpers for the schemaless `attrs` JSONB columns.
+
+Equality lookups are expressed as containment (`attrs @> '{"key": value}'`) so the
+jsonb_path_ops GIN index on each attrs column can answer them. Numeric range lookups go
+through range_expr(), which uses a promoted generated column (attr_<key>, B-tree indexed)
+when one exists. attr_catalog records which keys get queried and how, to pick what to promote.
+"""
+import json
+import logging
+import math
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import Numeric, and_, case, column, func, literal_column, or_, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import SQLAlchemyError
+
+log = logging.getLogger(__name__)
+
+def json_variants(value: str) -> List[Any]:
+    """
+    Query-string values are always text, but attrs may hold numbers or booleans.
+    `attrs->>key = '5'` used to match both "5" and 5, so we try each JSON form.
+    """
+    out: List[Any] = [value]
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return out
+    # NaN/Infinity parse as floats but have no JSON form, so they stay text
+    if isinstance(parsed, (bool, int)) or isinstance(parsed, float) and math.isfinite(parsed):
+        out.append(parsed)
+    return out
+
+def attrs_equal(attrs_col, pairs: Iterable[Tuple[str, str]]):
+    """AND of attrs[key] == value for every pair, as index-friendly containment tests."""
+    single = {}  # unambiguous pairs fold into one @> document
+    clauses = []
+    for key, value in pairs:
+        variants = json_variants(value)
+        if len(variants) == 1:
+            single[key] = variants[0]
+        else:
+            clauses.append(or_(*[attrs_col.contains({key: v}) for v in variants]))
+    if single:
+        clauses.insert(0, attrs_col.contains(single))
+    return and_(*clauses)
+
+# ---------- numeric attrs and promoted columns ----------
+
+# no backslashes: these end up inside generated-column DDL as SQL string literals
+NUMERIC_RE = r"^-?[0-9]+([.][0-9]+)?$"
+STRIP_RE = r"[$,[:space:]]"
+PROMOTABLE_KEY_RE = re.compile(r"^[a-z_][a-z0-9_]{0,39}$")
+
+def numeric_attr(attrs_col, key: str):
+    """
+    attrs[key] as numeric, or NULL when it is not a number. Strings like "$899,000" (common in
+    imports) count as numbers; anything else is NULL instead of failing the whole query.
+    """
+    raw = attrs_col[key].astext
+    cleaned = func.regexp_replace(raw, STRIP_RE, "", "g")
+    return case(
+        (func.jsonb_typeof(attrs_col[key]) == "number", raw.cast(Numeric)),
+        (cleaned.op("~")(NUMERIC_RE), cleaned.cast(Numeric)),
+    )
+
+def generated_numeric_attr(key: str):
+    """numeric_attr() over the bare `attrs` column, for GENERATED ALWAYS AS (...)."""
+    return numeric_attr(literal_column("attrs", JSONB), key)
+
+def generated_sql(expr) -> str:
+    # run through exec_driver_sql, never text(): "[:space:]" would read as a bind parameter
+    return str(expr.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def promoted_name(key: str) -> str:
+    return f"attr_{key}"
+
+# (table, key) -> generated column name; seeded from the models, refreshed from attr_catalog
+_promoted: Dict[Tuple[str, str], str] = {}
+
+def _seed_promoted() -> None:
+    from app import models
+    for table in models.Base.metadata.sorted_tables:
+        for col in table.columns:
+            if col.computed is not None and col.name.startswith("attr_"):
+                _promoted[(table.name, col.name[len("attr_"):])] = col.name
+
+def promoted_column(table_name: str, key: str):
+    """Name of the generated column holding attrs[key], or None."""
+    if not _promoted:
+        _seed_promoted()
+    return _promoted.get((table_name, key))
+
+def range_expr(table, key: str):
+    """The expression to range-filter attrs[key] on: a B-tree indexed generated column once promoted."""
+    name = promoted_column(table.name, key)
+    if name is None:
+        return numeric_attr(table.c.attrs, key)
+    return table.c[name] if name in table.c else column(name, Numeric, _selectable=table)
+
+# ---------- attribute catalog ----------
+
+# usage is counted in memory and written to attr_catalog at most every FLUSH_SECONDS
+FLUSH_SECONDS = 10.0
+MAX_KEY_LENGTH = 100  # attr_catalog.key
+_usage: Dict[Tuple[str, str, str], int] = defaultdict(int)
+_last_flush = 0.0
+
+def note_usage(table: str, key: str, kind: str) -> None:
+    """Record that attrs[key] of `table` was queried as `kind` ("number" or "string")."""
+    if len(key) <= MAX_KEY_LENGTH:  # longer keys can still be queried, just not catalogued
+        _usage[(table, key, kind)] += 1
+
+async def flush_usage(db, force: bool = False) -> None:
+    global _last_flush
+    if not force and time.monotonic() - _last_flush < FLUSH_SECONDS:
+        return
+    _last_flush = time.monotonic()
+    pending = list(_usage.items())
+    _usage.clear()
+    try:
+        await _write_usage(db, pending)
+    except SQLAlchemyError:  # bookkeeping: never fail the search that triggered it
+        log.warning("could not write attr_catalog usage; retrying on the next flush", exc_info=True)
+        await db.rollback()
+        for entry, hits in pending:
+            _usage[entry] += hits
+
+async def _write_usage(db, pending: List[Tuple[Tuple[str, str, str], int]]) -> None:
+    for (table, key, kind), hits in pending:
+        await db.execute(text(
+            "INSERT INTO attr_catalog (entity, key, hits, query_types, last_used_at) "
+            "VALUES (:entity, :key, :hits, jsonb_build_object(CAST(:kind AS text), CAST(:hits AS bigint)), now()) "
+            "ON CONFLICT (entity, key) DO UPDATE SET hits = attr_catalog.hits + EXCLUDED.hits, last_used_at = now(), "
+            "query_types = attr_catalog.query_types || jsonb_build_object(CAST(:kind AS text), "
+            "COALESCE((attr_catalog.query_types->>CAST(:kind AS text))::bigint, 0) + CAST(:hits AS bigint))"
+        ), {"entity": table, "key": key, "kind": kind, "hits": hits})
+    await refresh_promoted(db)  # pick up columns promoted from other processes
+    await db.commit()
+
+def load_promoted(rows: Iterable[Tuple[str, str, str]]) -> None:
+    """Register (table, key, column) rows for keys promoted at runtime (attr_catalog.promoted_column)."""
+    if not _promoted:
+        _seed_promoted()
+    for table, key, name in rows:
+        _promoted[(table, key)] = name
+
+async def refresh_promoted(db) -> None:
+    load_promoted(await db.execute(text("SELECT entity, key, promoted_column FROM attr_catalog WHERE promoted_column IS NOT NULL")))
+
+def promoted_version() -> int:
+    """Changes whenever a key gets promoted; part of cache keys for plans built with range_expr."""
+    if not _promoted:
+        _seed_promoted()
+    return len(_promoted)  # promotions only ever add entries
+
+async def promote(db, table: str, key: str) -> str:
+    """
+    Add a stored generated numeric column for attrs[key] plus a B-tree index on it.
+    This rewrites the table under an exclusive lock, so run it from the CLI, not a request.
+    """
+    if not PROMOTABLE_KEY_RE.match(key):
+        raise ValueError("only keys matching [a-z_][a-z0-9_]* (max 40 chars) can be promoted")
+    name = promoted_name(key)
+    conn = await db.connection()
+    await conn.exec_driver_sql(
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} numeric "
+        f"GENERATED ALWAYS AS ({generated_sql(generated_numeric_attr(key))}) STORED"
+    )
+    await db.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{name} ON {table} ({name})"))
+    sample = await db.execute(text(
+        f"SELECT jsonb_typeof(attrs->:key) AS t, count(*) FROM {table} TABLESAMPLE SYSTEM (1) "
+        f"WHERE attrs ? :key GROUP BY 1"
+    ), {"key": key})
+    value_types = {t: n for t, n in sample}
+    await db.execute(text(
+        "INSERT INTO attr_catalog (entity, key, hits, query_types, value_types, promoted_column) "
+        "VALUES (:entity, :key, 0, '{}', CAST(:types AS jsonb), :name) "
+        "ON CONFLICT (entity, key) DO UPDATE SET value_types = EXCLUDED.value_types, promoted_column = EXCLUDED.promoted_column"
+    ), {"entity": table, "key": key, "types": json.dumps(value_types), "name": name})
+    await db.commit()
+    _promoted[(table, key)] = name
+    return name
@@ -0,0 +1,141 @@
+"""
+Reference-counted document blobs: identical files are stored once, however many documents use them.
+
+The `blobs` table has one row per stored key (the SHA-256 of the bytes) with the number of
+documents pointing at it. An upload is hashed while it spools to a temp file (app.storage), then:
+
+  1. reserve(): upsert the blob row in its own short transaction. A row that already has its
+     bytes (`stored`) ends the upload there: nothing is written to the store again.
+  2. otherwise the spooled file goes into the store and the row is marked stored.
+  3. reference(): refcount + 1 in the same transaction that inserts the document.
+
+Deleting a document release()s its blob. A blob whose refcount reached zero is only removed
+by collect() once it has stayed unreferenced for GRACE_HOURS, and collect() deletes the bytes
+while holding the row lock, so an upload of the same content either waits and stores it again
+or finds it still there. The grace period also covers reserved blobs whose document insert
+failed (nothing ever referenced them) and uploads between reserve() and reference().
+collect() double-checks documents.sha256 before deleting, and recount() rebuilds the counts
+from the documents table.
+"""
+import os
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from app.storage import StoredBlob, get_store
+
+GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", "24"))
+GC_BATCH = 500
+
+class BlobGone(RuntimeError):
+    """The blob was garbage-collected between reserve() and reference(); upload it again."""
+
+# a re-upload of unreferenced content restarts its grace period
+RESERVE_SQL = text(
+    "INSERT INTO blobs (key, size, refcount, stored, unreferenced_at) VALUES (:key, :size, 0, false, now()) "
+    "ON CONFLICT (key) DO UPDATE SET unreferenced_at = CASE WHEN blobs.refcount = 0 THEN now() END "
+    "RETURNING stored"
+)
+
+async def reserve(key: str, size: int) -> bool:
+    """Make sure the blob row exists; True when its bytes are already stored."""
+    async with SessionLocal() as db:
+        stored = (await db.execute(RESERVE_SQL, {"key": key, "size": size})).scalar()
+        await db.commit()
+    return stored
+
+async def _mark_stored(key: str) -> None:
+    async with SessionLocal() as db:
+        await db.execute(text("UPDATE blobs SET stored = true WHERE key = :key"), {"key": key})
+        await db.commit()
+
+async def store_file(path: str, key: str, size: int) -> bool:
+    """Move the already-hashed file at `path` into the store unless `key` is stored; True if it was moved."""
+    if await reserve(key, size):
+        return False
+    await get_store().put_file(path, key)
+    await _mark_stored(key)
+    return True
+
+async def store_stream(chunks: AsyncIterator[bytes]) -> StoredBlob:
+    """Hash `chunks` and store them unless the same content already is; reference() it next."""
+    async with get_store().spooled(chunks) as spool:
+        await store_file(spool.path, spool.key, spool.size)
+        return StoredBlob(key=spool.key, size=spool.size)
+
+async def lookup(db, key: str) -> Optional[int]:
+    """Size of a stored blob, None when it isn't (or is past its grace period and about to go)."""
+    return (await db.execute(
+        text("SELECT size FROM blobs WHERE key = :key AND stored "
+             "AND (refcount > 0 OR unreferenced_at > now() - make_interval(secs => CAST(:grace AS float8) * 3600))"),
+        {"key": key, "grace": GRACE_HOURS},
+    )).scalar()
+
+async def reference(db, key: str, count: int = 1) -> None:
+    """Count `count` more documents using `key`; call in the transaction that points them at it."""
+    res = await db.execute(
+        text("UPDATE blobs SET refcount = refcount + :n, unreferenced_at = NULL WHERE key = :key AND stored RETURNING key"),
+        {"key": key, "n": count},
+    )
+    if res.scalar() is None:
+        raise BlobGone(key)
+
+async def release(db, keys: Iterable[Optional[str]]) -> None:
+    """One document per entry of `keys` no longer uses that blob."""
+    counts = Counter(k for k in keys if k)
+    if counts:
+        await db.execute(text(
+            "UPDATE blobs b SET refcount = greatest(b.refcount - r.n, 0), "
+            "unreferenced_at = CASE WHEN b.refcount - r.n <= 0 THEN now() END "
+            "FROM unnest(CAST(:keys AS text[]), CAST(:ns AS int[])) AS r(key, n) WHERE b.key = r.key"
+        ), {"keys": list(counts), "ns": list(counts.values())})
+
+# ---------- garbage collection ----------
+
+COLLECTABLE_SQL = text("""
+SELECT key FROM blobs b
+WHERE refcount = 0 AND unreferenced_at < now() - make_interval(secs => CAST(:grace AS float8) * 3600)
+  AND NOT EXISTS (SELECT 1 FROM documents d WHERE d.sha256 = b.key)
+ORDER BY unreferenced_at
+LIMIT :n
+FOR UPDATE SKIP LOCKED
+""")
+
+async def collect(grace_hours: float = GRACE_HOURS) -> Dict[str, Any]:
+    """Delete blobs unreferenced for longer than `grace_hours`; returns counts and when to run next."""
+    store = get_store()
+    deleted = 0
+    while True:
+        async with SessionLocal() as db:
+            keys = (await db.execute(COLLECTABLE_SQL, {"grace": grace_hours, "n": GC_BATCH})).scalars().all()
+            for key in keys:  # bytes first, with the rows locked: a concurrent upload waits for this commit
+                await store.delete(key)
+            if keys:
+                await db.execute(text("DELETE FROM blobs WHERE key = ANY(:keys)"), {"keys": list(keys)})
+            await db.commit()
+        deleted += len(keys)
+        if len(keys) < GC_BATCH:
+            break
+    async with SessionLocal() as db:
+        row = (await db.execute(text(
+            "SELECT count(*) AS waiting, extract(epoch FROM min(unreferenced_at) + make_interval(secs => CAST(:grace AS float8) * 3600) - now()) AS due_in "
+            "FROM blobs WHERE refcount = 0"
+        ), {"grace": grace_hours})).one()
+    return {"deleted": deleted, "waiting": row.waiting, "next_due_seconds": max(float(row.due_in), 0.0) if row.waiting else None}
+
+RECOUNT_SQL = [
+    "LOCK TABLE blobs IN EXCLUSIVE MODE",  # uploads wait; their documents are counted after
+    "INSERT INTO blobs (key, size, refcount, stored) "
+    "SELECT sha256, coalesce(max(size), 0), count(*), true FROM documents WHERE sha256 IS NOT NULL GROUP BY sha256 "
+    "ON CONFLICT (key) DO UPDATE SET refcount = EXCLUDED.refcount, stored = true, unreferenced_at = NULL",
+    "UPDATE blobs b SET refcount = 0, unreferenced_at = coalesce(unreferenced_at, now()) "
+    "WHERE refcount <> 0 AND NOT EXISTS (SELECT 1 FROM documents d WHERE d.sha256 = b.key)",
+]
+
+async def recount(db) -> None:
+    """Rebuild every refcount from documents.sha256 (after manual edits, or to check for drift)."""
+    for stmt in RECOUNT_SQL:
+        await db.execute(text(stmt))
+    await db.commit()
@@ -0,0 +1,226 @@
+"""
+Conditional-GET response cache for the list endpoints.
+
+Every cached route depends on one table, plus the tables of whatever it inlines with ?expand=,
+and every table has a version counter that the write paths bump (`await bump("contacts")` after a
+commit). A response's ETag is derived from the request path, its query string and the current
+versions of those tables, so:
+
+  * a client revalidating with If-None-Match gets a 304 without the route running at all, and
+  * a repeat of the same request is served from the stored body until the table is written to.
+
+Either way an unchanged table costs no database work. With RESPONSE_CACHE_PATH unset, versions
+and bodies live in this process only, which is right for the single uvicorn worker the Docker
+image runs; set it to a local SQLite file to share both across workers and with the CLI. SQLite
+calls can wait on another worker's write lock, so they run in the threadpool, never on the
+event loop.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")  # e.g. /tmp/ai-crm-cache.sqlite3
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "256"))
+MAX_BODY_BYTES = 8 * 1024 * 1024  # don't keep anything bigger
+
+# GET path -> the table its output depends on
+CACHED_ROUTES = {
+    "/contacts/": "contacts",
+    "/properties/": "properties",
+    "/transactions/": "transactions",
+    "/documents/": "documents",
+}
+# ?expand= relationship name -> the table it reads (app/expand.py)
+EXPAND_TABLES = {"contact": "contacts", "property": "properties", "transactions": "transactions", "documents": "documents"}
+
+Entry = Tuple[bytes, List[Tuple[bytes, bytes]]]  # body, raw headers
+
+class MemoryStore:
+    blocking = False  # whether calls may wait on I/O or locks (then they go to the threadpool)
+
+    def __init__(self, entries: int):
+        self.entries = entries
+        # a fresh epoch per process: versions restart at 0, so old ETags must not match after a restart
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions: Dict[str, int] = {}
+        self._responses: "OrderedDict[str, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, table: str) -> str:
+        return f"{self.epoch}.{self._versions.get(table, 0)}"
+
+    def versions(self, tables: Iterable[str]) -> str:
+        return ",".join(self.version(t) for t in tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is not None:
+                self._responses.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: Entry) -> None:
+        with self._lock:
+            self._responses[key] = entry
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.entries:
+                self._responses.popitem(last=False)
+
+class SqliteStore(MemoryStore):
+    """
+    Versions and bodies in a local SQLite file shared by all workers on the host; the in-memory
+    LRU in front of it saves the file read when this worker has already seen the response.
+    Version reads are a single indexed lookup, far cheaper than a Postgres round trip.
+    """
+    blocking = True
+
+    def __init__(self, path: str, entries: int):
+        super().__init__(entries)
+        self._local = threading.local()
+        self.path = path
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, v INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body BLOB, headers BLOB, used REAL)")
+        # the file's own epoch, so a deleted and recreated cache file can't revive old ETags
+        conn.execute("INSERT OR IGNORE INTO versions (name, v) VALUES ('~epoch', ?)", (uuid.uuid4().int >> 96,))
+        self.epoch = str(conn.execute("SELECT v FROM versions WHERE name = '~epoch'").fetchone()[0])
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self, table: str) -> str:
+        row = self._conn().execute("SELECT v FROM versions WHERE name = ?", (table,)).fetchone()
+        return f"{self.epoch}.{row[0] if row else 0}"
+
+    def bump(self, tables: Iterable[str]) -> None:
+        conn = self._conn()
+        for table in tables:
+            conn.execute("INSERT INTO versions (name, v) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET v = v + 1", (table,))
+
+    def get(self, key: str) -> Optional[Entry]:
+        entry = super().get(key)
+        if entry is not None:
+            return entry
+        row = self._conn().execute("SELECT body, headers FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], _unpack_headers(row[1]))
+        super().put(key, entry)
+        return entry
+
+    def put(self, key: str, entry: Entry) -> None:
+        super().put(key, entry)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, body, headers, used) VALUES (?, ?, ?, ?)",
+            (key, entry[0], _pack_headers(entry[1]), time.time()),
+        )
+        # keys embed the table version, so superseded entries just age out here
+        conn.execute(
+            "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY used DESC LIMIT ?)",
+            (self.entries * 4,),
+        )
+
+def _pack_headers(headers: List[Tuple[bytes, bytes]]) -> bytes:
+    return b"\n".join(k + b":" + v for k, v in headers)
+
+def _unpack_headers(raw: bytes) -> List[Tuple[bytes, bytes]]:
+    return [tuple(line.split(b":", 1)) for line in raw.split(b"\n") if line]
+
+def _tables(path: str, query: bytes) -> List[str]:
+    """The route's table and those of its ?expand= relationships (unknown names get a 400, never cached)."""
+    tables = [CACHED_ROUTES[path]]
+    for value in parse_qs(query.decode("latin-1")).get("expand", [])[-1:]:  # FastAPI reads the last one
+        for name in value.split(","):
+            table = EXPAND_TABLES.get(name.strip())
+            if table and table not in tables:
+                tables.append(table)
+    return tables
+
+_store: Optional[MemoryStore] = None
+
+def get_store() -> MemoryStore:
+    global _store
+    if _store is None:
+        _store = SqliteStore(RESPONSE_CACHE_PATH, RESPONSE_CACHE_ENTRIES) if RESPONSE_CACHE_PATH else MemoryStore(RESPONSE_CACHE_ENTRIES)
+    return _store
+
+async def _offload(fn, *args):
+    return await run_in_threadpool(fn, *args) if get_store().blocking else fn(*args)
+
+async def bump(*tables: str) -> None:
+    """Invalidate cached responses for `tables`; await it after the write has committed."""
+    await _offload(get_store().bump, tables)
+
+# ---------- middleware ----------
+
+# only these response headers are replayed from the cache
+KEPT_HEADERS = {b"content-type", b"content-length"}
+
+class ResponseCacheMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in CACHED_ROUTES:
+            return await self.app(scope, receive, send)
+
+        store = get_store()
+        raw_query = scope.get("query_string", b"")
+        query = b"&".join(sorted(raw_query.split(b"&"))).decode("latin-1")
+        versions = await _offload(store.versions, _tables(scope["path"], raw_query))
+        key = f"{scope['path']}?{query}#{versions}"
+        etag = 'W/"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+        cache_headers = [(b"etag", etag.encode("ascii")), (b"cache-control", b"no-cache")]
+
+        if_none_match = dict(scope["headers"]).get(b"if-none-match", b"").decode("latin-1")
+        if etag in (t.strip() for t in if_none_match.split(",")) or if_none_match.strip() == "*":
+            await send({"type": "http.response.start", "status": 304, "headers": cache_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        entry = await _offload(store.get, key)
+        if entry is not None:
+            body, headers = entry
+            await send({"type": "http.response.start", "status": 200, "headers": headers + cache_headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start: dict = {}
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                start.update(message)
+                if message["status"] == 200:
+                    message = {**message, "headers": list(message.get("headers", [])) + cache_headers}
+            elif message["type"] == "http.response.body" and start.get("status") == 200 and size <= MAX_BODY_BYTES:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                if not message.get("more_body", False) and size <= MAX_BODY_BYTES:
+                    headers = [(k, v) for k, v in start.get("headers", []) if k.lower() in KEPT_HEADERS]
+                    await _offload(store.put, key, (b"".join(chunks), headers))
+            await send(message)
+
+        await self.app(scope, receive, capture)
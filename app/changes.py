@@ -0,0 +1,223 @@
+"""
+Live change feed: row changes published through Postgres NOTIFY, fanned out over SSE.
+
+Every write path records what it changed with record() (or record_bulk() for imports) after
+flush and before commit. That inserts the changed rows into change_log, each with a `seq`, and
+pg_notify()s each event. Both are part of the writer's transaction, so a rolled-back write
+publishes nothing and listeners only hear about committed rows. Events carry the row as the
+list endpoints return it, so clients patch their tables without refetching. A row too big for a
+NOTIFY payload is sent without it, and the listener reads it back from change_log.
+
+Each worker holds one LISTEN connection (Hub), opened when the first /changes/stream client
+arrives. The hub pushes events into a bounded queue per client. A client that falls behind is
+disconnected; EventSource reconnects with Last-Event-ID and catches up from change_log, and
+one that is more than REPLAY_MAX events behind gets a `reset` (reload everything) instead.
+change_log keeps RETENTION_HOURS of history.
+
+A seq is taken when the event is inserted, but NOTIFY arrives in commit order, so seq 101 can
+be delivered before seq 100 commits. Resuming "after 101" would then skip 100 for good, so every
+replay starts RESUME_OVERLAP seqs earlier. Replayed events the client already has are harmless:
+they arrive in seq order, and for any one row seq order is commit order (the writers hold its
+row lock), so the last event applied for a row is still its newest.
+
+LISTEN needs a session-level connection. Behind PgBouncer in transaction mode, point
+CHANGES_DATABASE_URL at Postgres directly.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import asyncpg
+import orjson
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app import models, schemas
+from app.db import DATABASE_URL
+from app.fastjson import out_columns
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "crm_changes"
+CHANGES_DATABASE_URL = os.getenv("CHANGES_DATABASE_URL") or DATABASE_URL
+QUEUE_SIZE = int(os.getenv("CHANGES_QUEUE_SIZE", "1000"))  # events buffered per client before it is dropped
+REPLAY_MAX = int(os.getenv("CHANGES_REPLAY_MAX", "5000"))  # further behind than this: reset instead of replay
+RETENTION_HOURS = float(os.getenv("CHANGES_RETENTION_HOURS", "24"))
+# replays start this many seqs before the last one seen, for events that committed out of order
+RESUME_OVERLAP = int(os.getenv("CHANGES_RESUME_OVERLAP", "200"))
+RECONNECT_SECONDS = 2.0
+PRUNE_SECONDS = 600
+MAX_PAYLOAD = 7900  # NOTIFY payloads are limited to 8000 bytes
+
+# ---------- publishing ----------
+
+ENTITIES = {
+    "contacts": (models.Contact, schemas.ContactOut),
+    "properties": (models.Property, schemas.PropertyOut),
+    "transactions": (models.Transaction, schemas.TransactionOut),
+    "documents": (models.Document, schemas.DocumentOut),
+}
+# DocumentOut fields that aren't columns
+EXTRA_FIELDS = {"documents": ["'download_url', '/documents/' || t.id || '/download'"]}
+
+def _row_sql(entity: str) -> str:
+    model, schema = ENTITIES[entity]
+    pairs = [f"'{c.name}', t.{c.name}" for c in out_columns(model, schema)] + EXTRA_FIELDS.get(entity, [])
+    return f"jsonb_build_object({', '.join(pairs)})"
+
+_NOTIFY = f"""
+SELECT pg_notify('{CHANNEL}', CASE WHEN octet_length(e.full) <= {MAX_PAYLOAD} THEN e.full ELSE e.stub END)
+FROM (
+    SELECT jsonb_build_object('seq', seq, 'entity', entity, 'op', op, 'id', row_id, 'row', row)::text AS full,
+           jsonb_build_object('seq', seq, 'entity', entity, 'op', op, 'id', row_id)::text AS stub
+    FROM ins
+) e
+"""
+
+RECORD_SQL = {
+    entity: text(
+        f"WITH ins AS (INSERT INTO change_log (entity, op, row_id, row) "
+        f"SELECT '{entity}', CAST(:op AS text), t.id, {_row_sql(entity)} FROM {entity} t WHERE t.id = ANY(:ids) ORDER BY t.id "
+        f"RETURNING seq, entity, op, row_id, row) {_NOTIFY}"
+    )
+    for entity in ENTITIES
+}
+DELETE_SQL = text(
+    "WITH ins AS (INSERT INTO change_log (entity, op, row_id) "
+    "SELECT CAST(:entity AS text), 'delete', id FROM unnest(CAST(:ids AS int[])) AS id "
+    f"RETURNING seq, entity, op, row_id, row) {_NOTIFY}"
+)
+_BULK = (
+    "WITH ins AS (INSERT INTO change_log (entity, op, row) VALUES ({entity}, 'bulk', jsonb_build_object('rows', {rows})) "
+    f"RETURNING seq, entity, op, row_id, row) {_NOTIFY}"
+)
+BULK_SQL = text(_BULK.format(entity="CAST(:entity AS text)", rows="CAST(:rows AS int)"))
+BULK_SQL_RAW = _BULK.format(entity="$1::text", rows="$2::int")
+
+async def record(db, entity: str, op: str, ids: Sequence[int]) -> None:
+    """Publish insert/update/delete of `ids`; call after flush and before commit."""
+    ids = sorted(set(i for i in ids if i is not None))
+    if not ids:
+        return
+    if op == "delete":
+        await db.execute(DELETE_SQL, {"entity": entity, "ids": ids})
+    else:
+        await db.execute(RECORD_SQL[entity], {"op": op, "ids": ids})
+
+async def record_bulk(db, entity: str, rows: int) -> None:
+    """Many rows changed at once (imports, backfills): clients reload the table."""
+    await db.execute(BULK_SQL, {"entity": entity, "rows": rows})
+
+async def record_bulk_raw(conn, entity: str, rows: int) -> None:
+    """Same as record_bulk() on a raw asyncpg connection (the COPY importer's)."""
+    await conn.execute(BULK_SQL_RAW, entity, rows)
+
+# ---------- reading back ----------
+
+async def since(db, after: int, limit: int, entities: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """Events with seq > after, oldest first."""
+    where = "seq > :after" + (" AND entity = ANY(:entities)" if entities else "")
+    rows = await db.execute(
+        text(f"SELECT seq, entity, op, row_id AS id, row FROM change_log WHERE {where} ORDER BY seq LIMIT :n"),
+        {"after": after, "n": limit, "entities": sorted(entities or ())},
+    )
+    return [dict(r._mapping) for r in rows]
+
+async def bounds(db) -> Dict[str, int]:
+    row = (await db.execute(text("SELECT min(seq), max(seq) FROM change_log"))).one()
+    return {"first": row[0] or 0, "last": row[1] or 0}
+
+# ---------- fan-out ----------
+
+class Subscriber(asyncio.Queue):
+    def __init__(self):
+        super().__init__(QUEUE_SIZE)
+        self.dropped = False  # fell behind; the stream ends and the client resumes from change_log
+
+class Hub:
+    """One LISTEN connection per process, shared by every open stream."""
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.last_seq = 0
+        self.connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._inbox: "asyncio.Queue[str]" = asyncio.Queue()
+
+    def subscribe(self) -> Subscriber:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        sub = Subscriber()
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        self.last_seq = max(self.last_seq, event["seq"])
+        for sub in list(self.subscribers):
+            try:
+                sub.put_nowait(event)
+            except asyncio.QueueFull:
+                sub.dropped = True
+                self.unsubscribe(sub)
+
+    async def _run(self) -> None:
+        dsn = make_url(CHANGES_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                await conn.add_listener(CHANNEL, lambda _c, _pid, _ch, payload: self._inbox.put_nowait(payload))
+                self.connected.set()
+                await self._catch_up(conn)  # anything committed while no one was listening
+                await self._dispatch(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("change feed listener failed; reconnecting")
+            finally:
+                self.connected.clear()
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def _catch_up(self, conn) -> None:
+        if not self.last_seq:
+            self.last_seq = await conn.fetchval("SELECT coalesce(max(seq), 0) FROM change_log")
+            return
+        rows = await conn.fetch(  # streams drop the overlap they already have (routers/changes.py)
+            "SELECT seq, entity, op, row_id AS id, row FROM change_log WHERE seq > $1 ORDER BY seq LIMIT $2",
+            self.last_seq - RESUME_OVERLAP, REPLAY_MAX + RESUME_OVERLAP,
+        )
+        for r in rows:
+            self._publish({**dict(r), "row": orjson.loads(r["row"]) if r["row"] else None})
+
+    async def _dispatch(self, conn) -> None:
+        pruned = 0.0
+        loop = asyncio.get_running_loop()
+        while not conn.is_closed():
+            try:
+                payload = await asyncio.wait_for(self._inbox.get(), timeout=RECONNECT_SECONDS)
+            except asyncio.TimeoutError:
+                if loop.time() - pruned > PRUNE_SECONDS:
+                    await conn.execute("DELETE FROM change_log WHERE created_at < now() - make_interval(secs => $1)", RETENTION_HOURS * 3600)
+                    pruned = loop.time()
+                continue
+            event = orjson.loads(payload)
+            if "row" not in event:  # too big for NOTIFY
+                row = await conn.fetchval("SELECT row FROM change_log WHERE seq = $1", event["seq"])
+                event["row"] = orjson.loads(row) if row else None
+            self._publish(event)
+
+hub = Hub()
@@ -0,0 +1,301 @@
+"""
+Command line tools: python -m app.cli <command> [options]
+
+  migrate-blobs   move legacy attrs["data_b64"] document payloads into the blob store and
+                  fill the documents.size/sha256 columns
+  import          bulk-load a CSV/NDJSON file into contacts, properties or transactions
+  export          stream a table (optionally filtered) to a CSV/NDJSON/Arrow file, gzipped by extension
+  promote-attr    add an indexed generated numeric column for a hot attrs key
+  migrate         apply pending schema migrations (app/migrations.py)
+  rebuild-analytics  recompute the pipeline rollup tables from transactions
+  dedupe          find likely duplicate contacts among those added since the last run (app/dedupe.py)
+  geocode         load geocoder output into geocode_cache and give properties their cached coordinates
+  gc-blobs        delete stored files no document has used for the grace period (app/blobs.py)
+  worker          run background jobs (document processing, dedupe; app/jobs.py) until interrupted
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+
+from sqlalchemy import select, text
+
+from app.cache import bump
+from app.db import SessionLocal
+from app import models
+from app.storage import CHUNK_SIZE
+
+# ---------- migrate-blobs ----------
+
+async def _b64_chunks(data_b64: str):
+    # decode in 4-char aligned slices so the raw bytes never exist in memory all at once
+    step = (CHUNK_SIZE // 3) * 4
+    for i in range(0, len(data_b64), step):
+        yield base64.b64decode(data_b64[i:i + step])
+
+async def migrate_blobs(batch_size: int) -> None:
+    from app import blobs
+    moved = 0
+    last_id = 0
+    while True:
+        async with SessionLocal() as db:
+            ids = (await db.execute(
+                select(models.Document.id)
+                .where(models.Document.id > last_id, models.Document.attrs.has_key("data_b64"))
+                .order_by(models.Document.id)
+                .limit(batch_size)
+            )).scalars().all()
+            if not ids:
+                break
+            for doc_id in ids:
+                # pull one payload at a time instead of whole attrs rows
+                data_b64 = (await db.execute(
+                    text("SELECT attrs->>'data_b64' FROM documents WHERE id = :id"), {"id": doc_id}
+                )).scalar_one()
+                blob = await blobs.store_stream(_b64_chunks(data_b64))
+                await blobs.reference(db, blob.key)
+                await db.execute(
+                    text("UPDATE documents SET attrs = attrs - 'data_b64' - 'size', sha256 = :key, size = :size WHERE id = :id"),
+                    {"key": blob.key, "size": blob.size, "id": doc_id},
+                )
+            await db.commit()
+            await bump("documents")
+            moved += len(ids)
+            last_id = ids[-1]
+            print(f"migrate-blobs: moved {moved} documents (last id {last_id})")
+    # rows uploaded before size/sha256 became columns kept them in attrs
+    async with SessionLocal() as db:
+        res = await db.execute(text(
+            "UPDATE documents SET sha256 = attrs->>'sha256', size = (attrs->>'size')::bigint, attrs = attrs - 'sha256' - 'size' "
+            "WHERE sha256 IS NULL AND attrs ? 'sha256'"
+        ))
+        await db.commit()
+        if res.rowcount:  # those blobs were stored before refcounts existed
+            await blobs.recount(db)
+    await bump("documents")
+    print(f"migrate-blobs: done, {moved} documents moved, {res.rowcount} metadata rows backfilled")
+
+# ---------- import ----------
+
+async def import_path(entity: str, path: str, fmt: str, batch_size: int, rename: dict) -> None:
+    from app.importer import import_file
+    with open(path, "rb") as f:
+        async for event in import_file(f, entity, fmt, batch_size=batch_size, rename=rename):
+            print(json.dumps(event, default=str), flush=True)
+
+# ---------- export ----------
+
+async def export_path(entity: str, path: str, fmt: str, where, flatten: bool, attrs: list, compress: bool) -> None:
+    import sys
+    from app.export import Export
+    async with SessionLocal() as db:
+        export = await Export(entity, fmt, where, flatten=flatten, attrs=attrs, compress=compress).prepare(db)
+    out = sys.stdout.buffer if path == "-" else open(path, "wb")
+    written = 0
+    try:
+        async for chunk in export.chunks():
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"export: {entity} -> {path} ({written} bytes)", file=sys.stderr)
+
+# ---------- promote-attr ----------
+
+async def promote_attr(table: str, key: str) -> None:
+    from app.attrs import promote
+    async with SessionLocal() as db:
+        name = await promote(db, table, key)
+    print(f"promote-attr: {table}.attrs[{key!r}] -> {table}.{name} (indexed)")
+
+# ---------- migrate ----------
+
+async def run_migrations(status_only: bool) -> None:
+    from app.db import engine
+    from app.migrations import HEAD, applied_version, migrate
+    async with engine.begin() as conn:
+        if status_only:
+            print(f"migrate: database at version {await conn.run_sync(applied_version)}, code at {HEAD}")
+            return
+        version = await conn.run_sync(migrate)
+    print(f"migrate: database at version {version}")
+
+# ---------- rebuild-analytics ----------
+
+async def rebuild_analytics() -> None:
+    from app import analytics
+    async with SessionLocal() as db:
+        await analytics.rebuild(db)
+    print("rebuild-analytics: pipeline_rollup and pipeline_history rebuilt")
+
+# ---------- dedupe ----------
+
+async def run_dedupe(batch_size: int, watch: float) -> None:
+    from app import dedupe
+    while True:
+        async with SessionLocal() as db:
+            res = await dedupe.run_batch(db, batch_size)
+        if res["contacts"]:
+            print(f"dedupe: {res['contacts']} contacts keyed, {res['candidates']} candidate pairs (last id {res['last_contact_id']})")
+            continue
+        if res.get("busy"):
+            print("dedupe: another run holds the lock")
+        if not watch:
+            break
+        await asyncio.sleep(watch)
+
+# ---------- geocode ----------
+
+async def run_geocode(path: str, fmt: str, source: str, batch_size: int) -> None:
+    from app import geo
+    from app.importer import iter_records, normalize_key
+    if path:
+        loaded = bad = 0
+        with open(path, "rb") as f:
+            batch = []
+            for n, rec in iter_records(f, fmt):
+                if isinstance(rec, Exception):
+                    bad += 1
+                    continue
+                rec = {normalize_key(k): v for k, v in rec.items()}
+                try:
+                    lat, lon = float(rec.get("lat") or rec.get("latitude")), float(rec.get("lon") or rec.get("lng") or rec.get("longitude"))
+                except (TypeError, ValueError):
+                    bad += 1
+                    continue
+                batch.append((geo.address_key(rec.get("address"), rec.get("city"), rec.get("state_province") or rec.get("state"), rec.get("country")), lat, lon))
+                if len(batch) >= batch_size:
+                    async with SessionLocal() as db:
+                        loaded += await geo.load_cache(db, batch, source)
+                        await db.commit()
+                    batch = []
+            if batch:
+                async with SessionLocal() as db:
+                    loaded += await geo.load_cache(db, batch, source)
+                    await db.commit()
+        print(f"geocode: {loaded} cache entries loaded, {bad} rows skipped")
+    scanned = filled = 0
+    last_id = 0
+    while True:
+        async with SessionLocal() as db:
+            n, hits, last = await geo.fill_from_cache(db, last_id, batch_size)
+        if last is None:
+            break
+        scanned, filled, last_id = scanned + n, filled + hits, last
+        if hits:
+            await bump("properties")
+    print(f"geocode: {filled} of {scanned} properties without coordinates filled from the cache")
+
+# ---------- gc-blobs ----------
+
+async def gc_blobs(grace_hours: float, recount: bool) -> None:
+    from app import blobs
+    if recount:
+        async with SessionLocal() as db:
+            await blobs.recount(db)
+        print("gc-blobs: reference counts rebuilt from documents")
+    res = await blobs.collect(grace_hours)
+    print(f"gc-blobs: {res['deleted']} blobs deleted, {res['waiting']} unreferenced ones still within the grace period")
+
+# ---------- worker ----------
+
+async def run_worker(kinds: list, concurrency: int) -> None:
+    import logging
+    import signal
+    from app import jobs
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = jobs.Worker(kinds or None, concurrency).start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    print("worker: stopping; waiting for running jobs", flush=True)
+    await worker.stop()
+
+# ---------- entry point ----------
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate-blobs", help="move legacy attrs.data_b64 payloads into the blob store")
+    p.add_argument("--batch-size", type=int, default=100)
+
+    p = sub.add_parser("import", help="bulk-load a CSV or NDJSON file via COPY")
+    p.add_argument("entity", choices=["contacts", "properties", "transactions"])
+    p.add_argument("path")
+    p.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.add_argument("--map", action="append", default=[], metavar="SOURCE:FIELD", help="rename a source column")
+
+    p = sub.add_parser("export", help="stream a table to a CSV, NDJSON or Arrow file")
+    p.add_argument("entity", choices=["contacts", "properties", "transactions", "documents"])
+    p.add_argument("path", help="output file; '-' for stdout; a .gz suffix gzips it")
+    p.add_argument("--format", choices=["csv", "ndjson", "arrow"], help="default: from the file extension")
+    p.add_argument("--where", help="JSON filter in the /search/query language")
+    p.add_argument("--flatten", action="store_true", help="attrs keys as their own attrs.<key> columns")
+    p.add_argument("--attr", action="append", default=[], metavar="KEY", help="only these attrs keys (implies --flatten)")
+
+    p = sub.add_parser("promote-attr", help="promote attrs[key] to an indexed generated numeric column")
+    p.add_argument("table", choices=["contacts", "properties", "transactions", "documents"])
+    p.add_argument("key")
+
+    p = sub.add_parser("migrate", help="apply pending schema migrations")
+    p.add_argument("--status", action="store_true", help="only print the applied and latest versions")
+
+    sub.add_parser("rebuild-analytics", help="recompute pipeline rollups from the transactions table")
+
+    p = sub.add_parser("dedupe", help="key and score new contacts for duplicate detection")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.add_argument("--watch", type=float, default=0, metavar="SECONDS", help="keep polling for new contacts")
+
+    p = sub.add_parser("geocode", help="fill property coordinates from geocode_cache (optionally loading it first)")
+    p.add_argument("--load", metavar="PATH", help="CSV/NDJSON of address, city, state_province, country, lat, lon")
+    p.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    p.add_argument("--source", help="recorded with each loaded entry, e.g. the geocoder's name")
+    p.add_argument("--batch-size", type=int, default=5000)
+
+    p = sub.add_parser("gc-blobs", help="delete blobs that no document has referenced for the grace period")
+    p.add_argument("--grace-hours", type=float, default=None, help="default: BLOB_GC_GRACE_HOURS (24)")
+    p.add_argument("--recount", action="store_true", help="rebuild reference counts from documents first")
+
+    p = sub.add_parser("worker", help="run queued background jobs")
+    p.add_argument("--kind", action="append", default=[], help="only jobs of this kind (repeatable); default: all")
+    p.add_argument("--concurrency", type=int, default=None, help="jobs run at once (default: JOB_CONCURRENCY)")
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate-blobs":
+        asyncio.run(migrate_blobs(args.batch_size))
+    elif args.command == "import":
+        fmt = args.format or ("csv" if os.path.splitext(args.path)[1].lower() == ".csv" else "ndjson")
+        rename = dict(pair.split(":", 1) for pair in args.map)
+        asyncio.run(import_path(args.entity, args.path, fmt, args.batch_size, rename))
+    elif args.command == "export":
+        compress = args.path.endswith(".gz")
+        ext = os.path.splitext(args.path[:-3] if compress else args.path)[1].lower().lstrip(".")
+        fmt = args.format or {"csv": "csv", "arrow": "arrow", "arrows": "arrow"}.get(ext, "ndjson")
+        asyncio.run(export_path(args.entity, args.path, fmt, json.loads(args.where) if args.where else None,
+                                args.flatten, args.attr, compress))
+    elif args.command == "promote-attr":
+        asyncio.run(promote_attr(args.table, args.key))
+    elif args.command == "migrate":
+        asyncio.run(run_migrations(args.status))
+    elif args.command == "rebuild-analytics":
+        asyncio.run(rebuild_analytics())
+    elif args.command == "dedupe":
+        asyncio.run(run_dedupe(args.batch_size, args.watch))
+    elif args.command == "geocode":
+        fmt = args.format or ("csv" if args.load and os.path.splitext(args.load)[1].lower() == ".csv" else "ndjson")
+        asyncio.run(run_geocode(args.load, fmt, args.source, args.batch_size))
+    elif args.command == "gc-blobs":
+        from app.blobs import GRACE_HOURS
+        asyncio.run(gc_blobs(GRACE_HOURS if args.grace_hours is None else args.grace_hours, args.recount))
+    elif args.command == "worker":
+        from app.jobs import JOB_CONCURRENCY
+        asyncio.run(run_worker(args.kind, args.concurrency or JOB_CONCURRENCY))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Duplicate-contact detection and merging.
+
+Comparing every pair of contacts is quadratic, so contacts are blocked first: each one gets
+a few keys in contact_keys (normalized email, E.164 phone, phonetic name; see
+app.identity.block_keys) and only contacts sharing a key are scored. Keys shared by more than
+MAX_BLOCK contacts (an office switchboard number, a shared inbox) are skipped as evidence.
+
+The job is incremental: run_batch() picks up contacts with an id past the watermark in
+dedupe_state, writes their keys, scores them against everything already keyed and upserts
+pairs above MIN_SCORE into dedupe_candidates. Creating contacts queues a `dedupe` background job
+(app/tasks.py) that runs it until caught up; so does `python -m app.cli dedupe` (or keeps polling
+with --watch). The watermark only sees new contacts, so the paths that change an existing
+contact's email or phone (merge(), an /ingest attach) call rekey() on it themselves.
+"""
+import json
+import os
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import or_, select, text
+
+from app import changes, identity, models, schemas
+from app.fastjson import out_columns
+
+MAX_BLOCK = int(os.getenv("DEDUPE_MAX_BLOCK", "100"))
+MIN_SCORE = float(os.getenv("DEDUPE_MIN_SCORE", "0.4"))  # a shared phone alone (e.g. an "Unknown Contact" from /ingest) qualifies
+LOCK_ID = 7_263_016  # one dedupe job at a time
+
+# ---------- scoring ----------
+
+def name_similarity(a, b) -> float:
+    if identity.is_placeholder(a.first_name, a.last_name) or identity.is_placeholder(b.first_name, b.last_name):
+        return 0.0
+    left = identity.fold(a.first_name) + " " + identity.fold(a.last_name)
+    right = identity.fold(b.first_name) + " " + identity.fold(b.last_name)
+    swapped = identity.fold(b.last_name) + " " + identity.fold(b.first_name)
+    return max(SequenceMatcher(None, left, right).ratio(), SequenceMatcher(None, left, swapped).ratio())
+
+def score(a, b) -> Tuple[float, Dict[str, Any]]:
+    """0..1 likelihood that contacts a and b are the same person, with the evidence used."""
+    reasons: Dict[str, Any] = {}
+    total = 0.0
+    ea, eb = identity.normalize_email(a.email), identity.normalize_email(b.email)
+    if ea and eb:
+        if ea == eb:
+            total += 0.6
+            reasons["email"] = ea
+        else:
+            total -= 0.2  # two different addresses is weak evidence against
+    pa, pb = identity.normalize_phone(a.phone), identity.normalize_phone(b.phone)
+    if pa and pb and pa == pb:
+        total += 0.4
+        reasons["phone"] = pa
+    sim = name_similarity(a, b)
+    if sim >= 0.75:
+        total += 0.5 * sim
+        reasons["name"] = round(sim, 3)
+    return round(max(0.0, min(total, 1.0)), 3), reasons
+
+# ---------- incremental job ----------
+
+CONTACT_FIELDS = "id, first_name, last_name, email, phone"
+
+PAIRS_SQL = text(f"""
+WITH mine AS (
+    SELECT contact_id, kind, key FROM contact_keys WHERE contact_id = ANY(:ids)
+), usable AS (
+    SELECT DISTINCT m.kind, m.key FROM mine m
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS n FROM (
+            SELECT 1 FROM contact_keys k WHERE k.kind = m.kind AND k.key = m.key LIMIT {MAX_BLOCK + 1}
+        ) capped
+    ) c
+    WHERE c.n BETWEEN 2 AND {MAX_BLOCK}
+)
+SELECT DISTINCT least(m.contact_id, k.contact_id) AS a_id, greatest(m.contact_id, k.contact_id) AS b_id
+FROM mine m
+JOIN usable u ON u.kind = m.kind AND u.key = m.key
+JOIN contact_keys k ON k.kind = m.kind AND k.key = m.key AND k.contact_id <> m.contact_id
+""")
+
+UPSERT_CANDIDATES_SQL = text(
+    "INSERT INTO dedupe_candidates (a_id, b_id, score, reasons) "
+    "SELECT * FROM unnest(CAST(:a AS int[]), CAST(:b AS int[]), CAST(:s AS float8[]), CAST(:r AS jsonb[])) "
+    "ON CONFLICT (a_id, b_id) DO UPDATE SET score = EXCLUDED.score, reasons = EXCLUDED.reasons "
+    "WHERE dedupe_candidates.status = 'open'"
+)
+
+async def write_keys(db, contacts: Sequence[Any]) -> None:
+    rows = [(c.id, kind, key) for c in contacts
+            for kind, key in identity.block_keys(c.first_name, c.last_name, c.email, c.phone)]
+    if rows:
+        ids, kinds, keys = map(list, zip(*rows))
+        await db.execute(text(
+            "INSERT INTO contact_keys (contact_id, kind, key) "
+            "SELECT * FROM unnest(CAST(:ids AS int[]), CAST(:kinds AS text[]), CAST(:keys AS text[])) ON CONFLICT DO NOTHING"
+        ), {"ids": ids, "kinds": kinds, "keys": keys})
+
+async def find_candidates(db, ids: List[int]) -> int:
+    """Score every keyed contact sharing a usable block with `ids`; returns pairs written."""
+    pairs = (await db.execute(PAIRS_SQL, {"ids": ids})).all()
+    if not pairs:
+        return 0
+    involved = list({i for p in pairs for i in p})
+    people = {r.id: r for r in await db.execute(
+        text(f"SELECT {CONTACT_FIELDS} FROM contacts WHERE id = ANY(:ids)"), {"ids": involved}
+    )}
+    a, b, s, r = [], [], [], []
+    for a_id, b_id in pairs:
+        if a_id not in people or b_id not in people:
+            continue
+        value, reasons = score(people[a_id], people[b_id])
+        if value >= MIN_SCORE:
+            a.append(a_id)
+            b.append(b_id)
+            s.append(value)
+            r.append(json.dumps(reasons))
+    if a:
+        await db.execute(UPSERT_CANDIDATES_SQL, {"a": a, "b": b, "s": s, "r": r})
+    return len(a)
+
+async def run_batch(db, batch_size: int = 1000) -> Dict[str, int]:
+    """Key and score the next batch of new contacts, in one transaction; {"contacts": 0} when caught up."""
+    if not (await db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": LOCK_ID})).scalar():
+        await db.rollback()
+        return {"contacts": 0, "candidates": 0, "busy": 1}
+    await db.execute(text("INSERT INTO dedupe_state (id, last_contact_id) VALUES (1, 0) ON CONFLICT DO NOTHING"))
+    last = (await db.execute(text("SELECT last_contact_id FROM dedupe_state WHERE id = 1"))).scalar()
+    contacts = (await db.execute(
+        text(f"SELECT {CONTACT_FIELDS} FROM contacts WHERE id > :last ORDER BY id LIMIT :n"), {"last": last, "n": batch_size}
+    )).all()
+    if not contacts:
+        await db.rollback()
+        return {"contacts": 0, "candidates": 0}
+    await write_keys(db, contacts)
+    found = await find_candidates(db, [c.id for c in contacts])
+    await db.execute(text("UPDATE dedupe_state SET last_contact_id = :id, updated_at = now() WHERE id = 1"), {"id": contacts[-1].id})
+    await db.commit()
+    return {"contacts": len(contacts), "candidates": found, "last_contact_id": contacts[-1].id}
+
+async def rekey(db, contact_id: int) -> int:
+    """Replace a contact's keys after its identity fields changed and score it again; returns pairs written."""
+    await db.execute(text("DELETE FROM contact_keys WHERE contact_id = :id"), {"id": contact_id})
+    contact = (await db.execute(text(f"SELECT {CONTACT_FIELDS} FROM contacts WHERE id = :id"), {"id": contact_id})).one()
+    await write_keys(db, [contact])
+    return await find_candidates(db, [contact_id])
+
+# ---------- merge ----------
+
+async def merge(db, keep_id: int, merge_ids: List[int]) -> Dict[str, Any]:
+    """
+    Fold `merge_ids` into `keep_id` in one transaction: transactions, documents and open upload
+    sessions are repointed, blank email/phone on the survivor are filled from the merged contacts,
+    attrs are combined (the survivor's keys win) and the merged rows are deleted along with their
+    keys and candidates.
+    """
+    merge_ids = sorted(set(merge_ids) - {keep_id})
+    if not merge_ids:
+        raise HTTPException(status_code=400, detail="merge_ids must name at least one other contact")
+    rows = (await db.execute(
+        text(f"SELECT {CONTACT_FIELDS}, attrs FROM contacts WHERE id = ANY(:ids) ORDER BY id FOR UPDATE"),
+        {"ids": [keep_id, *merge_ids]},
+    )).all()
+    by_id = {r.id: r for r in rows}
+    missing = [i for i in [keep_id, *merge_ids] if i not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"contacts not found: {missing}")
+
+    keep = by_id[keep_id]
+    email, phone, attrs = keep.email, keep.phone, {}
+    for i in merge_ids:
+        email = email or by_id[i].email
+        phone = phone or by_id[i].phone
+        attrs.update(by_id[i].attrs or {})
+    attrs.update(keep.attrs or {})
+
+    params = {"keep": keep_id, "ids": merge_ids}
+    moved_tx = (await db.execute(text("UPDATE transactions SET contact_id = :keep WHERE contact_id = ANY(:ids) RETURNING id"), params)).scalars().all()
+    moved_docs = (await db.execute(text("UPDATE documents SET contact_id = :keep WHERE contact_id = ANY(:ids) RETURNING id"), params)).scalars().all()
+    # resumable uploads still in progress create their document for the survivor
+    await db.execute(text("UPDATE upload_sessions SET contact_id = :keep WHERE contact_id = ANY(:ids)"), params)
+    await db.execute(text("DELETE FROM contacts WHERE id = ANY(:ids)"), params)  # keys and candidates cascade
+    await db.execute(
+        text("UPDATE contacts SET email = :email, phone = :phone, email_norm = :email_norm, phone_e164 = :phone_e164, "
+             "attrs = CAST(:attrs AS jsonb) WHERE id = :keep"),
+        {"keep": keep_id, "email": email, "phone": phone, "email_norm": identity.normalize_email(email),
+         "phone_e164": identity.normalize_phone(phone), "attrs": json.dumps(attrs)},
+    )
+    # the survivor may have gained an email/phone: re-key it and look for new partners
+    await rekey(db, keep_id)
+    await changes.record(db, "contacts", "update", [keep_id])
+    await changes.record(db, "contacts", "delete", merge_ids)
+    await changes.record(db, "transactions", "update", moved_tx)
+    await changes.record(db, "documents", "update", moved_docs)
+    await db.commit()
+    return {"id": keep_id, "merged": merge_ids, "transactions": len(moved_tx), "documents": len(moved_docs)}
+
+# ---------- lookup ----------
+
+async def lookup(db, email: Optional[str], phone: Optional[str], limit: int = 20) -> Dict[str, Any]:
+    """
+    Existing contacts with this email or phone, after normalization: one query probing the
+    email_norm / phone_e164 indexes. Each match lists which of the two it matched on.
+    """
+    e, p = identity.normalize_email(email), identity.normalize_phone(phone)
+    C = models.Contact
+    conds = ([C.email_norm == e] if e else []) + ([C.phone_e164 == p] if p else [])
+    matches = []
+    if conds:
+        stmt = select(*out_columns(C, schemas.ContactOut), C.email_norm, C.phone_e164).where(or_(*conds)).order_by(C.id).limit(limit)
+        for r in await db.execute(stmt):
+            item = {k: v for k, v in r._mapping.items() if k not in ("email_norm", "phone_e164")}
+            item["matched"] = [k for k, hit in (("email", e and r.email_norm == e), ("phone", p and r.phone_e164 == p)) if hit]
+            matches.append(item)
+        matches.sort(key=lambda m: -len(m["matched"]))  # matched on both first
+    return {"email": e, "phone": p, "matches": matches}
@@ -0,0 +1,75 @@
+"""
+?expand= for the list endpoints: related rows inlined into each item.
+
+Each requested relationship costs exactly one extra query, selectinload-style but on plain
+columns: `SELECT <schema columns> FROM related WHERE <key> = ANY(:keys)` with every key on the
+page in a single array parameter (selectinload itself splits IN lists into chunks of 500).
+/transactions/?expand=contact,property,documents is 4 queries whether the page has 1 row or
+1000. Only the nested schema's columns are fetched, so documents never read attrs.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, inspect, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app import models, schemas
+from app.fastjson import out_columns
+
+# relationship name -> schema of the related rows, per list endpoint model
+EXPANSIONS: Dict[Any, Dict[str, Any]] = {
+    models.Contact: {"transactions": schemas.TransactionOut, "documents": schemas.DocumentOut},
+    models.Property: {"transactions": schemas.TransactionOut, "documents": schemas.DocumentOut},
+    models.Transaction: {"contact": schemas.ContactOut, "property": schemas.PropertyOut, "documents": schemas.DocumentOut},
+}
+
+def parse_expand(model, expand: Optional[str]) -> List[str]:
+    """`contact,property` -> validated relationship names (400 on unknown ones)."""
+    if not expand:
+        return []
+    allowed = EXPANSIONS[model]
+    names = list(dict.fromkeys(n.strip() for n in expand.split(",") if n.strip()))
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"cannot expand {unknown}; choose from {sorted(allowed)}")
+    return names
+
+def _plain(obj, schema) -> dict:
+    return {f: getattr(obj, f) for f in schema.model_fields}
+
+async def _load(db, model, name: str, rows: Sequence[Any]) -> Dict[Any, Any]:
+    """Page key -> related dict (many-to-one) or list of dicts (one-to-many), in one query."""
+    rel = inspect(model).relationships[name]
+    local, remote = rel.local_remote_pairs[0]
+    schema = EXPANSIONS[model][name]
+    keys = list({getattr(r, local.key) for r in rows} - {None})
+    if not keys:
+        return {}
+    target = rel.mapper.class_
+    cols = out_columns(target, schema)
+    stmt = select(remote.label("_key"), *cols).where(remote == bindparam("keys", type_=ARRAY(remote.type)).any_())
+    if rel.uselist:
+        stmt = stmt.order_by(target.id)
+    found: Dict[Any, Any] = defaultdict(list) if rel.uselist else {}
+    for r in await db.execute(stmt, {"keys": keys}):
+        item = {c.name: getattr(r, c.name) for c in cols}
+        if schema is schemas.DocumentOut:
+            item["download_url"] = f"/documents/{item['id']}/download"
+        if rel.uselist:
+            found[r._key].append(item)
+        else:
+            found[r._key] = item
+    return found
+
+async def expanded_items(db, model, schema, rows: Sequence[Any], names: Sequence[str]) -> List[dict]:
+    """Page rows as dicts of `schema`'s fields plus each expanded relationship."""
+    out = [_plain(r, schema) for r in rows]
+    for name in names:
+        rel = inspect(model).relationships[name]
+        local = rel.local_remote_pairs[0][0]
+        found = await _load(db, model, name, rows)
+        for item, row in zip(out, rows):
+            key = getattr(row, local.key)
+            item[name] = found.get(key, []) if rel.uselist else found.get(key)
+    return out
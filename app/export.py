@@ -0,0 +1,240 @@
+"""
+Bulk export: every matching row of one table as CSV, NDJSON or Arrow, in constant memory.
+
+Rows come from a server-side cursor (asyncpg, STREAM_BATCH rows per round trip) and each batch
+is encoded and handed on before the next one is fetched, so neither the API process nor the
+client ever holds the table. Filters use the /search/query language (app/query_dsl.py).
+
+With `flatten`, attrs keys become their own `attrs.<key>` columns. CSV and Arrow need the full
+column list before the first row, so the keys (and their JSON types, which pick the Arrow
+types) come from one extra aggregate pass over the filtered rows, unless they are named up
+front. `compress` gzips the output on the fly.
+
+Arrow output is the IPC stream format (one record batch per cursor batch) and needs pyarrow,
+which is only imported when that format is requested.
+"""
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import orjson
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Float, Integer, Numeric, String, func, select, true
+
+from app.db import SessionLocal
+from app.fastjson import STREAM_BATCH, dumps
+from app.query_dsl import TABLES, plan
+
+FORMATS = ("csv", "ndjson", "arrow")
+PLAIN_CSV_TYPES = (String, Integer, BigInteger, Float, Numeric)
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", "arrow": "application/vnd.apache.arrow.stream"}
+EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "arrow": "arrows"}
+MAX_ATTR_COLUMNS = 500  # a flattened export with more distinct keys than this is almost surely a mistake
+
+class ExportError(ValueError):
+    pass
+
+# ---------- encoding ----------
+
+def _text(value: Any) -> Any:
+    """A CSV cell: JSON for nested values, ISO 8601 for timestamps, '' for NULL."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _csv_chunk(rows: List[List[Any]], convert: Sequence[int], header: Optional[List[str]] = None) -> bytes:
+    for row in rows:
+        for i in convert:
+            row[i] = _text(row[i])
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")  # writes None as ''
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buf.getvalue().encode()
+
+def _arrow_type(pa, col) -> Any:
+    t = col.type
+    if isinstance(t, (Integer, BigInteger)):
+        return pa.int64()
+    if isinstance(t, (Float, Numeric)):
+        return pa.float64()
+    if isinstance(t, Boolean):
+        return pa.bool_()
+    if isinstance(t, DateTime):
+        return pa.timestamp("us", tz="UTC") if t.timezone else pa.timestamp("us")
+    if isinstance(t, Date):
+        return pa.date32()
+    return pa.string()  # text, and JSON columns as JSON text
+
+def _arrow_attr_type(pa, json_types: Sequence[str]) -> Any:
+    kinds = set(json_types) - {"null"}
+    if kinds == {"number"}:
+        return pa.float64()
+    if kinds == {"boolean"}:
+        return pa.bool_()
+    return pa.string()
+
+def _arrow_value(value: Any, as_text: bool) -> Any:
+    if value is None or isinstance(value, str):
+        return value
+    if as_text:  # JSON columns, and attrs keys that aren't always numbers or booleans
+        return orjson.dumps(value, default=float).decode()
+    return float(value)  # Decimal, and JSON ints, into float64
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise ExportError("format=arrow requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+class _Sink(io.RawIOBase):
+    """Write target for pyarrow's stream writer; take() drains what it wrote so far."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+# ---------- export ----------
+
+class Export:
+    """One export request; prepare() validates it and settles the columns before any row is sent."""
+
+    def __init__(self, entity: str, fmt: str, where: Any = None, flatten: bool = False,
+                 attrs: Optional[List[str]] = None, compress: bool = False, limit: Optional[int] = None):
+        if entity not in TABLES:
+            raise ExportError(f"entity must be one of {sorted(TABLES)}")
+        if fmt not in FORMATS:
+            raise ExportError(f"format must be one of {FORMATS}")
+        self.entity, self.fmt, self.where = entity, fmt, where
+        self.flatten = flatten or bool(attrs)
+        self.attr_keys: Optional[List[str]] = list(dict.fromkeys(attrs)) if attrs else None
+        self.attr_types: Dict[str, List[str]] = {}
+        self.compress, self.limit = compress, limit
+        self.pa = _require_pyarrow() if fmt == "arrow" else None
+
+    @property
+    def media_type(self) -> str:
+        return "application/gzip" if self.compress else MEDIA_TYPES[self.fmt]
+
+    @property
+    def filename(self) -> str:
+        return f"{self.entity}.{EXTENSIONS[self.fmt]}" + (".gz" if self.compress else "")
+
+    async def prepare(self, db) -> "Export":
+        # QueryError (a ValueError) propagates for a bad filter
+        self.filtered, self.params = plan(self.entity, self.where)
+        stmt = self.filtered
+        table = TABLES[self.entity]
+        self.stmt = stmt.order_by(table.c.id).limit(self.limit)
+        selected = list(self.stmt.selected_columns)
+        self._keep = [i for i, c in enumerate(selected) if not (self.flatten and c.name == "attrs")]
+        self._attrs_at = next((i for i, c in enumerate(selected) if c.name == "attrs"), None)
+        self.columns = [selected[i] for i in self._keep]
+        if self.flatten and self._attrs_at is None:
+            raise ExportError(f"{self.entity} has no exported attrs to flatten")
+        if self.flatten and (self.attr_keys is None or self.fmt == "arrow"):
+            await self._discover_attrs(db)
+        self.header = [c.name for c in self.columns] + [f"attrs.{k}" for k in (self.attr_keys or [])]
+        return self
+
+    async def _discover_attrs(self, db) -> None:
+        """Distinct attrs keys of the rows being exported, with the JSON types seen for each."""
+        rows = (self.stmt if self.limit else self.filtered).subquery()  # no need to sort all rows
+        each = func.jsonb_each(rows.c.attrs).table_valued("key", "value").lateral()
+        keys = (
+            select(each.c.key, func.array_agg(func.jsonb_typeof(each.c.value).distinct()))
+            .select_from(rows.join(each, true()))
+            .group_by(each.c.key)
+            .order_by(each.c.key)
+        )
+        if self.attr_keys is not None:
+            keys = keys.where(each.c.key.in_(self.attr_keys))
+        found = {k: types for k, types in (await db.execute(keys, self.params)).all()}
+        if self.attr_keys is None:
+            if len(found) > MAX_ATTR_COLUMNS:
+                raise ExportError(f"{len(found)} distinct attrs keys; name the ones to export with attrs=")
+            self.attr_keys = list(found)
+        self.attr_types = found
+
+    def _row_values(self, row) -> List[Any]:
+        values = [row[i] for i in self._keep]
+        if self.flatten:
+            attrs = row[self._attrs_at] or {}
+            values += [attrs.get(k) for k in self.attr_keys]
+        return values
+
+    async def _batches(self) -> AsyncIterator[List[Any]]:
+        # own session: request dependencies are closed before a streamed body is sent, and
+        # asyncpg cursors only exist inside a transaction
+        async with SessionLocal() as db:
+            result = await db.stream(self.stmt.execution_options(yield_per=STREAM_BATCH), self.params)
+            async for rows in result.partitions():
+                yield [self._row_values(r) for r in rows]
+
+    async def _encoded(self) -> AsyncIterator[bytes]:
+        if self.fmt == "csv":
+            # only cells that aren't already text or numbers need converting
+            convert = [i for i, c in enumerate(self.columns) if not isinstance(c.type, PLAIN_CSV_TYPES)]
+            convert += range(len(self.columns), len(self.header))
+            header = self.header
+            async for rows in self._batches():
+                yield _csv_chunk(rows, convert, header)
+                header = None
+            if header:  # no rows: still a header
+                yield _csv_chunk([], convert, header)
+        elif self.fmt == "ndjson":
+            header = self.header
+            async for rows in self._batches():
+                yield b"".join(dumps(dict(zip(header, r))) + b"\n" for r in rows)
+        else:
+            pa = self.pa
+            schema = pa.schema(
+                [pa.field(c.name, _arrow_type(pa, c)) for c in self.columns]
+                + [pa.field(f"attrs.{k}", _arrow_attr_type(pa, self.attr_types.get(k, []))) for k in self.attr_keys or []]
+            )
+            sink = _Sink()
+            writer = pa.ipc.new_stream(sink, schema)
+            yield sink.take()
+            # JSON values and Decimals need converting; text, ints and timestamps go in as they are
+            as_text = [pa.types.is_string(f.type) for f in schema]
+            convert = [t or f.type == pa.float64() for f, t in zip(schema, as_text)]
+            async for rows in self._batches():
+                arrays = []
+                for field, column, text_, conv in zip(schema, zip(*rows), as_text, convert):
+                    arrays.append(pa.array([_arrow_value(v, text_) for v in column] if conv else column, type=field.type))
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                yield sink.take()
+            writer.close()
+            yield sink.take()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        if not self.compress:
+            async for chunk in self._encoded():
+                yield chunk
+            return
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip framing
+        async for chunk in self._encoded():
+            out = gz.compress(chunk)
+            if out:
+                yield out
+        yield gz.flush()
@@ -0,0 +1,218 @@
+"""
+Geospatial property search on stock Postgres (no PostGIS).
+
+Every property with coordinates gets a geohash (PRECISION characters, about a metre) in a
+`COLLATE "C"` column with a plain b-tree index. A geohash cell is a prefix, and all points in a
+cell sort contiguously, so "points in this cell" is one index range scan:
+`geohash >= 'dpz8' AND geohash < 'dpz9'`.
+
+A search area is covered by at most MAX_CELLS cells of the finest precision that fits
+(cover()); adjacent cells that are consecutive in geohash order are merged into one range.
+The ranges find a small superset, and exact lat/lon bounds or the haversine distance trim it.
+Nearest-k widens a radius search until it holds k points, and all of those points are inside
+the radius, so the k closest points found are the true k nearest.
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, literal, or_, select, text
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 10
+MAX_CELLS = 24
+EARTH_KM = 6371.0088
+_NEXT = {c: BASE32[i + 1] for i, c in enumerate(BASE32[:-1])}
+
+def encode(lat: float, lon: float, precision: int = PRECISION) -> str:
+    lat_bits, lon_bits = _bits(precision)
+    y = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    x = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    return _cell_hash(y, x, precision)
+
+def geohash_of(lat: Optional[float], lon: Optional[float]) -> Optional[str]:
+    """The stored geohash, or None when coordinates are missing or out of range."""
+    if lat is None or lon is None:
+        return None
+    lat, lon = float(lat), float(lon)
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return encode(lat, lon)
+
+def _bits(precision: int) -> Tuple[int, int]:
+    total = 5 * precision
+    return total // 2, total - total // 2  # lat, lon (lon gets the odd bit)
+
+def _cell_hash(y: int, x: int, precision: int) -> str:
+    lat_bits, lon_bits = _bits(precision)
+    code, out = 0, []
+    # interleave lon/lat bits from the top, lon first
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (x >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (y >> lat_bits) & 1
+        code = (code << 1) | bit
+        if i % 5 == 4:
+            out.append(BASE32[code])
+            code = 0
+    return "".join(out)
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(lat degrees, lon degrees) of one cell."""
+    lat_bits, lon_bits = _bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+# ---------- covering an area ----------
+
+def _cells(south: float, west: float, north: float, east: float, precision: int) -> List[str]:
+    lat_bits, lon_bits = _bits(precision)
+    h, w = cell_size(precision)
+    y0, y1 = int((south + 90.0) / h), min(int((north + 90.0) / h), (1 << lat_bits) - 1)
+    x0, x1 = int((west + 180.0) / w), min(int((east + 180.0) / w), (1 << lon_bits) - 1)
+    return [_cell_hash(y, x, precision) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+def _successor(prefix: str) -> Optional[str]:
+    """The next prefix of the same length in geohash order ('dpz8' -> 'dpz9', 'dpzz' -> 'dq00')."""
+    for i in range(len(prefix) - 1, -1, -1):
+        if prefix[i] != "z":
+            return prefix[:i] + _NEXT[prefix[i]] + "0" * (len(prefix) - i - 1)
+    return None
+
+def cover(south: float, west: float, north: float, east: float, max_cells: int = MAX_CELLS) -> List[Tuple[str, Optional[str]]]:
+    """Index ranges [low, high) covering the box; high None means open-ended."""
+    precision = 1
+    for p in range(PRECISION, 0, -1):
+        h, w = cell_size(p)
+        if (int((north + 90) / h) - int((south + 90) / h) + 1) * (int((east + 180) / w) - int((west + 180) / w) + 1) <= max_cells:
+            precision = p
+            break
+    ranges: List[List[Any]] = []
+    for cell in sorted(set(_cells(south, west, north, east, precision))):
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = _successor(cell)
+        else:
+            ranges.append([cell, _successor(cell)])
+    return [(low, high) for low, high in ranges]
+
+def _boxes(south: float, west: float, north: float, east: float) -> List[Tuple[float, float, float, float]]:
+    # a box crossing the antimeridian (west > east) is two boxes
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+def within_box(col_geohash, col_lat, col_lon, south: float, west: float, north: float, east: float):
+    """WHERE clause: index ranges for the box, then the exact bounds."""
+    parts = []
+    for s, w, n, e in _boxes(south, west, north, east):
+        ranges = [and_(col_geohash >= low, col_geohash < high) if high else col_geohash >= low for low, high in cover(s, w, n, e)]
+        parts.append(and_(or_(*ranges), col_lat.between(s, n), col_lon.between(w, e)))
+    return or_(*parts)
+
+def box_around(lat: float, lon: float, km: float) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) enclosing a circle; east < west when it crosses the antimeridian."""
+    dlat = math.degrees(km / EARTH_KM)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if south <= -90.0 or north >= 90.0 or math.cos(math.radians(max(abs(south), abs(north)))) < 1e-9:
+        return south, -180.0, north, 180.0  # reaches a pole: every longitude
+    dlon = math.degrees(km / (EARTH_KM * math.cos(math.radians(max(abs(south), abs(north))))))
+    if dlon >= 180.0:
+        return south, -180.0, north, 180.0
+    west, east = lon - dlon, lon + dlon
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+# ---------- distance ----------
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def distance_expr(col_lat, col_lon, lat: float, lon: float):
+    """Haversine distance in km as a SQL expression."""
+    a = (func.power(func.sin(func.radians(col_lat - lat) / 2), 2)
+         + math.cos(math.radians(lat)) * func.cos(func.radians(col_lat))
+         * func.power(func.sin(func.radians(col_lon - lon) / 2), 2))
+    return literal(2 * EARTH_KM) * func.asin(func.least(1.0, func.sqrt(a)))
+
+# ---------- queries ----------
+
+START_KM = 1.0
+MAX_KM = 20_040.0  # half the equator: everything
+
+async def radius(db, model, columns: Sequence[Any], lat: float, lon: float, km: float, limit: int,
+                 exclude_id: Optional[int] = None, where: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+    """Rows of `model` within `km` of (lat, lon), closest first, each with distance_km."""
+    dist = distance_expr(model.lat, model.lon, lat, lon).label("distance_km")
+    stmt = (
+        select(*columns, dist)
+        .where(within_box(model.geohash, model.lat, model.lon, *box_around(lat, lon, km)), dist <= km, *where)
+        .order_by(dist, model.id)
+        .limit(limit)
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(model.id != exclude_id)
+    return [dict(r._mapping) for r in await db.execute(stmt)]
+
+async def nearest(db, model, columns: Sequence[Any], lat: float, lon: float, k: int,
+                  exclude_id: Optional[int] = None, where: Sequence[Any] = ()) -> Tuple[List[Dict[str, Any]], float]:
+    """The k rows closest to (lat, lon): radius searches from START_KM, doubling until k are found."""
+    km = START_KM
+    while True:
+        rows = await radius(db, model, columns, lat, lon, km, k, exclude_id, where)
+        if len(rows) >= k or km >= MAX_KM:
+            return rows, km
+        km = min(km * 4 if not rows else km * 2, MAX_KM)
+
+# ---------- geocode cache ----------
+
+def address_key(address: Optional[str], city: Optional[str] = None, state: Optional[str] = None,
+                country: Optional[str] = None) -> str:
+    """What geocode_cache is keyed by: folded words of the full address ('12 Main Street, Toronto' == '12 main st toronto')."""
+    from app.resolver import words
+    return " ".join(w for part in (address, city, state, country) for w in words(part))
+
+async def load_cache(db, entries: Sequence[Tuple[str, float, float]], source: Optional[str] = None) -> int:
+    """Upsert (address key, lat, lon) rows from an external geocoder's output."""
+    entries = [(k, la, lo) for k, la, lo in entries if k and geohash_of(la, lo)]
+    if entries:
+        keys, lats, lons = map(list, zip(*entries))
+        await db.execute(text(
+            "INSERT INTO geocode_cache (key, lat, lon, source) "
+            "SELECT k, la, lo, :source FROM unnest(CAST(:keys AS text[]), CAST(:lats AS float8[]), CAST(:lons AS float8[])) AS v(k, la, lo) "
+            "ON CONFLICT (key) DO UPDATE SET lat = EXCLUDED.lat, lon = EXCLUDED.lon, source = EXCLUDED.source"
+        ), {"keys": keys, "lats": lats, "lons": lons, "source": source})
+    return len(entries)
+
+async def fill_from_cache(db, after_id: int, batch_size: int) -> Tuple[int, int, Optional[int]]:
+    """
+    Give properties without coordinates (ids > after_id, one batch) the cached coordinates of
+    their address. Returns (scanned, filled, last id scanned); commits.
+    """
+    rows = (await db.execute(text(
+        "SELECT id, address, city, state_province, country FROM properties "
+        "WHERE lat IS NULL AND id > :after ORDER BY id LIMIT :n"
+    ), {"after": after_id, "n": batch_size})).all()
+    if not rows:
+        return 0, 0, None
+    keys = {r.id: address_key(r.address, r.city, r.state_province, r.country) for r in rows}
+    cached = {c.key: c for c in await db.execute(
+        text("SELECT key, lat, lon FROM geocode_cache WHERE key = ANY(:keys)"), {"keys": list(set(keys.values()))}
+    )}
+    hits = [(i, cached[k]) for i, k in keys.items() if k in cached]
+    if hits:
+        await db.execute(text(
+            "UPDATE properties p SET lat = v.lat, lon = v.lon, geohash = v.g "
+            "FROM unnest(CAST(:ids AS int[]), CAST(:lat AS float8[]), CAST(:lon AS float8[]), CAST(:g AS text[])) "
+            "AS v(id, lat, lon, g) WHERE p.id = v.id"
+        ), {"ids": [i for i, _ in hits], "lat": [c.lat for _, c in hits], "lon": [c.lon for _, c in hits],
+            "g": [geohash_of(c.lat, c.lon) for _, c in hits]})
+        from app.changes import record_bulk
+        await record_bulk(db, "properties", len(hits))
+    await db.commit()
+    return len(rows), len(hits), rows[-1].id
@@ -0,0 +1,80 @@
+"""
+Contact identity normalization: the comparable forms of emails, phones and names.
+
+Used for duplicate blocking (app.dedupe); kept free of database code so importers and
+request handlers can call it on raw input.
+"""
+import os
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+DEFAULT_CALLING_CODE = os.getenv("PHONE_DEFAULT_CALLING_CODE", "1")  # numbers without one are assumed North American
+# what /ingest/confirm names contacts it could not name; never evidence of a match
+PLACEHOLDER_NAMES = {("unknown", "contact"), ("unknown", "")}
+
+_NON_DIGIT = re.compile(r"\D")
+_NON_ALPHA = re.compile(r"[^a-z]")
+_SOUNDEX = str.maketrans("bfpvcgjkqsxzdtlmnr", "111122222222334556")
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not email:
+        return None
+    email = email.strip().lower()
+    return email if "@" in email.strip("@") else None
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """E.164 (+14165551234), or None when it can't be a full number. Extensions are dropped."""
+    if not phone:
+        return None
+    raw = re.split(r"(?i)\s*(?:x|ext\.?)\s*\d+\s*$", phone.strip())[0]
+    digits = _NON_DIGIT.sub("", raw)
+    if raw.startswith("+"):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    if raw.startswith("00"):  # international prefix
+        return f"+{digits[2:]}" if 8 <= len(digits) - 2 <= 15 else None
+    if DEFAULT_CALLING_CODE == "1":
+        if len(digits) == 11 and digits[0] == "1":
+            return f"+{digits}"
+        return f"+1{digits}" if len(digits) == 10 else None
+    return f"+{DEFAULT_CALLING_CODE}{digits.lstrip('0')}" if 6 <= len(digits) <= 14 else None
+
+def fold(name: Optional[str]) -> str:
+    """Lowercase ASCII letters only: 'José-Marie' -> 'josemarie'."""
+    if not name:
+        return ""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALPHA.sub("", ascii_name.lower())
+
+def soundex(name: Optional[str]) -> str:
+    """American Soundex ('Robert' and 'Rupert' -> 'r163'); '' for names without letters."""
+    s = fold(name)
+    if not s:
+        return ""
+    out, last = s[0], s[0].translate(_SOUNDEX)
+    for ch in s[1:]:
+        code = ch.translate(_SOUNDEX)
+        if code.isdigit() and code != last:
+            out += code
+            if len(out) == 4:
+                break
+        if ch not in "hw":  # h and w don't separate equal codes; vowels do
+            last = code
+    return out.ljust(4, "0")
+
+def is_placeholder(first: Optional[str], last: Optional[str]) -> bool:
+    return (fold(first), fold(last)) in PLACEHOLDER_NAMES or not (fold(first) or fold(last))
+
+def block_keys(first: Optional[str], last: Optional[str], email: Optional[str], phone: Optional[str]) -> List[Tuple[str, str]]:
+    """(kind, key) pairs; two contacts sharing any one of them get compared."""
+    keys = []
+    e = normalize_email(email)
+    if e:
+        keys.append(("email", e))
+    p = normalize_phone(phone)
+    if p:
+        keys.append(("phone", p))
+    if not is_placeholder(first, last):
+        # phonetic last name + first initial: catches Jon/John Smith/Smyth, not Jon/Mary Smith
+        keys.append(("name", f"{soundex(last or first)}:{fold(first if last else '')[:1]}"))
+    return keys
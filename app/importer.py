@@ -0,0 +1,233 @@
+"""
+Bulk CSV / NDJSON import through PostgreSQL COPY.
+
+Rows are parsed and mapped onto the model columns in a worker thread, a batch at a time, while
+the previous batch is being copied with asyncpg's copy_records_to_table. Columns that are not
+model fields go into attrs. Each batch is its own transaction, so a bad batch is reported and
+skipped without undoing the batches before it.
+"""
+import asyncio
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+from starlette.concurrency import run_in_threadpool
+
+from app import analytics, changes, jobs, models
+from app.cache import bump
+from app.db import engine
+
+ENTITIES = {
+    "contacts": models.Contact,
+    "properties": models.Property,
+    "transactions": models.Transaction,
+}
+FORMATS = ("csv", "ndjson")
+MAX_ERRORS_PER_BATCH = 20
+
+def normalize_key(key: str) -> str:
+    return key.strip().lower().replace(" ", "_").replace("-", "_")
+
+def _coerce_str(col):
+    length = getattr(col.type, "length", None)
+    def coerce(v):
+        if v is None or v == "":
+            return None
+        v = str(v).strip()
+        if length and len(v) > length:
+            raise ValueError(f"longer than {length} characters")
+        return v
+    return coerce
+
+def _coerce_int(v):
+    if v is None or v == "":
+        return None
+    return int(v) if not isinstance(v, str) else int(v.strip())
+
+def _coerce_float(v):
+    if v is None or v == "":
+        return None
+    if isinstance(v, str):
+        v = v.strip().replace(",", "").replace("$", "")
+    return float(v)
+
+class EntitySpec:
+    """How input records map onto one table's COPY columns."""
+
+    def __init__(self, model):
+        table = model.__table__
+        self.table = table.name
+        self.fields = []  # (name, coerce, default, required)
+        self.derived = getattr(model, "DERIVED", {})  # e.g. contacts.email_norm, computed from email here
+        for col in table.columns:
+            # ids, generated and server-defaulted columns are left to the database
+            if col.primary_key or col.computed is not None or col.server_default is not None or col.name == "attrs":
+                continue
+            if col.name in self.derived:
+                continue
+            py = col.type.python_type
+            coerce = _coerce_int if py is int else _coerce_float if py is float else _coerce_str(col)
+            default = col.default.arg if col.default is not None and col.default.is_scalar else None
+            required = not col.nullable and default is None
+            self.fields.append((col.name, coerce, default, required))
+        self.columns = [f[0] for f in self.fields] + list(self.derived) + ["attrs"]
+        self._names = {f[0] for f in self.fields}
+        index = {f[0]: i for i, f in enumerate(self.fields)}
+        self._derive = [
+            ([index[src] for src in ((sources,) if isinstance(sources, str) else sources)], fn)
+            for sources, fn in self.derived.values()
+        ]
+
+    def map_record(self, raw: Dict[str, Any], rename: Dict[str, str]) -> tuple:
+        values: Dict[str, Any] = {}
+        attrs: Dict[str, Any] = {}
+        for key, v in raw.items():
+            if key is None:  # csv row with more cells than the header
+                continue
+            name = rename.get(key) or normalize_key(key)
+            if name in self._names:
+                values[name] = v
+            elif name == "attrs":
+                attrs.update(json.loads(v) if isinstance(v, str) and v else (v or {}))
+            elif v is not None and v != "":
+                attrs[name] = v
+
+        out = []
+        for name, coerce, default, required in self.fields:
+            try:
+                v = coerce(values.get(name))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{name}: {e}")
+            if v is None:
+                v = default
+            if v is None and required:
+                raise ValueError(f"missing {name}")
+            out.append(v)
+        out += [fn(*[out[i] for i in idx]) for idx, fn in self._derive]
+        out.append(json.dumps(attrs, separators=(",", ":"), default=str))
+        return tuple(out)
+
+    def pipeline_changes(self, rows: List[tuple]):
+        """app.analytics deltas for copied transaction rows (created_at defaults to now)."""
+        idx = {name: i for i, name in enumerate(self.columns)}
+        today = datetime.now(timezone.utc).date()
+        for r in rows:
+            yield analytics.TxFacts(r[idx["stage"]], r[idx["side"]], r[idx["offer_price"]], r[idx["close_price"]], today), 1
+
+    def map_batch(self, records: Iterator[Tuple[int, Any]], size: int, rename: Dict[str, str]):
+        """Pull up to `size` records; returns (rows, errors, first_line, last_line, consumed)."""
+        rows: List[tuple] = []
+        errors: List[dict] = []
+        first = last = None
+        consumed = 0
+        for line, raw in records:
+            consumed += 1
+            first = line if first is None else first
+            last = line
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                rows.append(self.map_record(raw, rename))
+            except (TypeError, ValueError) as e:
+                if len(errors) < MAX_ERRORS_PER_BATCH:
+                    errors.append({"line": line, "error": str(e)})
+            if consumed >= size:
+                break
+        return rows, errors, first, last, consumed
+
+def get_spec(entity: str) -> EntitySpec:
+    if entity not in ENTITIES:
+        raise ValueError(f"unknown entity {entity!r}; choose from {sorted(ENTITIES)}")
+    return EntitySpec(ENTITIES[entity])
+
+def iter_records(fileobj: BinaryIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, record dict or the parse error) from a binary file."""
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "ndjson":
+        for n, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                yield n, ValueError(f"invalid JSON: {e}")
+                continue
+            yield n, obj if isinstance(obj, dict) else ValueError("expected a JSON object")
+    else:
+        raise ValueError(f"unknown format {fmt!r}; choose from {FORMATS}")
+
+async def import_file(
+    fileobj: BinaryIO,
+    entity: str,
+    fmt: str,
+    *,
+    batch_size: int = 5000,
+    rename: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[dict]:
+    """Import `fileobj`, yielding one progress dict per batch and a final summary."""
+    spec = get_spec(entity)
+    records = iter_records(fileobj, fmt)
+    rename = rename or {}
+    started = time.perf_counter()
+    copied = skipped = failed = batch_no = 0
+
+    def next_batch():
+        return asyncio.ensure_future(run_in_threadpool(spec.map_batch, records, batch_size, rename))
+
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        pending = next_batch()
+        while True:
+            rows, errors, first, last, consumed = await pending
+            if not consumed:
+                break
+            pending = next_batch()  # parse the next batch while this one is copied
+            batch_no += 1
+            ok = 0
+            if rows:
+                try:
+                    async with raw.transaction():
+                        await raw.copy_records_to_table(spec.table, records=rows, columns=spec.columns)
+                        if spec.table == "transactions":
+                            await analytics.apply_raw(raw, spec.pipeline_changes(rows))
+                        await changes.record_bulk_raw(raw, spec.table, len(rows))
+                        if spec.table == "contacts":
+                            await jobs.enqueue_raw(raw, "dedupe", key="dedupe")
+                    ok = len(rows)
+                    await bump(spec.table)
+                except (asyncpg.PostgresError, asyncpg.DataError) as e:  # constraint/type errors reject the whole batch
+                    failed += 1
+                    errors.append({"error": f"batch rejected: {e}"})
+            copied += ok
+            skipped += consumed - ok
+            elapsed = time.perf_counter() - started
+            yield {
+                "batch": batch_no,
+                "first_line": first,
+                "last_line": last,
+                "copied": ok,
+                "skipped": consumed - ok,
+                "errors": errors,
+                "total_copied": copied,
+                "rows_per_sec": round(copied / elapsed, 1) if elapsed else None,
+            }
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "done": True,
+        "entity": entity,
+        "batches": batch_no,
+        "failed_batches": failed,
+        "total_copied": copied,
+        "total_skipped": skipped,
+        "elapsed_sec": round(elapsed, 3),
+        "rows_per_sec": round(copied / elapsed, 1) if elapsed else None,
+    }
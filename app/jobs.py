@@ -0,0 +1,352 @@
+"""
+Durable background jobs: a queue in the `jobs` table, worked with FOR UPDATE SKIP LOCKED.
+
+Request handlers enqueue() in their own transaction, before commit, so a job exists exactly when
+the write that asked for it does. The same statement NOTIFYs `crm_jobs` to wake idle workers;
+they also poll every POLL_SECONDS, so a missed notification (or PgBouncer, where LISTEN doesn't
+work) only delays a job.
+
+A worker (`python -m app.cli worker`, or the API process itself with JOBS_IN_PROCESS=1) claims
+the highest-priority due job no other worker holds, marks it running with a lease of the job's
+timeout and runs its task. Tasks are async functions registered with @task; CPU-heavy parts go
+through cpu(), which runs them in the worker's process pool so the event loop stays free.
+A failed attempt is retried with exponential backoff until max_attempts, then the job is
+`failed` (POST /jobs/{id}/retry requeues it). A worker that dies mid-job leaves a lease that
+expires; the next worker to look requeues the job.
+
+`key` coalesces work: while a job with that key is queued, enqueueing another is a no-op.
+Concurrency is capped per worker (JOB_CONCURRENCY) and per task kind (@task(concurrency=...)).
+Finished jobs are kept for JOB_RETENTION_HOURS.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import asyncpg
+import orjson
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.db import DATABASE_URL, SessionLocal
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "crm_jobs"
+JOBS_DATABASE_URL = os.getenv("JOBS_DATABASE_URL") or DATABASE_URL  # LISTEN needs a direct (session) connection
+IN_PROCESS = os.getenv("JOBS_IN_PROCESS", "0").strip().lower() in ("1", "true", "yes", "on")  # API process runs a worker too
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))  # jobs one worker runs at once
+JOB_PROCESSES = int(os.getenv("JOB_PROCESSES", "0")) or None  # process pool size for cpu(); default: CPU count
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "168"))
+RETRY_BASE_SECONDS = 5.0
+RETRY_MAX_SECONDS = 3600.0
+REAP_SECONDS = 60
+SHUTDOWN_GRACE_SECONDS = 30
+
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+# ---------- tasks ----------
+
+@dataclass
+class Task:
+    name: str
+    fn: Callable[[Dict[str, Any]], Awaitable[Any]]
+    priority: int = 0
+    max_attempts: int = 5
+    timeout: float = 300.0
+    concurrency: Optional[int] = None  # per worker; None: only JOB_CONCURRENCY applies
+
+TASKS: Dict[str, Task] = {}
+
+def task(name: str, **options) -> Callable:
+    """Register an async `fn(payload) -> JSON-able result` as the handler for jobs of kind `name`."""
+    def register(fn):
+        TASKS[name] = Task(name, fn, **options)
+        return fn
+    return register
+
+def load_tasks() -> Dict[str, Task]:
+    import app.tasks  # noqa: F401  (registers the handlers)
+    return TASKS
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+async def cpu(fn: Callable, *args) -> Any:
+    """Run a picklable, module-level `fn(*args)` in the worker's process pool."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=JOB_PROCESSES)
+    return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+
+# ---------- enqueueing ----------
+
+ENQUEUE_SQL = text(f"""
+WITH ins AS (
+    INSERT INTO jobs (kind, payload, key, priority, max_attempts, timeout, run_at)
+    VALUES (:kind, CAST(:payload AS jsonb), :key, :priority, :max_attempts, :timeout, now() + make_interval(secs => CAST(:delay AS float8)))
+    ON CONFLICT (key) WHERE status = 'queued' AND key IS NOT NULL DO NOTHING
+    RETURNING id, kind
+)
+SELECT id, pg_notify('{CHANNEL}', kind) FROM ins
+""")
+
+def _enqueue_params(kind: str, payload: Optional[Dict[str, Any]], key: Optional[str],
+                    priority: Optional[int], delay: float) -> Dict[str, Any]:
+    spec = load_tasks().get(kind)
+    if spec is None:
+        raise ValueError(f"unknown job kind {kind!r}; choose from {sorted(TASKS)}")
+    return {
+        "kind": kind,
+        "payload": orjson.dumps(payload or {}).decode(),
+        "key": key,
+        "priority": spec.priority if priority is None else priority,
+        "max_attempts": spec.max_attempts,
+        "timeout": spec.timeout,
+        "delay": delay,
+    }
+
+async def enqueue(db, kind: str, payload: Optional[Dict[str, Any]] = None, *, key: Optional[str] = None,
+                  priority: Optional[int] = None, delay: float = 0.0) -> Optional[int]:
+    """Queue a job in `db`'s transaction (commit it yourself); None when `key` is already queued."""
+    params = _enqueue_params(kind, payload, key, priority, delay)
+    return (await db.execute(ENQUEUE_SQL, params)).scalar()
+
+async def enqueue_raw(conn, kind: str, payload: Optional[Dict[str, Any]] = None, *, key: Optional[str] = None,
+                      priority: Optional[int] = None, delay: float = 0.0) -> Optional[int]:
+    """Same as enqueue() on a raw asyncpg connection (the COPY importer's)."""
+    p = _enqueue_params(kind, payload, key, priority, delay)
+    return await conn.fetchval(
+        f"WITH ins AS (INSERT INTO jobs (kind, payload, key, priority, max_attempts, timeout, run_at) "
+        f"VALUES ($1, $2::jsonb, $3, $4, $5, $6, now() + make_interval(secs => $7)) "
+        f"ON CONFLICT (key) WHERE status = 'queued' AND key IS NOT NULL DO NOTHING RETURNING id, kind) "
+        f"SELECT id FROM ins, pg_notify('{CHANNEL}', ins.kind)",
+        p["kind"], p["payload"], p["key"], p["priority"], p["max_attempts"], p["timeout"], p["delay"],
+    )
+
+# ---------- state changes ----------
+
+CLAIM_SQL = text("""
+WITH next AS (
+    SELECT id FROM jobs
+    WHERE status = 'queued' AND run_at <= now() AND kind = ANY(:kinds)
+    ORDER BY priority DESC, run_at, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE jobs j SET status = 'running', attempts = j.attempts + 1, locked_by = :worker,
+    locked_until = now() + make_interval(secs => j.timeout), error = NULL
+FROM next WHERE j.id = next.id
+RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts, j.timeout
+""")
+
+FINISH_SQL = text(
+    "UPDATE jobs SET status = 'done', result = CAST(:result AS jsonb), finished_at = now(), locked_by = NULL, locked_until = NULL "
+    "WHERE id = :id AND status = 'running' AND locked_by = :worker"
+)
+
+# a job can't go back to queued while another with its key is queued: that one does the work
+_KEY_QUEUED = "key IS NOT NULL AND EXISTS (SELECT 1 FROM jobs q WHERE q.key = jobs.key AND q.status = 'queued')"
+_GIVE_UP = f"attempts >= max_attempts OR ({_KEY_QUEUED})"
+
+# retry with backoff, or give up after max_attempts
+FAIL_SQL = text(f"""
+UPDATE jobs SET
+    status = CASE WHEN {_GIVE_UP} THEN 'failed' ELSE 'queued' END,
+    run_at = now() + make_interval(secs => least(CAST(:base AS float8) * 2 ^ (attempts - 1), CAST(:cap AS float8))),
+    finished_at = CASE WHEN {_GIVE_UP} THEN now() END,
+    error = :error, locked_by = NULL, locked_until = NULL
+WHERE id = :id AND status = 'running' AND locked_by = :worker
+""")
+
+# leases of workers that died mid-job. Several expired jobs can share a key (coalescing only
+# holds while one is queued), and _KEY_QUEUED can't see rows requeued by the same statement:
+# only the oldest of them goes back to the queue, the rest fail as superseded.
+REAP_SQL = text(f"""
+WITH expired AS (
+    SELECT id FROM jobs WHERE status = 'running' AND locked_until < now() FOR UPDATE SKIP LOCKED
+), ranked AS (
+    SELECT jobs.id, {_GIVE_UP} OR (key IS NOT NULL AND row_number() OVER (PARTITION BY key ORDER BY jobs.id) > 1) AS give_up
+    FROM jobs JOIN expired ON expired.id = jobs.id
+)
+UPDATE jobs SET
+    status = CASE WHEN ranked.give_up THEN 'failed' ELSE 'queued' END,
+    finished_at = CASE WHEN ranked.give_up THEN now() END,
+    error = 'lease expired (worker ' || coalesce(locked_by, '?') || ' stopped or timed out)',
+    locked_by = NULL, locked_until = NULL
+FROM ranked WHERE jobs.id = ranked.id
+""")
+
+PRUNE_SQL = text(
+    "DELETE FROM jobs WHERE status IN ('done', 'cancelled') AND finished_at < now() - make_interval(secs => :secs)"
+)
+
+async def retry(db, job_id: int) -> bool:
+    """Requeue a failed or cancelled job with a fresh set of attempts (unless its key is queued again)."""
+    res = await db.execute(text(
+        "UPDATE jobs SET status = 'queued', attempts = 0, run_at = now(), finished_at = NULL "
+        f"WHERE id = :id AND status IN ('failed', 'cancelled') AND NOT ({_KEY_QUEUED}) RETURNING kind"
+    ), {"id": job_id})
+    kind = res.scalar()
+    if kind is not None:
+        await db.execute(text("SELECT pg_notify(:ch, :kind)"), {"ch": CHANNEL, "kind": kind})
+    await db.commit()
+    return kind is not None
+
+async def cancel(db, job_id: int) -> bool:
+    """Cancel a job that hasn't started; running jobs finish (or fail) on their own."""
+    res = await db.execute(text(
+        "UPDATE jobs SET status = 'cancelled', finished_at = now() WHERE id = :id AND status = 'queued' RETURNING id"
+    ), {"id": job_id})
+    await db.commit()
+    return res.scalar() is not None
+
+# ---------- worker ----------
+
+class Worker:
+    """Claims and runs jobs until stop(); one per process is plenty (it runs JOB_CONCURRENCY at once)."""
+
+    def __init__(self, kinds: Optional[Sequence[str]] = None, concurrency: int = JOB_CONCURRENCY):
+        tasks = load_tasks()
+        unknown = set(kinds or ()) - set(tasks)
+        if unknown:
+            raise ValueError(f"unknown job kinds {sorted(unknown)}; choose from {sorted(tasks)}")
+        self.tasks = {k: tasks[k] for k in (kinds or tasks)}
+        self.concurrency = concurrency
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.running: Dict[asyncio.Task, str] = {}
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "Worker":
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+
+    def _free_kinds(self) -> List[str]:
+        busy: Dict[str, int] = {}
+        for kind in self.running.values():
+            busy[kind] = busy.get(kind, 0) + 1
+        return [k for k, t in self.tasks.items() if t.concurrency is None or busy.get(k, 0) < t.concurrency]
+
+    async def run(self) -> None:
+        listener = asyncio.get_running_loop().create_task(self._listen())
+        reaped = 0.0
+        loop = asyncio.get_running_loop()
+        log.info("job worker %s: %s, %d at a time", self.name, ", ".join(sorted(self.tasks)), self.concurrency)
+        try:
+            while not self._stopping.is_set():
+                if loop.time() - reaped > REAP_SECONDS:
+                    await self._reap()
+                    reaped = loop.time()
+                self._wake.clear()
+                while len(self.running) < self.concurrency and not self._stopping.is_set():
+                    kinds = self._free_kinds()
+                    job = await self._claim(kinds) if kinds else None
+                    if job is None:
+                        break
+                    t = loop.create_task(self._execute(job))
+                    self.running[t] = job["kind"]
+                    t.add_done_callback(self._done)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            listener.cancel()
+            if self.running:  # let started jobs finish; the leases of any still running expire and they rerun
+                await asyncio.wait(list(self.running), timeout=SHUTDOWN_GRACE_SECONDS)
+
+    def _done(self, t: asyncio.Task) -> None:
+        self.running.pop(t, None)
+        self._wake.set()  # a slot opened
+
+    async def _claim(self, kinds: List[str]) -> Optional[Dict[str, Any]]:
+        async with SessionLocal() as db:
+            row = (await db.execute(CLAIM_SQL, {"kinds": kinds, "worker": self.name})).first()
+            await db.commit()
+        return dict(row._mapping) if row else None
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        spec = self.tasks[job["kind"]]
+        try:
+            result = await asyncio.wait_for(spec.fn(job["payload"] or {}), timeout=job["timeout"])
+        except asyncio.TimeoutError:
+            error = f"timed out after {job['timeout']:g}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        else:
+            await self._settle(FINISH_SQL, {"id": job["id"], "worker": self.name, "result": orjson.dumps(result, default=str).decode()})
+            return
+        log.warning("job %s (%s) attempt %s/%s failed: %s", job["id"], job["kind"], job["attempts"], job["max_attempts"], error)
+        await self._settle(FAIL_SQL, {"id": job["id"], "worker": self.name, "error": error,
+                                      "base": RETRY_BASE_SECONDS, "cap": RETRY_MAX_SECONDS})
+
+    async def _settle(self, stmt, params: Dict[str, Any]) -> None:
+        try:
+            async with SessionLocal() as db:
+                await db.execute(stmt, params)
+                await db.commit()
+        except Exception:  # the lease expires and the job is retried
+            log.exception("could not record the outcome of job %s", params["id"])
+
+    async def _reap(self) -> None:
+        try:
+            async with SessionLocal() as db:
+                requeued = (await db.execute(REAP_SQL)).rowcount
+                await db.commit()
+            if requeued:
+                log.warning("reaped %d jobs with expired leases", requeued)
+        except Exception:
+            log.exception("job reaper failed")
+        try:  # on its own, so a failed reap never holds back the cleanup or the other way round
+            async with SessionLocal() as db:
+                await db.execute(PRUNE_SQL, {"secs": RETENTION_HOURS * 3600})
+                await db.commit()
+        except Exception:
+            log.exception("pruning finished jobs failed")
+
+    async def _listen(self) -> None:
+        dsn = make_url(JOBS_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                await conn.add_listener(CHANNEL, lambda _c, _pid, _ch, kind: kind in self.tasks and self._wake.set())
+                self._wake.set()  # anything queued while not listening
+                while not conn.is_closed():
+                    await asyncio.sleep(POLL_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # polling still picks jobs up
+                log.warning("job listener: %s; polling only until it reconnects", e)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(POLL_SECONDS)
+
+# ---------- status ----------
+
+async def stats(db) -> Dict[str, Any]:
+    rows = (await db.execute(text(
+        "SELECT kind, status, count(*) AS n, "
+        "extract(epoch FROM now() - min(run_at) FILTER (WHERE status = 'queued' AND run_at <= now())) AS oldest_due "
+        "FROM jobs GROUP BY kind, status"
+    ))).all()
+    kinds: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        entry = kinds.setdefault(r.kind, {s: 0 for s in STATUSES})
+        entry[r.status] = r.n
+        if r.oldest_due is not None:
+            entry["oldest_queued_seconds"] = round(float(r.oldest_due), 1)
+    return {"kinds": kinds}
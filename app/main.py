@@ -1,10 +1,18 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.db import engine
-from app import models
+from app.db import engine, pool_stats
+from app.cache import ResponseCacheMiddleware
+from app.attrs import load_promoted
+from app.migrations import MIGRATE_ON_STARTUP, check, migrate
+from app.textsearch import set_trigram_enabled
+from app import changes, jobs, resolver
 from app.routers import contacts, properties, transactions, search
-from app.routers import ui, documents, ingest  # <- includes UI, Documents, and Ingest
+from app.routers import ui, documents, ingest, uploads  # <- includes UI, Documents, Uploads, and Ingest
+from app.routers import imports, analytics, dedupe, export
+from app.routers import jobs as jobs_router
+from app.routers import changes as changes_router
 
 app = FastAPI(title="Flexible AI CRM", version="0.1.0")
 
@@ -17,16 +25,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create tables on startup (safe if already created)
+# ETag / 304 cache for the list endpoints (see app/cache.py)
+app.add_middleware(ResponseCacheMiddleware)
+
+# Schema changes are applied by `python -m app.cli migrate`; startup only checks the version
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
+    if MIGRATE_ON_STARTUP:  # handy for local dev; deploys migrate in a pre-deploy step
+        async with engine.begin() as conn:
+            await conn.run_sync(migrate)
+    async with engine.connect() as conn:
+        state = await check(conn)
+    set_trigram_enabled(state["trgm"])
+    load_promoted(state["promoted"])
+    if resolver.WARM_ON_STARTUP:  # build the /ingest name/address index in the background
+        app.state.resolver_warm = asyncio.get_running_loop().create_task(resolver.warm())
+    if jobs.IN_PROCESS:  # no separate `python -m app.cli worker`: work the job queue here
+        app.state.job_worker = jobs.Worker().start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await changes.hub.stop()  # the change feed's LISTEN connection, if a stream ever opened it
+    if getattr(app.state, "job_worker", None) is not None:
+        await app.state.job_worker.stop()
 
 @app.get("/health")
 async def health():
     return {"ok": True}
 
+@app.get("/health/pool")
+async def health_pool():
+    return pool_stats()
+
 # API routers
 app.include_router(contacts.router)
 app.include_router(properties.router)
@@ -36,4 +66,21 @@ app.include_router(search.router)
 # UI + Documents + Ingest
 app.include_router(ui.router)
 app.include_router(documents.router)
+app.include_router(uploads.router)
 app.include_router(ingest.router)
+
+# Bulk import / export
+app.include_router(imports.router)
+app.include_router(export.router)
+
+# Pipeline dashboards
+app.include_router(analytics.router)
+
+# Duplicate contacts
+app.include_router(dedupe.router)
+
+# Live change feed
+app.include_router(changes_router.router)
+
+# Background jobs
+app.include_router(jobs_router.router)
@@ -0,0 +1,218 @@
+"""
+Versioned schema migrations.
+
+Migrations are applied explicitly with `python -m app.cli migrate` (Render runs it as the
+pre-deploy command) and recorded in schema_version. App startup only checks the recorded
+version, in the same single query that loads the other boot-time state (see check()), and
+refuses to start against an older schema unless MIGRATE_ON_STARTUP=1.
+
+To change the schema, append a migration with the next version number. Keep the DDL idempotent
+(IF NOT EXISTS ...): migration 1 creates tables from the current models, so on a fresh database
+later migrations may find their columns already there.
+"""
+import json
+import os
+from typing import Callable, Dict, List, NamedTuple
+
+from sqlalchemy import text
+
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "").strip().lower() in ("1", "true", "yes", "on")
+LOCK_ID = 7_263_001  # pg_advisory_xact_lock key, so concurrent deploys don't migrate twice
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable  # (sync connection) -> None
+
+# ---------- migrations ----------
+
+def _create_tables(conn) -> None:
+    from app import models
+    models.Base.metadata.create_all(conn)
+
+def _document_metadata(conn) -> None:
+    # first-class document metadata (previously only in attrs)
+    conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS size BIGINT"))
+    conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64)"))
+    conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()"))
+
+def _generated_columns_and_indexes(conn) -> None:
+    # generated columns declared on the models (promoted attrs keys, search text), then every declared index
+    from app import models
+    from app.attrs import generated_sql
+    for table in models.Base.metadata.sorted_tables:
+        for col in table.columns:
+            if col.computed is not None:
+                # exec_driver_sql, never text(): "[:space:]" in the expressions would read as a bind parameter
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {col.name} {col.type.compile(dialect=conn.dialect)} "
+                    f"GENERATED ALWAYS AS ({generated_sql(col.computed.sqltext)}) STORED"
+                )
+    existing = {(t, c) for t, c in conn.execute(text(
+        "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema()"
+    ))}
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            # indexes on columns a later migration adds are created by that migration
+            if all((table.name, c.name) in existing for c in index.columns):
+                index.create(conn, checkfirst=True)
+
+def _trigram_search(conn) -> None:
+    from app import textsearch
+    textsearch.setup(conn)  # pg_trgm is optional, so its indexes are not declared on the models
+
+def _pipeline_analytics(conn) -> None:
+    from app import analytics, models
+    conn.execute(text("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_created_at ON transactions (created_at)"))
+    models.Base.metadata.create_all(conn, tables=[models.PipelineRollup.__table__, models.PipelineHistory.__table__])
+    analytics.rebuild_sync(conn)
+
+def _dedupe(conn) -> None:
+    from app import models
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_contact_id ON transactions (contact_id)"))
+    models.Base.metadata.create_all(conn, tables=[
+        models.ContactKey.__table__, models.DedupeCandidate.__table__, models.DedupeState.__table__,
+    ])
+
+def _contact_identity(conn) -> None:
+    # normalized email/phone, backfilled with the same Python normalizers the write paths use
+    from app.identity import normalize_email, normalize_phone
+    conn.execute(text("ALTER TABLE contacts ADD COLUMN IF NOT EXISTS email_norm VARCHAR(255)"))
+    conn.execute(text("ALTER TABLE contacts ADD COLUMN IF NOT EXISTS phone_e164 VARCHAR(16)"))
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, email, phone FROM contacts WHERE id > :last ORDER BY id LIMIT 10000"
+        ), {"last": last_id}).all()
+        if not rows:
+            break
+        conn.execute(text(
+            "UPDATE contacts c SET email_norm = v.e, phone_e164 = v.p "
+            "FROM unnest(CAST(:ids AS int[]), CAST(:e AS text[]), CAST(:p AS text[])) AS v(id, e, p) WHERE c.id = v.id"
+        ), {"ids": [r.id for r in rows], "e": [normalize_email(r.email) for r in rows], "p": [normalize_phone(r.phone) for r in rows]})
+        last_id = rows[-1].id
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_email_norm ON contacts (email_norm)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_phone_e164 ON contacts (phone_e164)"))
+
+def _property_geo(conn) -> None:
+    # lat/lon columns (taken over from attrs where clients kept them there) and their geohash
+    from app import models
+    from app.geo import geohash_of
+    conn.execute(text("ALTER TABLE properties ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION"))
+    conn.execute(text("ALTER TABLE properties ADD COLUMN IF NOT EXISTS lon DOUBLE PRECISION"))
+    conn.execute(text('ALTER TABLE properties ADD COLUMN IF NOT EXISTS geohash VARCHAR(12) COLLATE "C"'))
+    number = "CASE WHEN jsonb_typeof(attrs->'{k}') = 'number' THEN (attrs->>'{k}')::float8 END"
+    lat = ", ".join(number.format(k=k) for k in ("lat", "latitude"))
+    lon = ", ".join(number.format(k=k) for k in ("lon", "lng", "longitude"))
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id, coalesce(lat, {lat}) AS lat, coalesce(lon, {lon}) AS lon FROM properties "
+            "WHERE id > :last ORDER BY id LIMIT 10000"
+        ), {"last": last_id}).all()
+        if not rows:
+            break
+        found = [r for r in rows if geohash_of(r.lat, r.lon)]
+        if found:
+            conn.execute(text(
+                "UPDATE properties p SET lat = v.lat, lon = v.lon, geohash = v.g "
+                "FROM unnest(CAST(:ids AS int[]), CAST(:lat AS float8[]), CAST(:lon AS float8[]), CAST(:g AS text[])) "
+                "AS v(id, lat, lon, g) WHERE p.id = v.id"
+            ), {"ids": [r.id for r in found], "lat": [r.lat for r in found], "lon": [r.lon for r in found],
+                "g": [geohash_of(r.lat, r.lon) for r in found]})
+        last_id = rows[-1].id
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_properties_geohash ON properties (geohash)"))
+    models.Base.metadata.create_all(conn, tables=[models.GeocodeCache.__table__])
+
+def _change_log(conn) -> None:
+    from app import models
+    models.Base.metadata.create_all(conn, tables=[models.ChangeLog.__table__])
+
+def _jobs(conn) -> None:
+    from app import models
+    conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_text TEXT"))
+    models.Base.metadata.create_all(conn, tables=[models.Job.__table__])
+
+def _blob_refcounts(conn) -> None:
+    from app import models
+    from app.blobs import RECOUNT_SQL
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_sha256 ON documents (sha256)"))
+    models.Base.metadata.create_all(conn, tables=[models.Blob.__table__])
+    for stmt in RECOUNT_SQL:  # every blob documents already point at
+        conn.execute(text(stmt))
+
+def _upload_sessions(conn) -> None:
+    from app import models
+    models.Base.metadata.create_all(conn, tables=[models.UploadSession.__table__])
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create tables", _create_tables),
+    Migration(2, "document metadata columns", _document_metadata),
+    Migration(3, "generated columns and indexes", _generated_columns_and_indexes),
+    Migration(4, "pg_trgm search indexes", _trigram_search),
+    Migration(5, "transactions.created_at and pipeline rollups", _pipeline_analytics),
+    Migration(6, "duplicate-contact detection tables", _dedupe),
+    Migration(7, "normalized contact email/phone columns", _contact_identity),
+    Migration(8, "property coordinates, geohash index and geocode cache", _property_geo),
+    Migration(9, "change log for the live change feed", _change_log),
+    Migration(10, "background job queue and extracted document text", _jobs),
+    Migration(11, "blob reference counts", _blob_refcounts),
+    Migration(12, "resumable upload sessions", _upload_sessions),
+]
+HEAD = MIGRATIONS[-1].version
+
+# ---------- runner ----------
+
+def _ensure_version_table(conn) -> None:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    ))
+
+def applied_version(conn) -> int:
+    _ensure_version_table(conn)
+    return conn.execute(text("SELECT coalesce(max(version), 0) FROM schema_version")).scalar()
+
+def migrate(conn, log=print) -> int:
+    """Apply pending migrations in one transaction (sync connection, inside engine.begin()); returns the new version."""
+    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+    current = applied_version(conn)
+    for m in MIGRATIONS:
+        if m.version <= current:
+            continue
+        log(f"migrate: applying {m.version} ({m.name})")
+        m.apply(conn)
+        conn.execute(text("INSERT INTO schema_version (version, name) VALUES (:v, :n)"), {"v": m.version, "n": m.name})
+        current = m.version
+    return current
+
+# ---------- startup ----------
+
+STARTUP_QUERY = text(
+    "SELECT (SELECT max(version) FROM schema_version) AS version, "
+    "EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS trgm, "
+    "(SELECT coalesce(json_agg(json_build_array(entity, key, promoted_column)), '[]') "
+    " FROM attr_catalog WHERE promoted_column IS NOT NULL) AS promoted"
+)
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+async def check(conn) -> Dict:
+    """
+    One round trip at boot: the schema version plus the state other modules need (pg_trgm
+    availability, attrs keys promoted at runtime). Raises SchemaOutdated when migrations are pending.
+    """
+    from sqlalchemy.exc import ProgrammingError
+    try:
+        row = (await conn.execute(STARTUP_QUERY)).one()
+    except ProgrammingError:  # schema_version / attr_catalog missing: a database never migrated
+        await conn.rollback()
+        version, trgm, promoted = 0, False, []
+    else:
+        version, trgm = row.version or 0, row.trgm
+        promoted = json.loads(row.promoted) if isinstance(row.promoted, str) else row.promoted
+    if version < HEAD:
+        raise SchemaOutdated(f"database schema is at version {version}, this code needs {HEAD}: run `python -m app.cli migrate`")
+    return {"version": version, "trgm": trgm, "promoted": promoted}
@@ -1,8 +1,22 @@
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Optional, Any, Dict
-from sqlalchemy import String, Integer, ForeignKey, Float, Text
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import String, Integer, BigInteger, Boolean, ForeignKey, Float, Text, Index, Date, DateTime, Numeric, Computed, func, text
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from .db import Base
+from .attrs import generated_numeric_attr
+from .textsearch import search_text_expr, search_tsv_expr
+from .identity import normalize_email, normalize_phone
+from .geo import geohash_of
+
+def _apply_derived(obj, key, value):
+    """@validates body: recompute the DERIVED columns that read `key`, with its new value."""
+    for col, (sources, fn) in obj.DERIVED.items():
+        sources = (sources,) if isinstance(sources, str) else sources
+        if key in sources:
+            setattr(obj, col, fn(*[value if s == key else getattr(obj, s) for s in sources]))
+    return value
 
 class Contact(Base):
     __tablename__ = "contacts"
@@ -14,8 +28,32 @@ class Contact(Base):
     status: Mapped[Optional[str]] = mapped_column(String(50), default="new")
     # You can add any custom fields here without changing the database schema
     attrs: Mapped[Dict[str, Any]] = mapped_column(JSONB, default=dict)
+    # /search/text (app.textsearch); deferred so normal loads never pull them
+    search_text: Mapped[Optional[str]] = mapped_column(Text, Computed(search_text_expr("contacts"), persisted=True), deferred=True)
+    search_tsv: Mapped[Optional[Any]] = mapped_column(TSVECTOR, Computed(search_tsv_expr("contacts"), persisted=True), deferred=True)
+    # lowercased email / E.164 phone (app.identity), kept in step with email/phone at write time
+    email_norm: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    phone_e164: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+
+    # derived column -> (source column(s), function); the COPY importer applies these too
+    DERIVED = {"email_norm": ("email", normalize_email), "phone_e164": ("phone", normalize_phone)}
 
     transactions = relationship("Transaction", back_populates="contact")
+    documents = relationship("Document", back_populates="contact")
+
+    @validates("email", "phone")
+    def _normalize_identity(self, key, value):
+        return _apply_derived(self, key, value)
+
+    # (sort column, id) pairs back the keyset-paginated list endpoint; the GIN index serves attrs @> {...}
+    __table_args__ = (
+        Index("ix_contacts_status_id", "status", "id"),
+        Index("ix_contacts_last_name_id", "last_name", "id"),
+        Index("ix_contacts_attrs", "attrs", postgresql_using="gin", postgresql_ops={"attrs": "jsonb_path_ops"}),
+        Index("ix_contacts_search_tsv", "search_tsv", postgresql_using="gin"),
+        Index("ix_contacts_email_norm", "email_norm"),  # /contacts/lookup
+        Index("ix_contacts_phone_e164", "phone_e164"),
+    )
 
 class Property(Base):
     __tablename__ = "properties"
@@ -26,8 +64,34 @@ class Property(Base):
     country: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, default="Canada")
     status: Mapped[Optional[str]] = mapped_column(String(50), default="prospect")
     attrs: Mapped[Dict[str, Any]] = mapped_column(JSONB, default=dict)
+    # Hot attrs keys promoted to indexed generated columns (see app.attrs.range_expr)
+    attr_list_price: Mapped[Optional[Decimal]] = mapped_column(Numeric, Computed(generated_numeric_attr("list_price"), persisted=True), index=True)
+    attr_bed: Mapped[Optional[Decimal]] = mapped_column(Numeric, Computed(generated_numeric_attr("bed"), persisted=True), index=True)
+    attr_bath: Mapped[Optional[Decimal]] = mapped_column(Numeric, Computed(generated_numeric_attr("bath"), persisted=True), index=True)
+    # /search/text (app.textsearch); deferred so normal loads never pull them
+    search_text: Mapped[Optional[str]] = mapped_column(Text, Computed(search_text_expr("properties"), persisted=True), deferred=True)
+    search_tsv: Mapped[Optional[Any]] = mapped_column(TSVECTOR, Computed(search_tsv_expr("properties"), persisted=True), deferred=True)
+    # WGS84 coordinates; geohash (app.geo) is what the area / radius / nearest searches scan
+    lat: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    lon: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    geohash: Mapped[Optional[str]] = mapped_column(String(12, collation="C"), nullable=True)
+
+    DERIVED = {"geohash": (("lat", "lon"), geohash_of)}
 
     transactions = relationship("Transaction", back_populates="property")
+    documents = relationship("Document", back_populates="property")
+
+    @validates("lat", "lon")
+    def _update_geohash(self, key, value):
+        return _apply_derived(self, key, value)
+
+    __table_args__ = (
+        Index("ix_properties_status_id", "status", "id"),
+        Index("ix_properties_city_id", "city", "id"),
+        Index("ix_properties_attrs", "attrs", postgresql_using="gin", postgresql_ops={"attrs": "jsonb_path_ops"}),
+        Index("ix_properties_search_tsv", "search_tsv", postgresql_using="gin"),
+        Index("ix_properties_geohash", "geohash"),  # C collation: prefix ranges are index range scans
+    )
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -38,10 +102,24 @@ class Transaction(Base):
     stage: Mapped[str] = mapped_column(String(32), default="lead") # lead / showing / offer / conditional / pending / closed / fallen_through
     offer_price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     close_price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     attrs: Mapped[Dict[str, Any]] = mapped_column(JSONB, default=dict)
+    # /search/text (app.textsearch); deferred so normal loads never pull them
+    search_text: Mapped[Optional[str]] = mapped_column(Text, Computed(search_text_expr("transactions"), persisted=True), deferred=True)
+    search_tsv: Mapped[Optional[Any]] = mapped_column(TSVECTOR, Computed(search_tsv_expr("transactions"), persisted=True), deferred=True)
 
     contact = relationship("Contact", back_populates="transactions")
     property = relationship("Property", back_populates="transactions")
+    documents = relationship("Document", back_populates="transaction")
+
+    __table_args__ = (
+        Index("ix_transactions_stage_id", "stage", "id"),
+        Index("ix_transactions_side_id", "side", "id"),
+        Index("ix_transactions_created_at", "created_at"),
+        Index("ix_transactions_contact_id", "contact_id"),  # dedupe merges repoint by contact
+        Index("ix_transactions_attrs", "attrs", postgresql_using="gin", postgresql_ops={"attrs": "jsonb_path_ops"}),
+        Index("ix_transactions_search_tsv", "search_tsv", postgresql_using="gin"),
+    )
 
 class Document(Base):
     __tablename__ = "documents"
@@ -52,4 +130,164 @@ class Document(Base):
     contact_id: Mapped[Optional[int]] = mapped_column(ForeignKey("contacts.id"), nullable=True)
     property_id: Mapped[Optional[int]] = mapped_column(ForeignKey("properties.id"), nullable=True)
     transaction_id: Mapped[Optional[int]] = mapped_column(ForeignKey("transactions.id"), nullable=True)
-    attrs: Mapped[Dict[str, Any]] = mapped_column(JSONB, default=dict)
+    # File metadata lives in columns so listings never touch attrs; the bytes live in app.storage under sha256
+    size: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # deferred: rows not yet run through migrate-blobs still carry the file as base64 in here
+    attrs: Mapped[Dict[str, Any]] = mapped_column(JSONB, default=dict, deferred=True)
+    # filled in by the documents.extract job (app/tasks.py); deferred like attrs
+    content_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True, deferred=True)
+
+    contact = relationship("Contact", back_populates="documents")
+    property = relationship("Property", back_populates="documents")
+    transaction = relationship("Transaction", back_populates="documents")
+
+    __table_args__ = (
+        Index("ix_documents_contact_id_id", "contact_id", "id"),
+        Index("ix_documents_property_id_id", "property_id", "id"),
+        Index("ix_documents_transaction_id_id", "transaction_id", "id"),
+        Index("ix_documents_created_at_id", "created_at", "id"),
+        Index("ix_documents_sha256", "sha256"),  # blob garbage collection double-checks references
+        Index("ix_documents_attrs", "attrs", postgresql_using="gin", postgresql_ops={"attrs": "jsonb_path_ops"}),
+    )
+
+class AttrCatalog(Base):
+    """Which attrs keys get queried, how, and whether they have been promoted to a column."""
+    __tablename__ = "attr_catalog"
+    entity: Mapped[str] = mapped_column(String(32), primary_key=True)  # table name
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    hits: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    query_types: Mapped[Dict[str, Any]] = mapped_column(JSONB, server_default=text("'{}'"))  # {"number": hits, "string": hits}
+    value_types: Mapped[Dict[str, Any]] = mapped_column(JSONB, server_default=text("'{}'"))  # sampled jsonb_typeof counts
+    promoted_column: Mapped[Optional[str]] = mapped_column(String(63), nullable=True)
+    last_used_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+# Pipeline rollups kept current by app.analytics on every transaction write
+class PipelineRollup(Base):
+    __tablename__ = "pipeline_rollup"
+    stage: Mapped[str] = mapped_column(String(32), primary_key=True)
+    side: Mapped[str] = mapped_column(String(20), primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    offer_count: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    offer_total: Mapped[float] = mapped_column(Float, server_default="0")
+    close_count: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    close_total: Mapped[float] = mapped_column(Float, server_default="0")
+
+class PipelineHistory(Base):
+    """Cohorts: transactions created per UTC day, by their current stage/side (so conversion trends come for free)."""
+    __tablename__ = "pipeline_history"
+    bucket: Mapped[date] = mapped_column(Date, primary_key=True)
+    stage: Mapped[str] = mapped_column(String(32), primary_key=True)
+    side: Mapped[str] = mapped_column(String(20), primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    offer_count: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    offer_total: Mapped[float] = mapped_column(Float, server_default="0")
+    close_count: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    close_total: Mapped[float] = mapped_column(Float, server_default="0")
+
+# Duplicate-contact detection (app.dedupe): blocking keys, scored candidate pairs, job watermark
+class ContactKey(Base):
+    __tablename__ = "contact_keys"
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)  # email / phone / name
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    contact_id: Mapped[int] = mapped_column(ForeignKey("contacts.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (Index("ix_contact_keys_contact_id", "contact_id"),)
+
+class DedupeCandidate(Base):
+    __tablename__ = "dedupe_candidates"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    a_id: Mapped[int] = mapped_column(ForeignKey("contacts.id", ondelete="CASCADE"))  # a_id < b_id
+    b_id: Mapped[int] = mapped_column(ForeignKey("contacts.id", ondelete="CASCADE"))
+    score: Mapped[float] = mapped_column(Float)
+    reasons: Mapped[Dict[str, Any]] = mapped_column(JSONB, server_default=text("'{}'"))
+    status: Mapped[str] = mapped_column(String(16), server_default="open")  # open / dismissed
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ux_dedupe_candidates_pair", "a_id", "b_id", unique=True),
+        Index("ix_dedupe_candidates_b_id", "b_id"),
+        Index("ix_dedupe_candidates_status_score_id", "status", "score", "id"),
+    )
+
+class DedupeState(Base):
+    __tablename__ = "dedupe_state"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # single row, id = 1
+    last_contact_id: Mapped[int] = mapped_column(Integer, server_default="0")
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class GeocodeCache(Base):
+    """Coordinates already looked up for an address (app.geo.address_key), so re-imports never re-geocode."""
+    __tablename__ = "geocode_cache"
+    key: Mapped[str] = mapped_column(Text, primary_key=True)
+    lat: Mapped[float] = mapped_column(Float)
+    lon: Mapped[float] = mapped_column(Float)
+    source: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class ChangeLog(Base):
+    """Row changes published to /changes/stream (app/changes.py); seq is the SSE event id."""
+    __tablename__ = "change_log"
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    entity: Mapped[str] = mapped_column(String(32))
+    op: Mapped[str] = mapped_column(String(16))  # insert | update | delete | bulk
+    row_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    row: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class Job(Base):
+    """Background work queued by request handlers and run by `python -m app.cli worker` (app/jobs.py)."""
+    __tablename__ = "jobs"
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(64))  # a task registered with app.jobs.task
+    payload: Mapped[Dict[str, Any]] = mapped_column(JSONB, server_default=text("'{}'"))
+    key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)  # at most one queued job per key
+    status: Mapped[str] = mapped_column(String(16), server_default="queued")  # queued | running | done | failed | cancelled
+    priority: Mapped[int] = mapped_column(Integer, server_default="0")  # higher runs first
+    attempts: Mapped[int] = mapped_column(Integer, server_default="0")
+    max_attempts: Mapped[int] = mapped_column(Integer, server_default="5")
+    timeout: Mapped[float] = mapped_column(Float, server_default="300")  # seconds; also the claim's lease
+    run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())  # not before (retry backoff)
+    locked_by: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    result: Mapped[Optional[Any]] = mapped_column(JSONB, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # the claim query: next queued job by priority, then age
+        Index("ix_jobs_queued", text("priority DESC"), "run_at", "id", postgresql_where=text("status = 'queued'")),
+        Index("ux_jobs_queued_key", "key", unique=True, postgresql_where=text("status = 'queued' AND key IS NOT NULL")),
+        Index("ix_jobs_running_locked_until", "locked_until", postgresql_where=text("status = 'running'")),
+        Index("ix_jobs_kind_status_id", "kind", "status", "id"),
+    )
+
+class Blob(Base):
+    """One stored file (app.storage key) and how many documents point at it (app/blobs.py)."""
+    __tablename__ = "blobs"
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 hex digest
+    size: Mapped[int] = mapped_column(BigInteger)
+    refcount: Mapped[int] = mapped_column(Integer, server_default="0")
+    stored: Mapped[bool] = mapped_column(Boolean, server_default="false")  # bytes are in the store
+    unreferenced_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)  # refcount hit 0
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("ix_blobs_unreferenced_at", "unreferenced_at", postgresql_where=text("refcount = 0")),)
+
+class UploadSession(Base):
+    """A resumable upload in progress (app/uploads.py); its bytes so far are in a part file."""
+    __tablename__ = "upload_sessions"
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)  # random token, also the part file's name
+    filename: Mapped[str] = mapped_column(String(255))
+    mime_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    size: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # declared total, if known up front
+    sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # expected digest of the whole file
+    received: Mapped[int] = mapped_column(BigInteger, server_default="0")  # bytes accepted: the next chunk's offset
+    contact_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    property_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    transaction_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    attrs: Mapped[Dict[str, Any]] = mapped_column(JSONB, server_default=text("'{}'"))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)  # pushed back by every chunk
@@ -0,0 +1,79 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints.
+
+A page is fetched with `ORDER BY <sort column>, id LIMIT limit+1`; the extra row only tells us
+whether another page exists. The cursor handed back to clients encodes the sort key and the
+(sort value, id) of the last row, so the next page is a plain index range scan — no OFFSET.
+"""
+import base64
+import json
+import operator
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, and_, or_
+
+def encode_cursor(sort: str, value: Any, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, last_id], separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort, value, last_id = json.loads(raw)
+        return sort, value, int(last_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+def _cursor_value(col, value: Any) -> Any:
+    # JSON has no datetime, so timestamp sort keys travel as ISO strings
+    try:
+        is_datetime = col.type.python_type is datetime
+    except NotImplementedError:
+        is_datetime = False
+    return datetime.fromisoformat(value) if is_datetime and isinstance(value, str) else value
+
+def _sort_column(sortable: Dict[str, Any], sort: str):
+    name = sort[1:] if sort.startswith("-") else sort
+    if name not in sortable:
+        raise HTTPException(status_code=400, detail=f"cannot sort by {name!r}; choose from {sorted(sortable)}")
+    return name, sortable[name], sort.startswith("-")
+
+def paginate(stmt: Select, pk, sortable: Dict[str, Any], *, sort: str, after: Optional[str], limit: int) -> Select:
+    """Apply ordering, the cursor predicate and LIMIT limit+1 to `stmt`."""
+    name, col, desc = _sort_column(sortable, sort)
+    beyond = operator.lt if desc else operator.gt
+
+    if after:
+        cur_sort, value, last_id = decode_cursor(after)
+        if cur_sort != sort:
+            raise HTTPException(status_code=400, detail="cursor was issued for a different sort")
+        try:
+            value = _cursor_value(col, value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        if col is pk:
+            stmt = stmt.where(beyond(pk, last_id))
+        elif value is None:
+            # NULLs sort last, so after a NULL only NULLs with a later id remain
+            stmt = stmt.where(and_(col.is_(None), beyond(pk, last_id)))
+        else:
+            stmt = stmt.where(or_(beyond(col, value), and_(col == value, beyond(pk, last_id)), col.is_(None)))
+
+    pk_order = pk.desc() if desc else pk.asc()
+    if col is pk:
+        return stmt.order_by(pk_order).limit(limit + 1)
+    col_order = (col.desc() if desc else col.asc()).nulls_last()
+    return stmt.order_by(col_order, pk_order).limit(limit + 1)
+
+def page_of(rows: Sequence[Any], sortable: Dict[str, Any], *, sort: str, limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Split the limit+1 rows from `paginate` into (items, next_cursor)."""
+    name, _, _ = _sort_column(sortable, sort)
+    items = list(rows[:limit])
+    if len(rows) <= limit or not items:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor(sort, getattr(last, name), last.id)
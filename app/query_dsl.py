@@ -0,0 +1,252 @@
+"""
+JSON filter language for /search/query, compiled to parameterized SQLAlchemy Core.
+
+    {"entity": "properties",
+     "where": {"and": [
+        {"field": "city", "op": "eq", "value": "Toronto"},
+        {"attr": "bed", "op": "gte", "value": 3},
+        {"attr": "list_price", "op": "lte", "value": 900000},
+        {"has": "transactions", "where": {"field": "stage", "op": "eq", "value": "offer"}}]}}
+
+Nodes are {"and": [...]}, {"or": [...]}, {"not": node}, a column predicate {"field", "op", "value"},
+an attrs predicate {"attr", "op", "value"} or a related-row test {"has": relation, "where": node}.
+
+A query is first split into its shape (everything but the values) and the values. Statements
+are built once per shape with named bind parameters and kept in an LRU, so repeated queries
+skip the DSL work and produce identical SQL, which keeps hitting SQLAlchemy's compiled cache
+and asyncpg's prepared-statement cache.
+"""
+import math
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import Select, String, and_, bindparam, exists, not_, or_, select
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app import models
+from app.attrs import MAX_KEY_LENGTH, note_usage, promoted_version, range_expr
+
+class QueryError(ValueError):
+    pass
+
+TABLES = {
+    "contacts": models.Contact.__table__,
+    "properties": models.Property.__table__,
+    "transactions": models.Transaction.__table__,
+    "documents": models.Document.__table__,
+}
+
+# relation name -> (target entity, join condition between the outer and the related table)
+def _relations():
+    c, p, t, d = (TABLES[n].c for n in ("contacts", "properties", "transactions", "documents"))
+    return {
+        "contacts": {"transactions": ("transactions", t.contact_id == c.id), "documents": ("documents", d.contact_id == c.id)},
+        "properties": {"transactions": ("transactions", t.property_id == p.id), "documents": ("documents", d.property_id == p.id)},
+        "transactions": {
+            "contact": ("contacts", c.id == t.contact_id),
+            "property": ("properties", p.id == t.property_id),
+            "documents": ("documents", d.transaction_id == t.id),
+        },
+        "documents": {
+            "contact": ("contacts", c.id == d.contact_id),
+            "property": ("properties", p.id == d.property_id),
+            "transaction": ("transactions", t.id == d.transaction_id),
+        },
+    }
+RELATIONS = _relations()
+
+# same (column, id)-indexed sort keys as the list endpoints
+SORTS = {
+    "contacts": ("id", "last_name", "status"),
+    "properties": ("id", "city", "status"),
+    "transactions": ("id", "stage", "side"),
+    "documents": ("id", "created_at"),
+}
+
+COMPARE_OPS = {"eq": "__eq__", "ne": "__ne__", "lt": "__lt__", "lte": "__le__", "gt": "__gt__", "gte": "__ge__"}
+FIELD_OPS = set(COMPARE_OPS) | {"in", "not_in", "is_null", "contains"}
+ATTR_OPS = {"eq", "in", "exists", "lt", "lte", "gt", "gte"}
+# search columns are internal, and document attrs may still hold legacy base64 payloads
+HIDDEN = {"search_text", "search_tsv"}
+HIDDEN_BY_ENTITY = {"documents": {"attrs", "url", "content_text"}}
+MAX_IN = 1000
+MAX_NODES = 64
+
+# ---------- shape / values ----------
+
+def _field_value(col, op: str, value: Any) -> Any:
+    py = col.type.python_type
+    def one(v):
+        if py is datetime and isinstance(v, str):
+            try:
+                return datetime.fromisoformat(v)
+            except ValueError:
+                raise QueryError(f"{col.name}: expected an ISO timestamp")
+        if py is float and isinstance(v, (int, float)) and not isinstance(v, bool):
+            return float(v)
+        if py is Decimal and isinstance(v, (int, float)) and not isinstance(v, bool):  # promoted attr_* columns
+            if not math.isfinite(v):
+                raise QueryError(f"{col.name}: expected a finite number")
+            return Decimal(str(v))
+        if not isinstance(v, py) or isinstance(v, bool) and py is not bool:
+            raise QueryError(f"{col.name}: expected {py.__name__}, got {type(v).__name__}")
+        return v
+    if op in ("in", "not_in"):
+        if not isinstance(value, list) or not value or len(value) > MAX_IN:
+            raise QueryError(f"{op} takes a non-empty list of at most {MAX_IN} values")
+        return [one(v) for v in value]
+    if op == "contains":
+        if not isinstance(col.type, String):
+            raise QueryError(f"contains only works on text fields, not {col.name}")
+        if not isinstance(value, str):
+            raise QueryError("contains takes a string")
+        return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return one(value)
+
+def normalize(entity: str, node: Any, values: List[Any], budget: List[int]) -> tuple:
+    """Validate `node`, append its values in evaluation order and return its hashable shape."""
+    budget[0] -= 1
+    if budget[0] < 0:
+        raise QueryError(f"query has more than {MAX_NODES} nodes")
+    if not isinstance(node, dict):
+        raise QueryError("every node must be an object")
+    table = TABLES[entity]
+
+    for op in ("and", "or"):
+        if op in node:
+            children = node[op]
+            if not isinstance(children, list) or not children:
+                raise QueryError(f"{op} takes a non-empty list")
+            return (op,) + tuple(normalize(entity, c, values, budget) for c in children)
+    if "not" in node:
+        return ("not", normalize(entity, node["not"], values, budget))
+
+    if "has" in node:
+        rel = node["has"]
+        if rel not in RELATIONS[entity]:
+            raise QueryError(f"{entity} has no relation {rel!r}; choose from {sorted(RELATIONS[entity])}")
+        target = RELATIONS[entity][rel][0]
+        inner = normalize(target, node["where"], values, budget) if node.get("where") is not None else None
+        return ("has", rel, inner)
+
+    op = node.get("op", "eq")
+    if "field" in node:
+        name = node["field"]
+        if name not in FIELDS[entity]:
+            raise QueryError(f"{entity} has no field {name!r}")
+        if op not in FIELD_OPS:
+            raise QueryError(f"field op must be one of {sorted(FIELD_OPS)}")
+        if op == "is_null":
+            return ("field", name, op, bool(node.get("value", True)))
+        values.append(_field_value(table.c[name], op, node.get("value")))
+        return ("field", name, op)
+
+    if "attr" in node:
+        key = node["attr"]
+        if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+            raise QueryError(f"attr must be a non-empty string of at most {MAX_KEY_LENGTH} characters")
+        if op not in ATTR_OPS:
+            raise QueryError(f"attr op must be one of {sorted(ATTR_OPS)}")
+        value = node.get("value")
+        if op == "exists":
+            return ("attr", key, op)
+        if op == "eq":
+            values.append({key: value})
+            note_usage(entity, key, "string" if isinstance(value, str) else "number")
+            return ("attr", key, op)
+        if op == "in":
+            if not isinstance(value, list) or not value or len(value) > MAX_IN:
+                raise QueryError(f"in takes a non-empty list of at most {MAX_IN} values")
+            values.extend({key: v} for v in value)
+            return ("attr", key, op, len(value))
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise QueryError(f"{op} on attr {key!r} takes a number")
+        values.append(value)
+        note_usage(entity, key, "number")
+        return ("attr", key, op)
+
+    raise QueryError("node needs one of and/or/not/field/attr/has")
+
+# ---------- building ----------
+
+def build(entity: str, shape: tuple, counter: List[int]):
+    table = TABLES[entity]
+
+    def param(**kw):
+        name = f"p{counter[0]}"
+        counter[0] += 1
+        return bindparam(name, **kw)
+
+    kind = shape[0]
+    if kind in ("and", "or"):
+        parts = [build(entity, s, counter) for s in shape[1:]]
+        return and_(*parts) if kind == "and" else or_(*parts)
+    if kind == "not":
+        return not_(build(entity, shape[1], counter))
+    if kind == "has":
+        _, rel, inner = shape
+        target, join = RELATIONS[entity][rel]
+        sub = select(1).select_from(TABLES[target]).where(join)
+        if inner is not None:
+            sub = sub.where(build(target, inner, counter))
+        return exists(sub)
+    if kind == "field":
+        col = table.c[shape[1]]
+        op = shape[2]
+        if op == "is_null":
+            return col.is_(None) if shape[3] else col.is_not(None)
+        if op == "in":
+            return col.in_(param(type_=col.type, expanding=True))
+        if op == "not_in":
+            return col.not_in(param(type_=col.type, expanding=True))
+        if op == "contains":
+            return col.ilike(param(type_=col.type), escape="\\")
+        return getattr(col, COMPARE_OPS[op])(param(type_=col.type))
+    if kind == "attr":
+        key, op = shape[1], shape[2]
+        if op == "exists":
+            return table.c.attrs.has_key(key)
+        if op == "eq":
+            return table.c.attrs.contains(param(type_=JSONB))
+        if op == "in":
+            return or_(*[table.c.attrs.contains(param(type_=JSONB)) for _ in range(shape[3])])
+        return getattr(range_expr(table, key), COMPARE_OPS[op])(param())
+    raise QueryError(f"unknown node {kind!r}")
+
+# ---------- cache ----------
+
+CACHE_SIZE = 512
+_plans: "OrderedDict[tuple, Select]" = OrderedDict()
+
+def plan(entity: str, where: Any) -> Tuple[Select, Dict[str, Any]]:
+    """(filtered SELECT for `entity`, bind values) for a query; the SELECT is shared per shape."""
+    if entity not in TABLES:
+        raise QueryError(f"entity must be one of {sorted(TABLES)}")
+    values: List[Any] = []
+    shape = normalize(entity, where, values, [MAX_NODES]) if where is not None else None
+    key = (entity, shape, promoted_version())
+    stmt = _plans.get(key)
+    if stmt is None:
+        stmt = select(*row_columns(TABLES[entity]))
+        if shape is not None:
+            stmt = stmt.where(build(entity, shape, [0]))
+        _plans[key] = stmt
+        if len(_plans) > CACHE_SIZE:
+            _plans.popitem(last=False)
+    else:
+        _plans.move_to_end(key)
+    return stmt, {f"p{i}": v for i, v in enumerate(values)}
+
+def row_columns(table) -> List[Any]:
+    """The columns API responses expose for `table`."""
+    hidden = HIDDEN | HIDDEN_BY_ENTITY.get(table.name, set())
+    return [c for c in table.c if c.name not in hidden]
+
+# what {"field": ...} may name: the exposed columns, with attrs reached through {"attr": ...}
+FIELDS = {entity: {c.name for c in row_columns(table)} - {"attrs"} for entity, table in TABLES.items()}
+
+def sortable(entity: str) -> Dict[str, Any]:
+    table = TABLES[entity]
+    return {name: table.c[name] for name in SORTS[entity]}
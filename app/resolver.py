@@ -0,0 +1,281 @@
+"""
+In-memory resolver from free text ("offer from Jon Smith on 12 Main St") to contact and
+property ids, for /ingest.
+
+Each index keeps, per row, the token ids of a few fields (contact name / email / phone,
+property address) in flat arrays, an inverted index token -> rows, and a trigram index over
+the (much smaller) vocabulary so misspelled words still find their tokens. Resolving a text:
+
+  1. every word of the text is matched to vocabulary tokens, exactly or, for misspellings,
+     through the tokens it shares trigrams with (scored by closeness());
+  2. rows are gathered from the postings of the rarer matched tokens only (a token in more
+     than MAX_POSTINGS rows, like "main" or "st", narrows nothing and only adds score);
+  3. each candidate's confidence is the best idf-weighted share of one field's tokens that the
+     text covers, so "jon smith" covers 0.9+ of John Smith's name field.
+
+Indexes load lazily (or at startup, RESOLVER_WARM=1) and then refresh incrementally: rows with
+ids past the last one seen are appended at most every REFRESH_SECONDS, and a full reload every
+REBUILD_SECONDS picks up merges and deletes. Candidate ids are re-read from the database before
+being returned, so a stale index can miss a row but never returns one that no longer exists.
+Memory is ~40 bytes per row plus ~200 per distinct token: about 50 MB for 1M addresses, whose
+words mostly repeat; every contact's email and phone is a distinct token (~190 MB measured for
+300k properties + 200k contacts with all-unique names).
+"""
+import asyncio
+import math
+import os
+import re
+import time
+import unicodedata
+from array import array
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from app import identity
+
+MAX_POSTINGS = int(os.getenv("RESOLVER_MAX_POSTINGS", "2000"))
+REFRESH_SECONDS = float(os.getenv("RESOLVER_REFRESH_SECONDS", "5"))
+REBUILD_SECONDS = float(os.getenv("RESOLVER_REBUILD_SECONDS", "3600"))
+WARM_ON_STARTUP = os.getenv("RESOLVER_WARM", "1").strip().lower() in ("1", "true", "yes", "on")
+LOAD_BATCH = 50_000
+MIN_SIMILARITY = 0.2  # trigram Jaccard a misspelling must reach to be considered at all
+MIN_CLOSENESS = 0.75
+# a candidate this confident, and this far ahead of the runner-up, is filled into the draft
+AUTO_CONFIDENCE = 0.8
+AUTO_MARGIN = 0.15
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# address words folded to their usual abbreviation so "Main Street" finds "Main St"
+ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "av": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr",
+    "lane": "ln", "court": "ct", "crescent": "cres", "place": "pl", "terrace": "terr", "circle": "cir",
+    "highway": "hwy", "parkway": "pkwy", "square": "sq", "north": "n", "south": "s", "east": "e",
+    "west": "w", "apartment": "apt", "suite": "ste", "unit": "apt",
+}
+
+def words(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    folded = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii").lower()
+    return [ABBREVIATIONS.get(w, w) for w in WORD_RE.findall(folded)]
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _index_trigrams(token: str) -> set:
+    # all but "  s", which every word starting with s shares: it finds nothing the others don't
+    return trigrams(token) - {f"  {token[0]}"}
+
+def similarity(a: str, b: str) -> float:
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+def closeness(a: str, b: str) -> float:
+    """Token match score: trigram Jaccard screens, difflib's ratio scores (one typo costs ~0.1, not ~0.5)."""
+    if similarity(a, b) < MIN_SIMILARITY:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def _fuzzy(token: str) -> bool:
+    return len(token) >= 3 and token.isalpha()
+
+class Rows:
+    """The token data of one index; replaced wholesale on a rebuild."""
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self.vocab: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self.postings: List[Any] = []  # per token: a row number, or an array of them once there are two
+        self.grams: Dict[str, List[int]] = {}
+        self.ids = array("i")
+        self.offsets = {f: array("i", [0]) for f in self.fields}
+        self.flat = {f: array("i") for f in self.fields}
+
+    def _token_id(self, token: str) -> int:
+        tid = self.vocab.get(token)
+        if tid is None:
+            tid = self.vocab[token] = len(self.tokens)
+            self.tokens.append(token)
+            self.postings.append(None)
+            if _fuzzy(token):
+                for g in _index_trigrams(token):
+                    self.grams.setdefault(g, []).append(tid)
+        return tid
+
+    def add(self, db_id: int, fields: Dict[str, List[str]]) -> None:
+        row = len(self.ids)
+        self.ids.append(db_id)
+        seen = set()
+        for f in self.fields:
+            tids = [self._token_id(t) for t in fields.get(f) or ()]
+            self.flat[f].extend(tids)
+            self.offsets[f].append(len(self.flat[f]))
+            seen.update(tids)
+        for tid in seen:
+            # most tokens (emails, phones, rare names) occur once: a bare int saves an array object each
+            p = self.postings[tid]
+            if p is None:
+                self.postings[tid] = row
+            elif isinstance(p, int):
+                self.postings[tid] = array("i", (p, row))
+            else:
+                p.append(row)
+
+    def df(self, tid: int) -> int:
+        p = self.postings[tid]
+        return 1 if isinstance(p, int) else len(p)
+
+    def _match_tokens(self, query: Iterable[str]) -> Dict[int, float]:
+        matched: Dict[int, float] = {}
+        for q in set(query):
+            tid = self.vocab.get(q)
+            if tid is not None:
+                matched[tid] = 1.0
+            if not _fuzzy(q):
+                continue
+            for t in {t for g in _index_trigrams(q) for t in self.grams.get(g, ())}:
+                if t != tid:
+                    sim = closeness(q, self.tokens[t])
+                    if sim >= MIN_CLOSENESS and sim > matched.get(t, 0.0):
+                        matched[t] = sim
+        return matched
+
+    def search(self, query: Iterable[str], limit: int = 5) -> List[Tuple[int, float, str]]:
+        """[(db id, confidence 0..1, best field)] best first."""
+        matched = self._match_tokens(query)
+        n = len(self.ids)
+        rows: set = set()
+        for tid in sorted(matched, key=self.df):
+            if self.df(tid) > MAX_POSTINGS:
+                break
+            p = self.postings[tid]
+            if isinstance(p, int):
+                rows.add(p)
+            else:
+                rows.update(p)
+        idf: Dict[int, float] = {}
+        scored = []
+        for row in rows:
+            best, best_field = 0.0, None
+            for f in self.fields:
+                tids = self.flat[f][self.offsets[f][row]:self.offsets[f][row + 1]]
+                if not tids:
+                    continue
+                total = covered = 0.0
+                for t in tids:
+                    w = idf.get(t)
+                    if w is None:
+                        w = idf[t] = math.log(1 + n / self.df(t))
+                    total += w
+                    covered += w * matched.get(t, 0.0)
+                if covered / total > best:
+                    best, best_field = covered / total, f
+            if best_field is not None:
+                scored.append((round(best, 3), row, best_field))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [(self.ids[row], conf, field) for conf, row, field in scored[:limit]]
+
+class EntityIndex:
+    def __init__(self, name: str, fields: Sequence[str], load_sql: str, label_sql: str,
+                 row_fields: Callable[[Any], Dict[str, List[str]]], label: Callable[[Any], str]):
+        self.name, self.fields = name, tuple(fields)
+        self.load_sql, self.label_sql = text(load_sql), text(label_sql)
+        self.row_fields, self.label = row_fields, label
+        self.rows = Rows(self.fields)
+        self.lock = asyncio.Lock()
+        self.refreshed_at = self.built_at = 0.0
+
+    async def _load(self, db, rows: Rows) -> None:
+        last_id = rows.ids[-1] if rows.ids else 0
+        while True:
+            batch = (await db.execute(self.load_sql, {"last": last_id, "n": LOAD_BATCH})).all()
+            for r in batch:
+                rows.add(r.id, self.row_fields(r))
+            if len(batch) < LOAD_BATCH:
+                return
+            last_id = batch[-1].id
+            await asyncio.sleep(0)  # a cold load of 1M rows shouldn't starve the event loop
+
+    async def refresh(self, db) -> None:
+        if time.monotonic() - self.refreshed_at < REFRESH_SECONDS:
+            return
+        if self.lock.locked() and self.rows.ids:
+            return  # someone else is refreshing; search what we have
+        async with self.lock:
+            now = time.monotonic()
+            if now - self.refreshed_at < REFRESH_SECONDS:
+                return
+            if now - self.built_at > REBUILD_SECONDS or not self.built_at:
+                rows = Rows(self.fields)
+                await self._load(db, rows)
+                self.rows, self.built_at = rows, time.monotonic()  # swapped in whole: searches never see half an index
+            else:
+                await self._load(db, self.rows)
+            self.refreshed_at = time.monotonic()
+
+    async def resolve(self, db, query: List[str], limit: int = 5) -> List[Dict[str, Any]]:
+        await self.refresh(db)
+        hits = self.rows.search(query, limit)
+        if not hits:
+            return []
+        live = {r.id: r for r in await db.execute(self.label_sql, {"ids": [h[0] for h in hits]})}
+        return [{"id": i, "label": self.label(live[i]), "confidence": conf, "matched": field}
+                for i, conf, field in hits if i in live]
+
+# ---------- the two indexes ----------
+
+def _contact_fields(r) -> Dict[str, List[str]]:
+    return {
+        "name": [] if identity.is_placeholder(r.first_name, r.last_name) else words(f"{r.first_name} {r.last_name}"),
+        "email": [f"e:{r.email_norm}"] if r.email_norm else [],
+        "phone": [f"p:{r.phone_e164}"] if r.phone_e164 else [],
+    }
+
+CONTACTS = EntityIndex(
+    "contacts", ("name", "email", "phone"),
+    "SELECT id, first_name, last_name, email_norm, phone_e164 FROM contacts WHERE id > :last ORDER BY id LIMIT :n",
+    "SELECT id, first_name, last_name, email FROM contacts WHERE id = ANY(:ids)",
+    _contact_fields,
+    lambda r: " ".join(filter(None, [r.first_name, r.last_name])) + (f" <{r.email}>" if r.email else ""),
+)
+
+PROPERTIES = EntityIndex(
+    "properties", ("address",),
+    "SELECT id, address FROM properties WHERE id > :last ORDER BY id LIMIT :n",
+    "SELECT id, address, city FROM properties WHERE id = ANY(:ids)",
+    lambda r: {"address": words(r.address)},
+    lambda r: ", ".join(filter(None, [r.address, r.city])),
+)
+
+# prices ("$500,000", "1.2m") are not street numbers
+MONEY_RE = re.compile(r"\$\s?\d[\d,]*(?:\.\d+)?\s?[km]?\b|\b\d{1,3}(?:,\d{3})+(?:\.\d+)?\b|\b\d+(?:\.\d+)?\s?[km]\b", re.I)
+
+def query_tokens(text_: str, emails: Iterable[str] = (), phones: Iterable[str] = ()) -> List[str]:
+    out = words(MONEY_RE.sub(" ", text_))
+    out += [f"e:{e}" for e in map(identity.normalize_email, emails) if e]
+    out += [f"p:{p}" for p in map(identity.normalize_phone, phones) if p]
+    return out
+
+def pick(candidates: List[Dict[str, Any]]) -> Optional[int]:
+    """The candidate to fill in without asking, if one clearly wins."""
+    if not candidates or candidates[0]["confidence"] < AUTO_CONFIDENCE:
+        return None
+    runner_up = candidates[1]["confidence"] if len(candidates) > 1 else 0.0
+    return candidates[0]["id"] if candidates[0]["confidence"] - runner_up >= AUTO_MARGIN else None
+
+async def resolve(db, text_: str, emails: Iterable[str] = (), phones: Iterable[str] = (), limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+    query = query_tokens(text_, emails, phones)
+    return {
+        "contact": await CONTACTS.resolve(db, query, limit),
+        "property": await PROPERTIES.resolve(db, query, limit),
+    }
+
+async def warm() -> None:
+    from app.db import ReadSessionLocal
+    async with ReadSessionLocal() as db:
+        for index in (CONTACTS, PROPERTIES):
+            await index.refresh(db)
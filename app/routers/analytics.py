@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from app.db import get_read_db
+from app import analytics, models
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+R = models.PipelineRollup
+H = models.PipelineHistory
+BUCKETS = ("day", "week", "month")
+
+def _sum(col):
+    return func.sum(col).cast(col.type)  # sum(bigint) is numeric in Postgres; keep ints as ints
+
+@router.get("/pipeline")
+async def pipeline(
+    side: Optional[str] = Query(None, description="buy | sell | lease"),
+    since: Optional[date] = Query(None, description="only transactions created on/after this day (UTC)"),
+    until: Optional[date] = Query(None, description="only transactions created before this day (UTC)"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Counts and offer/close totals per stage and side, conversion and fallen-through ratios."""
+    if since is None and until is None:
+        stmt = select(R.stage, R.side, R.count, R.offer_count, R.offer_total, R.close_count, R.close_total)
+        if side is not None:
+            stmt = stmt.where(R.side == side)
+    else:
+        # a date window sums the (small) per-day history instead
+        stmt = select(H.stage, H.side, *[_sum(getattr(H, c)).label(c) for c in analytics.SUMS]).group_by(H.stage, H.side)
+        if since is not None:
+            stmt = stmt.where(H.bucket >= since)
+        if until is not None:
+            stmt = stmt.where(H.bucket < until)
+        if side is not None:
+            stmt = stmt.where(H.side == side)
+    rows = (await db.execute(stmt)).all()
+    return {"side": side, "since": since, "until": until, **analytics.summarize(rows)}
+
+@router.get("/pipeline/history")
+async def pipeline_history(
+    bucket: str = Query("week", description="day | week | month"),
+    days: int = Query(90, ge=1, le=3660),
+    side: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Transactions created per bucket, split by their current stage, with cohort conversion."""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {BUCKETS}")
+    start = datetime.now(timezone.utc).date() - timedelta(days=days)  # buckets are UTC days
+    period = func.date_trunc(bucket, H.bucket).label("period")
+    stmt = (
+        select(period, H.stage, _sum(H.count).label("count"), _sum(H.offer_total).label("offer_total"),
+               _sum(H.close_total).label("close_total"))
+        .where(H.bucket >= start)
+        .group_by(period, H.stage)
+        .order_by(period)
+    )
+    if side is not None:
+        stmt = stmt.where(H.side == side)
+    series = {}
+    for r in await db.execute(stmt):
+        point = series.setdefault(r.period, {"period": r.period.date(), "count": 0, "offer_total": 0.0, "close_total": 0.0, "stages": {}})
+        point["count"] += r.count
+        point["offer_total"] += r.offer_total
+        point["close_total"] += r.close_total
+        point["stages"][r.stage] = r.count
+    for point in series.values():
+        closed = point["stages"].get(analytics.CLOSED, 0)
+        fallen = point["stages"].get(analytics.FALLEN_THROUGH, 0)
+        point["conversion_rate"] = analytics.ratio(closed, point["count"])
+        point["fallen_through_ratio"] = analytics.ratio(fallen, closed + fallen)
+    return {"bucket": bucket, "side": side, "series": list(series.values())}
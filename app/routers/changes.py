@@ -0,0 +1,95 @@
+from collections import deque
+from typing import Optional
+import asyncio
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import changes
+from app.db import ReadSessionLocal, get_read_db
+from app.fastjson import dumps
+
+router = APIRouter(prefix="/changes", tags=["Changes"])
+
+HEARTBEAT_SECONDS = 15
+SEEN = 10_000  # recent seqs remembered to drop replay/live overlaps
+
+def _entities(entity: Optional[str]):
+    names = {e.strip() for e in (entity or "").split(",") if e.strip()}
+    unknown = names - set(changes.ENTITIES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown entity {sorted(unknown)}; choose from {list(changes.ENTITIES)}")
+    return names or None
+
+def _sse(event: str, data, seq: Optional[int] = None) -> bytes:
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + dumps(data) + b"\n\n"
+
+@router.get("")
+async def list_changes(
+    after: int = Query(0, ge=0, description="seq of the last event already seen"),
+    limit: int = Query(500, ge=1, le=5000),
+    entity: Optional[str] = Query(None, description="contacts | properties | transactions | documents, comma-separated"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Recorded events after `after`, oldest first: the polling alternative to /changes/stream."""
+    items = await changes.since(db, after, limit, _entities(entity))
+    return {"items": items, "last_seq": items[-1]["seq"] if items else after}
+
+@router.get("/stream")
+async def change_stream(
+    entity: Optional[str] = Query(None, description="contacts | properties | transactions | documents, comma-separated"),
+    after: Optional[int] = Query(None, ge=0, description="replay events after this seq first"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-sent events: `change` events ({seq, entity, op, id, row}; op is insert | update |
+    delete | bulk) with the seq as the event id, so a reconnecting EventSource resumes where it
+    left off. `reset` means too much was missed: reload instead.
+    """
+    entities = _entities(entity)
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+    sub = changes.hub.subscribe()  # before replaying, so nothing committed in between is missed
+
+    async def body():
+        seen: deque = deque(maxlen=SEEN)
+        seen_set = set()
+
+        def fresh(event) -> bool:
+            if event["seq"] in seen_set:
+                return False
+            if len(seen) == seen.maxlen:
+                seen_set.discard(seen[0])
+            seen.append(event["seq"])
+            seen_set.add(event["seq"])
+            return entities is None or event["entity"] in entities
+
+        try:
+            yield b"retry: 3000\n\n"
+            if after is not None:
+                # from a little before `after`: events below it may have committed after it was sent
+                start = max(after - changes.RESUME_OVERLAP, 0)
+                async with ReadSessionLocal() as db:
+                    span = await changes.bounds(db)
+                    backlog = await changes.since(db, start, changes.REPLAY_MAX + changes.RESUME_OVERLAP + 1, entities)
+                if len(backlog) > changes.REPLAY_MAX + changes.RESUME_OVERLAP or (after and span["first"] > after + 1):
+                    yield _sse("reset", {"last_seq": span["last"]}, span["last"])
+                else:
+                    for event in backlog:
+                        if fresh(event):
+                            yield _sse("change", event, event["seq"])
+            while not sub.dropped:
+                try:
+                    event = await asyncio.wait_for(sub.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if fresh(event):
+                    yield _sse("change", event, event["seq"])
+        finally:
+            changes.hub.unsubscribe(sub)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type="text/event-stream", headers=headers)
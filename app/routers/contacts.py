@@ -1,24 +1,63 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app.db import SessionLocal
-from app import models, schemas
+from app.db import get_db, get_read_db
+from app import changes, dedupe, jobs, models, schemas
+from app.cache import bump
+from app.expand import expanded_items, parse_expand
+from app.fastjson import fast_list, out_columns
+from app.pagination import paginate, page_of
 
 router = APIRouter(prefix="/contacts", tags=["Contacts"])
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+# Sortable columns; each one is backed by a (column, id) index
+SORTS = {"id": models.Contact.id, "last_name": models.Contact.last_name, "status": models.Contact.status}
+# Plain columns for ?format=fast|ndjson|jsonarray (app/fastjson.py)
+FAST_COLUMNS = out_columns(models.Contact, schemas.ContactOut)
 
 @router.post("/", response_model=schemas.ContactOut)
 async def create_contact(contact: schemas.ContactCreate, db: AsyncSession = Depends(get_db)):
     new_contact = models.Contact(**contact.dict())
     db.add(new_contact)
+    await db.flush()
+    await changes.record(db, "contacts", "insert", [new_contact.id])
+    await jobs.enqueue(db, "dedupe", key="dedupe")  # score it against existing contacts in the background
     await db.commit()
     await db.refresh(new_contact)
+    await bump("contacts")
     return new_contact
 
-@router.get("/", response_model=list[schemas.ContactOut])
-async def list_contacts(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(models.Contact))
-    return res.scalars().all()
+@router.get("/lookup")
+async def lookup_contacts(
+    email: Optional[str] = None,
+    phone: Optional[str] = Query(None, description="any format; compared as E.164"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Does this caller already exist? Exact match on normalized email or phone, via their indexes."""
+    if not email and not phone:
+        raise HTTPException(status_code=400, detail="pass email and/or phone")
+    return await dedupe.lookup(db, email, phone)
+
+@router.get("/", response_model=schemas.Page[schemas.ContactExpanded], response_model_exclude_unset=True)
+async def list_contacts(
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort: str = Query("id", description="id | last_name | status, prefix with - for descending"),
+    status: Optional[str] = None,
+    format: Optional[str] = Query(None, description="fast | ndjson | jsonarray: skip schema validation; the last two stream all rows"),
+    expand: Optional[str] = Query(None, description="transactions | documents, comma-separated: inline related rows"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(models.Contact) if format is None else select(*FAST_COLUMNS)
+    if status is not None:
+        stmt = stmt.where(models.Contact.status == status)
+    names = parse_expand(models.Contact, expand)
+    if format is not None:
+        if names:
+            raise HTTPException(status_code=400, detail="expand is not supported with format")
+        return await fast_list(db, stmt, models.Contact.id, SORTS, sort=sort, after=after, limit=limit, format=format)
+    stmt = paginate(stmt, models.Contact.id, SORTS, sort=sort, after=after, limit=limit)
+    rows = (await db.execute(stmt)).scalars().all()
+    items, next_cursor = page_of(rows, SORTS, sort=sort, limit=limit)
+    return {"items": await expanded_items(db, models.Contact, schemas.ContactOut, items, names), "next_cursor": next_cursor}
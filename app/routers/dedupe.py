@@ -0,0 +1,79 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text, update
+from app.db import get_db, get_read_db
+from app import dedupe, models, schemas
+from app.cache import bump
+from app.fastjson import out_columns
+from app.pagination import paginate, page_of
+
+router = APIRouter(prefix="/dedupe", tags=["Dedupe"])
+
+C = models.DedupeCandidate
+SORTS = {"score": C.score, "id": C.id}
+CONTACT_COLUMNS = out_columns(models.Contact, schemas.ContactOut)
+
+class MergeRequest(BaseModel):
+    keep_id: int
+    merge_ids: List[int]
+
+@router.get("/candidates")
+async def list_candidates(
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    min_score: float = Query(0.0, ge=0, le=1),
+    status: str = Query("open", description="open | dismissed"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Likely duplicate pairs, best first, each with both contacts inlined."""
+    stmt = select(C).where(C.status == status)
+    if min_score:
+        stmt = stmt.where(C.score >= min_score)
+    stmt = paginate(stmt, C.id, SORTS, sort="-score", after=after, limit=limit)
+    rows, next_cursor = page_of((await db.execute(stmt)).scalars().all(), SORTS, sort="-score", limit=limit)
+    ids = list({i for r in rows for i in (r.a_id, r.b_id)})
+    people = {}
+    if ids:
+        for p in await db.execute(select(*CONTACT_COLUMNS).where(models.Contact.id.in_(ids))):
+            people[p.id] = dict(p._mapping)
+    items = [
+        {"id": r.id, "score": r.score, "reasons": r.reasons, "status": r.status, "a": people.get(r.a_id), "b": people.get(r.b_id)}
+        for r in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.post("/candidates/{candidate_id}/dismiss")
+async def dismiss_candidate(candidate_id: int, db: AsyncSession = Depends(get_db)):
+    """Not the same person: the pair stays dismissed even if the job rescores it."""
+    res = await db.execute(update(C).where(C.id == candidate_id).values(status="dismissed"))
+    if not res.rowcount:
+        raise HTTPException(status_code=404, detail="candidate not found")
+    await db.commit()
+    return {"id": candidate_id, "status": "dismissed"}
+
+@router.post("/merge")
+async def merge_contacts(req: MergeRequest, db: AsyncSession = Depends(get_db)):
+    """Fold merge_ids into keep_id; their transactions and documents move to keep_id."""
+    result = await dedupe.merge(db, req.keep_id, req.merge_ids)
+    await bump("contacts", "transactions", "documents")
+    return result
+
+@router.post("/run")
+async def run_dedupe(batch_size: int = Query(1000, ge=1, le=10000), db: AsyncSession = Depends(get_db)):
+    """Process one batch of new contacts now (the CLI job does the same in a loop)."""
+    return await dedupe.run_batch(db, batch_size)
+
+@router.get("/status")
+async def dedupe_status(db: AsyncSession = Depends(get_read_db)):
+    row = (await db.execute(text(
+        "SELECT (SELECT last_contact_id FROM dedupe_state WHERE id = 1) AS last_contact_id, "
+        "(SELECT max(id) FROM contacts) AS max_contact_id, "
+        "(SELECT count(*) FROM dedupe_candidates WHERE status = 'open') AS open_candidates"
+    ))).one()
+    return {
+        "last_contact_id": row.last_contact_id or 0,
+        "pending_contacts": max((row.max_contact_id or 0) - (row.last_contact_id or 0), 0),
+        "open_candidates": row.open_candidates,
+    }
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Header, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
 from typing import Optional
 import base64
 import json
 
-from app.db import SessionLocal
-from app import models
+from app.db import get_db, get_read_db
+from app import blobs, changes, jobs, models, schemas
+from app.cache import bump
+from app.pagination import paginate, page_of
+from app.storage import CHUNK_SIZE, get_store, parse_range
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+D = models.Document
+# Everything a listing needs; attrs is deliberately left out
+META_COLUMNS = (D.id, D.filename, D.mime_type, D.size, D.sha256, D.created_at, D.contact_id, D.property_id, D.transaction_id)
+SORTS = {"id": D.id, "created_at": D.created_at}
 
 def _safe_json(s: Optional[str]) -> dict:
     if not s:
@@ -23,76 +28,176 @@ def _safe_json(s: Optional[str]) -> dict:
     except Exception:
         raise HTTPException(status_code=400, detail="attrs must be valid JSON")
 
-@router.post("/upload")
+async def _read_chunks(file: UploadFile):
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+def _doc_out(d) -> dict:
+    return {
+        "id": d.id,
+        "filename": d.filename,
+        "mime_type": d.mime_type,
+        "size": d.size,
+        "sha256": d.sha256,
+        "created_at": d.created_at,
+        "contact_id": d.contact_id,
+        "property_id": d.property_id,
+        "transaction_id": d.transaction_id,
+        "download_url": f"/documents/{d.id}/download"
+    }
+
+@router.post("/upload", response_model=schemas.DocumentOut)
 async def upload_document(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    sha256: Optional[str] = Form(None, description="hex digest of the content; without a file, attaches a blob already stored"),
+    filename: Optional[str] = Form(None, description="defaults to the uploaded file's name"),
+    mime_type: Optional[str] = Form(None),
     contact_id: Optional[int] = Form(None),
     property_id: Optional[int] = Form(None),
     transaction_id: Optional[int] = Form(None),
     attrs: Optional[str] = Form(None),
     db: AsyncSession = Depends(get_db),
 ):
-    # Read file bytes
-    content = await file.read()
-    data_b64 = base64.b64encode(content).decode("utf-8")
+    """
+    Identical content is stored once (app/blobs.py). A client that knows the SHA-256 can send it
+    without the file: when the blob is already stored, the document is created without any upload.
+    """
     meta = _safe_json(attrs)
-    meta.update({
-        "data_b64": data_b64,           # store file bytes in DB (base64)
-        "size": len(content)
-    })
+    sha256 = sha256.lower() if sha256 else None
+    if file is not None:
+        # Stream file bytes through the hasher; they are only written to the store if it lacks them
+        blob = await blobs.store_stream(_read_chunks(file))
+        if sha256 and sha256 != blob.key:
+            raise HTTPException(status_code=400, detail=f"content hashes to {blob.key}, not {sha256}")
+        key, size = blob.key, blob.size
+    elif sha256:
+        key, size = sha256, await blobs.lookup(db, sha256)
+        if size is None:
+            raise HTTPException(status_code=404, detail="no stored content with this sha256; upload the file")
+    else:
+        raise HTTPException(status_code=400, detail="send a file, or the sha256 of one already uploaded")
+    name = filename or (file.filename if file is not None else None)
+    if not name:
+        raise HTTPException(status_code=400, detail="filename is required")
+    return await create_document(
+        db, key, size, filename=name,
+        mime_type=mime_type or (file.content_type if file is not None else None),
+        contact_id=contact_id, property_id=property_id, transaction_id=transaction_id, attrs=meta,
+    )
 
+async def check_targets(db: AsyncSession, contact_id: Optional[int], property_id: Optional[int],
+                        transaction_id: Optional[int]) -> None:
+    """409 when a contact/property/transaction_id to attach to names a row that doesn't exist."""
+    targets = (("contact", models.Contact, contact_id), ("property", models.Property, property_id),
+               ("transaction", models.Transaction, transaction_id))
+    for label, model, target_id in targets:
+        if target_id is not None and (await db.execute(select(model.id).where(model.id == target_id))).first() is None:
+            raise HTTPException(status_code=409, detail=f"{label} {target_id} to attach to does not exist")
+
+async def create_document(db: AsyncSession, key: str, size: int, *, filename: str, mime_type: Optional[str],
+                          contact_id: Optional[int], property_id: Optional[int], transaction_id: Optional[int],
+                          attrs: dict) -> dict:
+    """Insert a document for stored blob `key`, taking a reference on it; shared with /uploads."""
     doc = models.Document(
-        filename=file.filename,
-        mime_type=file.content_type or "application/octet-stream",
+        filename=filename,
+        mime_type=mime_type or "application/octet-stream",
         contact_id=contact_id,
         property_id=property_id,
         transaction_id=transaction_id,
-        attrs=meta,
+        size=size,
+        sha256=key,
+        attrs=attrs,
         url=None,  # not used in this beta
     )
+    try:
+        await blobs.reference(db, key)
+    except blobs.BlobGone:
+        raise HTTPException(status_code=409, detail="the stored content was just garbage-collected; upload the file again")
     db.add(doc)
+    try:
+        await db.flush()
+    except IntegrityError:  # contact/property/transaction_id names a row that doesn't exist (any more)
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="the contact, property or transaction to attach to does not exist")
+    await changes.record(db, "documents", "insert", [doc.id])
+    # verify the stored bytes and extract their text off the request path (app/tasks.py)
+    await jobs.enqueue(db, "documents.process", {"id": doc.id}, key=f"documents.process:{doc.id}")
     await db.commit()
     await db.refresh(doc)
-    return {
-        "id": doc.id,
-        "filename": doc.filename,
-        "mime_type": doc.mime_type,
-        "size": doc.attrs.get("size"),
-        "contact_id": doc.contact_id,
-        "property_id": doc.property_id,
-        "transaction_id": doc.transaction_id,
-        "download_url": f"/documents/{doc.id}/download"
-    }
+    await bump("documents")
+    return _doc_out(doc)
 
-@router.get("/")
-async def list_documents(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(models.Document))
-    docs = res.scalars().all()
-    out = []
-    for d in docs:
-        out.append({
-            "id": d.id,
-            "filename": d.filename,
-            "mime_type": d.mime_type,
-            "size": (d.attrs or {}).get("size"),
-            "contact_id": d.contact_id,
-            "property_id": d.property_id,
-            "transaction_id": d.transaction_id,
-            "download_url": f"/documents/{d.id}/download"
-        })
-    return out
+@router.delete("/{doc_id}")
+async def delete_document(doc_id: int, db: AsyncSession = Depends(get_db)):
+    """The content is removed from storage once no document uses it (after a grace period)."""
+    row = (await db.execute(delete(D).where(D.id == doc_id).returning(D.sha256))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if row.sha256:
+        await blobs.release(db, [row.sha256])
+        await jobs.enqueue(db, "blobs.gc", key="blobs.gc", delay=blobs.GRACE_HOURS * 3600)
+    await changes.record(db, "documents", "delete", [doc_id])
+    await db.commit()
+    await bump("documents")
+    return {"id": doc_id, "deleted": True}
+
+@router.get("/", response_model=schemas.Page[schemas.DocumentOut])
+async def list_documents(
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort: str = Query("id", description="id | created_at, prefix with - for descending"),
+    contact_id: Optional[int] = None,
+    property_id: Optional[int] = None,
+    transaction_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    # Projection only: the row data never includes attrs (or any legacy payload inside it)
+    stmt = select(*META_COLUMNS)
+    if contact_id is not None:
+        stmt = stmt.where(D.contact_id == contact_id)
+    if property_id is not None:
+        stmt = stmt.where(D.property_id == property_id)
+    if transaction_id is not None:
+        stmt = stmt.where(D.transaction_id == transaction_id)
+    stmt = paginate(stmt, D.id, SORTS, sort=sort, after=after, limit=limit)
+    rows = (await db.execute(stmt)).all()
+    items, next_cursor = page_of(rows, SORTS, sort=sort, limit=limit)
+    return {"items": [_doc_out(r) for r in items], "next_cursor": next_cursor}
 
 @router.get("/{doc_id}/download")
-async def download_document(doc_id: int, db: AsyncSession = Depends(get_db)):
-    doc = (await db.execute(select(models.Document).where(models.Document.id == doc_id))).scalars().first()
+async def download_document(doc_id: int, range: Optional[str] = Header(None), db: AsyncSession = Depends(get_read_db)):
+    doc = (await db.execute(select(D.filename, D.mime_type, D.sha256).where(D.id == doc_id))).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    data_b64 = (doc.attrs or {}).get("data_b64")
-    if not data_b64:
-        raise HTTPException(status_code=400, detail="No file content stored")
-    raw = base64.b64decode(data_b64.encode("utf-8"))
-    return StreamingResponse(
-        iter([raw]),
-        media_type=doc.mime_type or "application/octet-stream",
-        headers={"Content-Disposition": f'attachment; filename="{doc.filename}"'}
-    )
+    headers = {"Content-Disposition": f'attachment; filename="{doc.filename}"', "Accept-Ranges": "bytes"}
+    media_type = doc.mime_type or "application/octet-stream"
+
+    key = doc.sha256
+    if not key:
+        # Rows not yet moved out by `python -m app.cli migrate-blobs`
+        data_b64 = (await db.execute(select(D.attrs["data_b64"].astext).where(D.id == doc_id))).scalar()
+        if not data_b64:
+            raise HTTPException(status_code=400, detail="No file content stored")
+        raw = base64.b64decode(data_b64.encode("utf-8"))
+        return StreamingResponse(iter([raw]), media_type=media_type, headers=headers)
+
+    store = get_store()
+    size = await store.size(key)
+    if size is None:
+        raise HTTPException(status_code=404, detail="File content missing from storage")
+    try:
+        byte_range = parse_range(range, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        body = store.read_range(key, 0, size - 1) if size else iter([b""])
+        return StreamingResponse(body, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(store.read_range(key, start, end), status_code=206, media_type=media_type, headers=headers)
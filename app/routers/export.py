@@ -0,0 +1,37 @@
+from typing import List, Optional
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import get_read_db
+from app.export import Export
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+@router.get("/{entity}")
+async def export_entity(
+    entity: str,
+    format: str = Query("csv", description="csv | ndjson | arrow (Arrow IPC stream; needs pyarrow)"),
+    where: Optional[str] = Query(None, description='filter as JSON, same language as /search/query, e.g. {"field": "status", "op": "eq", "value": "lead"}'),
+    flatten: bool = Query(False, description="attrs keys as their own attrs.<key> columns"),
+    attrs: List[str] = Query([], description="only these attrs keys (implies flatten; skips discovering them)"),
+    gzip: bool = Query(False, description="gzip the output on the fly"),
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Every matching row, streamed from a server-side cursor in constant memory, e.g.
+    `curl -o contacts.csv.gz '/export/contacts?flatten=true&gzip=true'`.
+    """
+    try:
+        filters = json.loads(where) if where else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="where must be a JSON filter")
+    try:
+        export = await Export(entity, format, filters, flatten=flatten, attrs=attrs, compress=gzip, limit=limit).prepare(db)
+    except ValueError as e:  # ExportError and QueryError
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"Content-Disposition": f'attachment; filename="{export.filename}"'}
+    return StreamingResponse(export.chunks(), media_type=export.media_type, headers=headers)
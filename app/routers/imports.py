@@ -0,0 +1,55 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import json
+import tempfile
+
+from app.importer import ENTITIES, FORMATS, import_file
+
+router = APIRouter(prefix="/import", tags=["Import"])
+
+CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+def _rename(pairs: List[str]) -> dict:
+    out = {}
+    for pair in pairs:
+        src, sep, dest = pair.partition(":")
+        if not sep or not dest:
+            raise HTTPException(status_code=400, detail=f"map entries look like 'Source Column:field', got {pair!r}")
+        out[src] = dest
+    return out
+
+@router.post("/{entity}")
+async def import_entity(
+    entity: str,
+    request: Request,
+    format: Optional[str] = Query(None, description="csv | ndjson (default: from Content-Type)"),
+    batch_size: int = Query(5000, ge=100, le=100_000),
+    map: List[str] = Query([], description="rename a source column, e.g. 'First Name:first_name'"),
+):
+    """
+    Send the file as the raw request body, e.g.
+    `curl --data-binary @contacts.csv -H 'Content-Type: text/csv' /import/contacts`.
+    Responds with NDJSON: one progress line per batch, then a summary line.
+    """
+    if entity not in ENTITIES:
+        raise HTTPException(status_code=404, detail=f"unknown entity; choose from {sorted(ENTITIES)}")
+    fmt = format or CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {FORMATS}")
+    rename = _rename(map)
+
+    # Spool the body to disk in chunks; parsing then streams from the file at its own pace
+    spool = tempfile.TemporaryFile()
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    async def progress():
+        try:
+            async for event in import_file(spool, entity, fmt, batch_size=batch_size, rename=rename):
+                yield json.dumps(event, default=str) + "\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
@@ -1,19 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+import json
 import re
+import time
 
-from app.db import SessionLocal
+from app.db import SessionLocal, get_db, get_read_db
+from app.cache import bump
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app import models
+from app import analytics, changes, dedupe, jobs, models, resolver
 
 router = APIRouter(prefix="/ingest", tags=["Ingest"])
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
-
 # ---------- Helpers ----------
 
 EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
@@ -21,11 +23,19 @@ PHONE_RE = re.compile(r"\b(?:\+?\d{1,3}[ -]?)?(?:\(?\d{3}\)?[ -]?)?\d{3}[ -]?\d{
 MONEY_RE = re.compile(r"\b(\$?\s?\d[\d,]*\.?\d*)\b")
 BEDS_RE = re.compile(r"\b(\d+)\s*bed", re.I)
 BATHS_RE = re.compile(r"\b(\d+)\s*bath", re.I)
+STREET_NUMBER_RE = re.compile(r"\b\d{1,5}\s+\w+")
+# lowercase-only twins of BEDS_RE/BATHS_RE, run on the already-lowered text
+_BEDS_LOWER_RE = re.compile(r"\b(\d+)\s*bed")
+_BATHS_LOWER_RE = re.compile(r"\b(\d+)\s*bath")
+_DIGIT_RE = re.compile(r"\d")
 ADDRESS_HINTS = [" st", " ave", " rd", " blvd", "street", "avenue", "road", "drive", "lane", "court", "unit", "apt", "suite"]
+BUY_SELL_WORDS = ["buy", "sell", "lease", "offer", "close", "offer price", "closing"]
+
+def _address_hint(lower: str) -> bool:
+    return any(h in lower for h in ADDRESS_HINTS) or bool(STREET_NUMBER_RE.search(lower))
 
 def looks_like_address(text: str) -> bool:
-    t = text.lower()
-    return any(h in t for h in ADDRESS_HINTS) or bool(re.search(r"\b\d{1,5}\s+\w+", t))
+    return _address_hint(text.lower())
 
 def extract_money(text: str) -> Optional[float]:
     m = MONEY_RE.search(text.replace(",", ""))
@@ -37,88 +47,150 @@ def extract_money(text: str) -> Optional[float]:
     except:
         return None
 
+class Features(NamedTuple):
+    """Everything guess_entity looks at, computed once per text."""
+    text: str
+    lower: str
+    email: Optional[str]
+    phone: Optional[str]
+    is_address: bool
+    has_buy_sell: bool
+    price: Optional[float]
+    beds: Optional[int]
+    baths: Optional[int]
+
+def extract_features(text: str) -> Features:
+    t = text.strip()
+    lower = t.lower()
+    has_buy_sell = any(w in lower for w in BUY_SELL_WORDS)
+    email = EMAIL_RE.search(t) if "@" in t else None
+    if not _DIGIT_RE.search(t):
+        # phone, money, bed/bath and street-number patterns all need a digit
+        is_address = any(h in lower for h in ADDRESS_HINTS)
+        return Features(t, lower, email.group(0) if email else None, None, is_address, has_buy_sell, None, None, None)
+    phone = PHONE_RE.search(t)
+    beds = _BEDS_LOWER_RE.search(lower)
+    baths = _BATHS_LOWER_RE.search(lower)
+    return Features(
+        t,
+        lower,
+        email.group(0) if email else None,
+        phone.group(0) if phone else None,
+        _address_hint(lower),
+        has_buy_sell,
+        extract_money(t),
+        int(beds.group(1)) if beds else None,
+        int(baths.group(1)) if baths else None,
+    )
+
+def _transaction_draft(lower: str, t: str, price: Optional[float]) -> Dict[str, Any]:
+    side = "buy" if "buy" in lower else ("sell" if "sell" in lower else ("lease" if "lease" in lower else "buy"))
+    return {
+        "type": "transaction",
+        "contact_id": None,
+        "property_id": None,
+        "side": side,
+        "stage": "lead",
+        "offer_price": price if ("offer" in lower and price) else None,
+        "close_price": price if ("close" in lower and price) else None,
+        "attrs": {"note": t}
+    }
+
 def guess_entity(text: str) -> Tuple[str, Dict[str, Any]]:
     """
     Returns (entity_guess, draft_payload)
     entity_guess in {"contact","property","transaction","unknown"}
     draft_payload holds fields we think we saw, plus attrs with original text.
     """
-    t = text.strip()
-
-    # Signals
-    has_email = bool(EMAIL_RE.search(t))
-    has_phone = bool(PHONE_RE.search(t))
-    has_buy_sell = any(w in t.lower() for w in ["buy", "sell", "lease", "offer", "close", "offer price", "closing"])
-    is_address = looks_like_address(t)
-    price = extract_money(t)
-    beds = BEDS_RE.search(t)
-    baths = BATHS_RE.search(t)
+    f = extract_features(text)
+    t, lower, price = f.text, f.lower, f.price
 
     # CONTACT: name/email/phone/status words
-    if ("contact" in t.lower()) or has_email or has_phone:
+    if ("contact" in lower) or f.email or f.phone:
         draft = {
             "type": "contact",
             "first_name": None,
             "last_name": None,
-            "email": EMAIL_RE.search(t).group(0) if has_email else None,
-            "phone": PHONE_RE.search(t).group(0) if has_phone else None,
+            "email": f.email,
+            "phone": f.phone,
             "status": None,
             "attrs": {"note": t}
         }
         return "contact", draft
 
+    # TRANSACTION about a specific place ("offer on 12 Main St"): the address names the property, not a new one
+    if f.has_buy_sell and f.is_address and f.beds is None and f.baths is None:
+        return "transaction", _transaction_draft(lower, t, price)
+
     # PROPERTY: address hints or bed/bath or price
-    if ("property" in t.lower()) or is_address or beds or baths:
+    if ("property" in lower) or f.is_address or f.beds is not None or f.baths is not None:
         draft = {
             "type": "property",
-            "address": t if is_address else None,
+            "address": t if f.is_address else None,
             "city": None,
             "state_province": None,
             "country": "Canada",
             "status": "prospect",
             "attrs": {}
         }
-        if beds:
-            draft["attrs"]["bed"] = int(beds.group(1))
-        if baths:
-            draft["attrs"]["bath"] = int(baths.group(1))
+        if f.beds is not None:
+            draft["attrs"]["bed"] = f.beds
+        if f.baths is not None:
+            draft["attrs"]["bath"] = f.baths
         if price:
             draft["attrs"]["list_price"] = price
-        if not is_address:
+        if not f.is_address:
             draft["attrs"]["note"] = t
         return "property", draft
 
     # TRANSACTION: buy/sell/lease/offer/close + maybe price
-    if ("transaction" in t.lower()) or has_buy_sell:
-        side = "buy" if "buy" in t.lower() else ("sell" if "sell" in t.lower() else ("lease" if "lease" in t.lower() else "buy"))
-        draft = {
-            "type": "transaction",
-            "contact_id": None,
-            "property_id": None,
-            "side": side,
-            "stage": "lead",
-            "offer_price": price if ("offer" in t.lower() and price) else None,
-            "close_price": price if ("close" in t.lower() and price) else None,
-            "attrs": {"note": t}
-        }
-        return "transaction", draft
+    if ("transaction" in lower) or f.has_buy_sell:
+        return "transaction", _transaction_draft(lower, t, price)
 
     # Unknown → ask
     return "unknown", {"type": "unknown", "attrs": {"note": t}}
 
+def _draft_line(index: int, item: Any) -> Tuple[str, bool]:
+    """One NDJSON output line for a batch item (a string or {"text": ..., "id": ...})."""
+    ref = None
+    if isinstance(item, dict):
+        ref, item = item.get("id"), item.get("text")
+    if not isinstance(item, str):
+        return json.dumps({"index": index, "id": ref, "error": 'expected a string or {"text": ...}'}), False
+    kind, draft = guess_entity(item)
+    return json.dumps({"index": index, "id": ref, "entity": kind, "draft": draft}), True
+
+def _classify_lines(lines: List[bytes], start: int, raw_text: bool) -> Tuple[List[str], int]:
+    out, errors = [], 0
+    for n, line in enumerate(lines, start):
+        if raw_text:
+            item = line.decode("utf-8", "replace")
+        else:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                out.append(json.dumps({"index": n, "error": "invalid JSON line"}))
+                errors += 1
+                continue
+        encoded, ok = _draft_line(n, item)
+        out.append(encoded)
+        errors += not ok
+    return out, errors
+
 # ---------- Schemas ----------
 
 class IngestRequest(BaseModel):
     text: str
+    auto: bool = False  # save right away when nothing needs asking (a transaction whose contact and property resolved)
 
 class ConfirmRequest(BaseModel):
-    choice: str  # "contact" | "property" | "transaction"
+    choice: str  # "contact" | "property" | "transaction" | "attach" (draft.contact_id)
     draft: Dict[str, Any]
 
 # ---------- Endpoints ----------
 
 @router.post("")
-async def ingest(req: IngestRequest, db: AsyncSession = Depends(get_db)):
+async def ingest(req: IngestRequest, db: AsyncSession = Depends(get_read_db)):
     kind, draft = guess_entity(req.text)
 
     if kind == "unknown":
@@ -129,14 +201,43 @@ async def ingest(req: IngestRequest, db: AsyncSession = Depends(get_db)):
             "draft": draft,
         }
 
-    # If we have a strong guess, but missing required IDs for a transaction, ask.
+    # Transactions: find the contact and property the text talks about (app/resolver.py)
     if kind == "transaction":
-        if draft.get("contact_id") is None or draft.get("property_id") is None:
+        candidates = await resolver.resolve(db, req.text, EMAIL_RE.findall(req.text), PHONE_RE.findall(req.text))
+        draft["contact_id"] = resolver.pick(candidates["contact"])
+        draft["property_id"] = resolver.pick(candidates["property"])
+        if draft["contact_id"] is None or draft["property_id"] is None:
             return {
                 "status": "ask",
-                "question": "I think this is a transaction. Please provide contact_id and property_id, or pick a different type.",
+                "question": "I think this is a transaction. Pick the contact and property, or a different type.",
                 "options": ["contact", "property", "transaction"],
                 "draft": draft,
+                "candidates": candidates,
+            }
+        if req.auto:
+            async with SessionLocal() as wdb:
+                return {**await _create_transaction(wdb, draft), "candidates": candidates}
+        contact, prop = candidates["contact"][0]["label"], candidates["property"][0]["label"]
+        return {
+            "status": "ask",
+            "question": f"Save this {draft['side']} transaction for {contact} at {prop}?",
+            "options": ["transaction", "cancel"],
+            "draft": draft,
+            "candidates": candidates,
+        }
+
+    # A contact we already have: offer to attach the note to them instead of creating another
+    if kind == "contact" and (draft.get("email") or draft.get("phone")):
+        found = await dedupe.lookup(db, draft.get("email"), draft.get("phone"), limit=5)
+        if found["matches"]:
+            best = found["matches"][0]
+            draft["contact_id"] = best["id"]
+            return {
+                "status": "ask",
+                "question": f"This matches {best['first_name']} {best['last_name']} (#{best['id']}) by {' and '.join(best['matched'])}. Attach it to them?",
+                "options": ["attach", "contact", "cancel"],
+                "draft": draft,
+                "matches": found["matches"],
             }
 
     # If contact/property drafts are too empty, ask for confirmation.
@@ -151,6 +252,95 @@ async def ingest(req: IngestRequest, db: AsyncSession = Depends(get_db)):
     # Fallback (shouldn’t hit)
     return {"status": "ask", "question": "Not sure. Choose a type.", "options": ["contact","property","transaction"], "draft": draft}
 
+class _DuplexResponse(StreamingResponse):
+    """
+    A StreamingResponse that may read the request body while it streams. Starlette's would
+    watch `receive` for a disconnect and swallow body messages; here request.stream() sees a
+    disconnect itself.
+    """
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+BATCH_ITEMS = 500  # JSON bodies are classified and sent in slices of this many items
+
+@router.post("/batch")
+async def ingest_batch(request: Request):
+    """
+    Classify many texts in one pass; nothing is saved. Accepts
+      - application/json: a list of texts, or {"texts": [...]}; items may be {"text": ..., "id": ...}
+      - application/x-ndjson: one JSON string or {"text": ..., "id": ...} per line
+      - text/plain: one text per line (e.g. a transcript export)
+    and streams back NDJSON drafts in input order as they are classified, then a {"stats": ...}
+    line with throughput.
+    """
+    started = time.perf_counter()
+    ctype = request.headers.get("content-type", "").split(";")[0].strip()
+    totals = {"count": 0, "errors": 0, "bytes": 0}
+
+    async def stream_lines():
+        # classify each chunk's complete lines as they arrive, off the event loop
+        raw_text = ctype == "text/plain"
+        tail = b""
+        try:
+            async for chunk in request.stream():
+                totals["bytes"] += len(chunk)
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()
+                lines = [l for l in lines if l.strip()]
+                if lines:
+                    encoded, bad = await run_in_threadpool(_classify_lines, lines, totals["count"], raw_text)
+                    totals["count"] += len(lines)
+                    totals["errors"] += bad
+                    yield encoded
+        except ClientDisconnect:
+            return
+        if tail.strip():
+            encoded, bad = _classify_lines([tail], totals["count"], raw_text)
+            totals["count"] += 1
+            totals["errors"] += bad
+            yield encoded
+
+    async def json_lines(items: List[Any]):
+        def classify(start: int) -> List[Tuple[str, bool]]:
+            return [_draft_line(n, item) for n, item in enumerate(items[start:start + BATCH_ITEMS], start)]
+        for start in range(0, len(items), BATCH_ITEMS):
+            drafts = await run_in_threadpool(classify, start)
+            totals["count"] += len(drafts)
+            totals["errors"] += sum(not ok for _, ok in drafts)
+            yield [encoded for encoded, _ in drafts]
+
+    if ctype in ("application/x-ndjson", "application/jsonl", "text/plain"):
+        batches = stream_lines()
+    else:
+        body = await request.body()
+        totals["bytes"] = len(body)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="body must be JSON, NDJSON or text/plain")
+        items = payload.get("texts") if isinstance(payload, dict) else payload
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail='expected a list of texts or {"texts": [...]}')
+        batches = json_lines(items)
+
+    async def body():
+        async for encoded in batches:
+            yield "".join(line + "\n" for line in encoded)
+        elapsed = time.perf_counter() - started
+        count, size = totals["count"], totals["bytes"]
+        yield json.dumps({"stats": {
+            "count": count,
+            "errors": totals["errors"],
+            "bytes": size,
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "texts_per_sec": round(count / elapsed, 1) if elapsed else None,
+            "mb_per_sec": round(size / elapsed / 1e6, 3) if elapsed else None,
+        }}) + "\n"
+
+    return _DuplexResponse(body(), media_type="application/x-ndjson")
+
 @router.post("/confirm")
 async def confirm(req: ConfirmRequest, db: AsyncSession = Depends(get_db)):
     choice = req.choice.lower().strip()
@@ -174,10 +364,40 @@ async def confirm(req: ConfirmRequest, db: AsyncSession = Depends(get_db)):
             attrs=draft.get("attrs") or {}
         )
         db.add(c)
+        await db.flush()
+        await changes.record(db, "contacts", "insert", [c.id])
+        await jobs.enqueue(db, "dedupe", key="dedupe")
         await db.commit()
         await db.refresh(c)
+        await bump("contacts")
         return {"status": "created", "entity": "contact", "id": c.id}
 
+    if choice == "attach":
+        # add the note to an existing contact, filling in an email/phone it doesn't have yet
+        contact_id = draft.get("contact_id")
+        c = await db.get(models.Contact, contact_id, with_for_update=True) if contact_id else None
+        if c is None:
+            raise HTTPException(status_code=400, detail="attach requires the contact_id of an existing contact")
+        rekey = False
+        if not c.email and draft.get("email"):
+            c.email = draft["email"]
+            rekey = True
+        if not c.phone and draft.get("phone"):
+            c.phone = draft["phone"]
+            rekey = True
+        note = (draft.get("attrs") or {}).get("note")
+        if note:
+            notes = (c.attrs or {}).get("notes") or []
+            notes = notes if isinstance(notes, list) else [notes]  # a single note kept as a string
+            c.attrs = {**(c.attrs or {}), "notes": notes + [note]}
+        await db.flush()
+        if rekey:  # a new identity for the dedupe blocks, which the id watermark won't revisit
+            await dedupe.rekey(db, c.id)
+        await changes.record(db, "contacts", "update", [c.id])
+        await db.commit()
+        await bump("contacts")
+        return {"status": "attached", "entity": "contact", "id": c.id}
+
     if choice == "property":
         addr = draft.get("address") or "Unknown address"
         p = models.Property(
@@ -189,27 +409,37 @@ async def confirm(req: ConfirmRequest, db: AsyncSession = Depends(get_db)):
             attrs=draft.get("attrs") or {}
         )
         db.add(p)
+        await db.flush()
+        await changes.record(db, "properties", "insert", [p.id])
         await db.commit()
         await db.refresh(p)
+        await bump("properties")
         return {"status": "created", "entity": "property", "id": p.id}
 
     if choice == "transaction":
-        contact_id = draft.get("contact_id")
-        property_id = draft.get("property_id")
-        if not contact_id or not property_id:
-            raise HTTPException(status_code=400, detail="transaction requires contact_id and property_id")
-        tx = models.Transaction(
-            contact_id=contact_id,
-            property_id=property_id,
-            side=draft.get("side") or "buy",
-            stage=draft.get("stage") or "lead",
-            offer_price=draft.get("offer_price"),
-            close_price=draft.get("close_price"),
-            attrs=draft.get("attrs") or {}
-        )
-        db.add(tx)
-        await db.commit()
-        await db.refresh(tx)
-        return {"status": "created", "entity": "transaction", "id": tx.id}
+        return await _create_transaction(db, draft)
 
     raise HTTPException(status_code=400, detail="invalid choice")
+
+async def _create_transaction(db: AsyncSession, draft: Dict[str, Any]) -> Dict[str, Any]:
+    contact_id = draft.get("contact_id")
+    property_id = draft.get("property_id")
+    if not contact_id or not property_id:
+        raise HTTPException(status_code=400, detail="transaction requires contact_id and property_id")
+    tx = models.Transaction(
+        contact_id=contact_id,
+        property_id=property_id,
+        side=draft.get("side") or "buy",
+        stage=draft.get("stage") or "lead",
+        offer_price=draft.get("offer_price"),
+        close_price=draft.get("close_price"),
+        attrs=draft.get("attrs") or {}
+    )
+    db.add(tx)
+    await db.flush()
+    await analytics.record_created(db, [tx])
+    await changes.record(db, "transactions", "insert", [tx.id])
+    await db.commit()
+    await db.refresh(tx)
+    await bump("transactions")
+    return {"status": "created", "entity": "transaction", "id": tx.id}
@@ -0,0 +1,71 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.db import get_db, get_read_db
+from app import jobs, models, schemas
+from app.pagination import paginate, page_of
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+J = models.Job
+SORTS = {"id": J.id}
+COLUMNS = [J.__table__.c[name] for name in schemas.JobOut.model_fields]
+
+@router.post("/", response_model=schemas.JobOut)
+async def create_job(req: schemas.JobCreate, db: AsyncSession = Depends(get_db)):
+    """Queue a job by hand (e.g. a dedupe run); request handlers queue theirs with app.jobs.enqueue."""
+    try:
+        job_id = await jobs.enqueue(db, req.kind, req.payload, key=req.key, priority=req.priority, delay=req.delay)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    if job_id is None:  # coalesced into the one already queued
+        job_id = (await db.execute(select(J.id).where(J.key == req.key, J.status == "queued"))).scalar()
+    return (await db.execute(select(*COLUMNS).where(J.id == job_id))).one()
+
+@router.get("/", response_model=schemas.Page[schemas.JobOut])
+async def list_jobs(
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    status: Optional[str] = Query(None, description="queued | running | done | failed | cancelled"),
+    kind: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Newest first."""
+    stmt = select(*COLUMNS)
+    if status is not None:
+        if status not in jobs.STATUSES:
+            raise HTTPException(status_code=400, detail=f"status must be one of {list(jobs.STATUSES)}")
+        stmt = stmt.where(J.status == status)
+    if kind is not None:
+        stmt = stmt.where(J.kind == kind)
+    stmt = paginate(stmt, J.id, SORTS, sort="-id", after=after, limit=limit)
+    items, next_cursor = page_of((await db.execute(stmt)).all(), SORTS, sort="-id", limit=limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/stats")
+async def job_stats(db: AsyncSession = Depends(get_read_db)):
+    """Jobs per kind and status, with how long the oldest due job has been waiting."""
+    return await jobs.stats(db)
+
+@router.get("/{job_id}", response_model=schemas.JobOut)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_read_db)):
+    row = (await db.execute(select(*COLUMNS).where(J.id == job_id))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return row
+
+@router.post("/{job_id}/retry")
+async def retry_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Requeue a failed or cancelled job."""
+    if not await jobs.retry(db, job_id):
+        raise HTTPException(status_code=409, detail="only failed or cancelled jobs can be retried, and not while another with the same key is queued")
+    return {"id": job_id, "status": "queued"}
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Cancel a job that hasn't started."""
+    if not await jobs.cancel(db, job_id):
+        raise HTTPException(status_code=409, detail="only queued jobs can be cancelled")
+    return {"id": job_id, "status": "cancelled"}
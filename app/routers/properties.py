@@ -1,24 +1,120 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app.db import SessionLocal
-from app import models, schemas
+from app.db import get_db, get_read_db
+from app import changes, geo, models, schemas
+from app.cache import bump
+from app.expand import expanded_items, parse_expand
+from app.fastjson import fast_list, out_columns
+from app.pagination import paginate, page_of
 
 router = APIRouter(prefix="/properties", tags=["Properties"])
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+# Sortable columns; each one is backed by a (column, id) index
+SORTS = {"id": models.Property.id, "city": models.Property.city, "status": models.Property.status}
+# Plain columns for ?format=fast|ndjson|jsonarray (app/fastjson.py)
+FAST_COLUMNS = out_columns(models.Property, schemas.PropertyOut)
 
 @router.post("/", response_model=schemas.PropertyOut)
 async def create_property(payload: schemas.PropertyCreate, db: AsyncSession = Depends(get_db)):
     p = models.Property(**payload.dict())
     db.add(p)
+    await db.flush()
+    await changes.record(db, "properties", "insert", [p.id])
     await db.commit()
     await db.refresh(p)
+    await bump("properties")
     return p
 
-@router.get("/", response_model=list[schemas.PropertyOut])
-async def list_properties(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(models.Property))
-    return res.scalars().all()
+@router.get("/", response_model=schemas.Page[schemas.PropertyExpanded], response_model_exclude_unset=True)
+async def list_properties(
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort: str = Query("id", description="id | city | status, prefix with - for descending"),
+    status: Optional[str] = None,
+    format: Optional[str] = Query(None, description="fast | ndjson | jsonarray: skip schema validation; the last two stream all rows"),
+    expand: Optional[str] = Query(None, description="transactions | documents, comma-separated: inline related rows"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(models.Property) if format is None else select(*FAST_COLUMNS)
+    if status is not None:
+        stmt = stmt.where(models.Property.status == status)
+    names = parse_expand(models.Property, expand)
+    if format is not None:
+        if names:
+            raise HTTPException(status_code=400, detail="expand is not supported with format")
+        return await fast_list(db, stmt, models.Property.id, SORTS, sort=sort, after=after, limit=limit, format=format)
+    stmt = paginate(stmt, models.Property.id, SORTS, sort=sort, after=after, limit=limit)
+    rows = (await db.execute(stmt)).scalars().all()
+    items, next_cursor = page_of(rows, SORTS, sort=sort, limit=limit)
+    return {"items": await expanded_items(db, models.Property, schemas.PropertyOut, items, names), "next_cursor": next_cursor}
+
+# ---------- geo (app/geo.py) ----------
+
+P = models.Property
+BBOX_HELP = "west,south,east,north in degrees (west > east crosses the antimeridian)"
+
+async def _center(db: AsyncSession, lat: Optional[float], lon: Optional[float], of: Optional[int]):
+    if of is not None:
+        row = (await db.execute(select(P.lat, P.lon).where(P.id == of))).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="property not found")
+        if row.lat is None or row.lon is None:
+            raise HTTPException(status_code=400, detail=f"property {of} has no coordinates")
+        return row.lat, row.lon
+    if lat is None or lon is None:
+        raise HTTPException(status_code=400, detail="pass lat and lon, or of=<property id>")
+    return lat, lon
+
+def _status_filter(status: Optional[str]):
+    return [P.status == status] if status is not None else []
+
+@router.get("/within")
+async def properties_within(
+    bbox: str = Query(..., description=BBOX_HELP),
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Properties inside a bounding box, by id."""
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"bbox must be {BBOX_HELP}")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise HTTPException(status_code=400, detail="bbox out of range")
+    stmt = select(*FAST_COLUMNS).where(geo.within_box(P.geohash, P.lat, P.lon, south, west, north, east), *_status_filter(status))
+    stmt = paginate(stmt, P.id, {"id": P.id}, sort="id", after=after, limit=limit)
+    rows, next_cursor = page_of((await db.execute(stmt)).all(), {"id": P.id}, sort="id", limit=limit)
+    return {"items": [dict(r._mapping) for r in rows], "next_cursor": next_cursor}
+
+@router.get("/radius")
+async def properties_radius(
+    km: float = Query(..., gt=0, le=500),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    of: Optional[int] = Query(None, description="center on this property instead of lat/lon"),
+    limit: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Properties within km of a point or of another property, closest first."""
+    lat, lon = await _center(db, lat, lon, of)
+    items = await geo.radius(db, P, FAST_COLUMNS, lat, lon, km, limit, exclude_id=of, where=_status_filter(status))
+    return {"center": {"lat": lat, "lon": lon}, "km": km, "items": items}
+
+@router.get("/nearest")
+async def properties_nearest(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    of: Optional[int] = Query(None, description="center on this property instead of lat/lon"),
+    k: int = Query(10, ge=1, le=100),
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """The k properties closest to a point or to another property."""
+    lat, lon = await _center(db, lat, lon, of)
+    items, km = await geo.nearest(db, P, FAST_COLUMNS, lat, lon, k, exclude_id=of, where=_status_filter(status))
+    return {"center": {"lat": lat, "lon": lon}, "searched_km": km, "items": items}
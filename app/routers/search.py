@@ -1,22 +1,98 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
-from app.db import SessionLocal
+from sqlalchemy import select
+from typing import List, Optional
+from app.db import get_read_db
+from app import models, schemas, textsearch
+from app.attrs import attrs_equal, flush_usage, note_usage, promoted_column, range_expr
+from app.pagination import paginate, page_of
+from app.query_dsl import QueryError, TABLES, plan, row_columns, sortable
 
 router = APIRouter(prefix="/search", tags=["Search"])
-
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+# Read sessions throughout: the occasional attr_catalog upsert from flush_usage just autocommits
 
 @router.get("/contacts/by-attr")
-async def contacts_by_attr(key: str = Query(...), equals: str = Query(...), db: AsyncSession = Depends(get_db)):
-    sql = text("SELECT * FROM contacts WHERE attrs->>:key = :equals")
-    res = await db.execute(sql, {"key": key, "equals": equals})
+async def contacts_by_attr(
+    key: List[str] = Query(..., description="repeat key/equals to AND several attributes"),
+    equals: List[str] = Query(...),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if len(key) != len(equals):
+        raise HTTPException(status_code=400, detail="pass one equals per key")
+    contacts = models.Contact.__table__
+    sql = select(*row_columns(contacts)).where(attrs_equal(contacts.c.attrs, zip(key, equals))).limit(limit)
+    res = await db.execute(sql)
+    for k in key:
+        note_usage("contacts", k, "string")
+    await flush_usage(db)
     return [dict(r._mapping) for r in res]
 
 @router.get("/properties/number-attr-gte")
-async def properties_number_attr_gte(key: str = Query(...), gte: float = Query(...), db: AsyncSession = Depends(get_db)):
-    sql = text("SELECT * FROM properties WHERE (attrs->>:key)::numeric >= :gte")
-    res = await db.execute(sql, {"key": key, "gte": gte})
+async def properties_number_attr_gte(
+    key: str = Query(...),
+    gte: Optional[float] = Query(None),
+    lte: Optional[float] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Numeric range over attrs[key]; promoted keys (list_price, bed, bath, ...) hit a B-tree index."""
+    if gte is None and lte is None:
+        raise HTTPException(status_code=400, detail="pass gte and/or lte")
+    properties = models.Property.__table__
+    value = range_expr(properties, key)
+    sql = select(*row_columns(properties))
+    if gte is not None:
+        sql = sql.where(value >= gte)
+    if lte is not None:
+        sql = sql.where(value <= lte)
+    res = await db.execute(sql.limit(limit))
+    note_usage("properties", key, "number")
+    await flush_usage(db)
     return [dict(r._mapping) for r in res]
+
+@router.get("/text")
+async def text_search(
+    q: str = Query(..., min_length=1, max_length=200),
+    entity: List[str] = Query(list(textsearch.SEARCH_COLUMNS), description="contacts | properties | transactions, repeatable"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Ranked prefix + typo-tolerant search over names, contact details, addresses and notes, with highlights."""
+    unknown = set(entity) - set(textsearch.SEARCH_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"cannot search {sorted(unknown)}; choose from {list(textsearch.SEARCH_COLUMNS)}")
+    results = await textsearch.search(db, q, entity, limit)
+    return {"q": q, "fuzzy": textsearch.trigram_enabled(), "results": results}
+
+@router.get("/attrs/catalog")
+async def attrs_catalog(db: AsyncSession = Depends(get_read_db)):
+    """Queried attrs keys, most used first; numeric ones not yet promoted are promotion candidates."""
+    await flush_usage(db, force=True)
+    rows = (await db.execute(select(models.AttrCatalog).order_by(models.AttrCatalog.hits.desc()))).scalars().all()
+    return [
+        {
+            "entity": r.entity,
+            "key": r.key,
+            "hits": r.hits,
+            "query_types": r.query_types,
+            "value_types": r.value_types,
+            "promoted_column": r.promoted_column or promoted_column(r.entity, r.key),
+            "promote_candidate": not (r.promoted_column or promoted_column(r.entity, r.key)) and "number" in (r.query_types or {}),
+        }
+        for r in rows
+    ]
+
+@router.post("/query", response_model=schemas.Page[dict])
+async def query(body: schemas.QueryRequest, db: AsyncSession = Depends(get_read_db)):
+    """Compound filters across fields, attrs and related rows; see app/query_dsl.py for the JSON format."""
+    try:
+        stmt, params = plan(body.entity, body.where)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sorts = sortable(body.entity)
+    stmt = paginate(stmt, TABLES[body.entity].c.id, sorts, sort=body.sort, after=body.after, limit=body.limit)
+    rows = (await db.execute(stmt, params)).all()
+    items, next_cursor = page_of(rows, sorts, sort=body.sort, limit=body.limit)
+    await flush_usage(db)
+    return {"items": [dict(r._mapping) for r in items], "next_cursor": next_cursor}
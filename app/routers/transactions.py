@@ -1,24 +1,55 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app.db import SessionLocal
-from app import models, schemas
+from app.db import get_db, get_read_db
+from app import analytics, changes, models, schemas
+from app.cache import bump
+from app.expand import expanded_items, parse_expand
+from app.fastjson import fast_list, out_columns
+from app.pagination import paginate, page_of
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+# Sortable columns; each one is backed by a (column, id) index
+SORTS = {"id": models.Transaction.id, "stage": models.Transaction.stage, "side": models.Transaction.side}
+# Plain columns for ?format=fast|ndjson|jsonarray (app/fastjson.py)
+FAST_COLUMNS = out_columns(models.Transaction, schemas.TransactionOut)
 
 @router.post("/", response_model=schemas.TransactionOut)
 async def create_transaction(payload: schemas.TransactionCreate, db: AsyncSession = Depends(get_db)):
     tx = models.Transaction(**payload.dict())
     db.add(tx)
+    await db.flush()
+    await analytics.record_created(db, [tx])
+    await changes.record(db, "transactions", "insert", [tx.id])
     await db.commit()
     await db.refresh(tx)
+    await bump("transactions")
     return tx
 
-@router.get("/", response_model=list[schemas.TransactionOut])
-async def list_transactions(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(models.Transaction))
-    return res.scalars().all()
+@router.get("/", response_model=schemas.Page[schemas.TransactionExpanded], response_model_exclude_unset=True)
+async def list_transactions(
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort: str = Query("id", description="id | stage | side, prefix with - for descending"),
+    stage: Optional[str] = None,
+    side: Optional[str] = None,
+    format: Optional[str] = Query(None, description="fast | ndjson | jsonarray: skip schema validation; the last two stream all rows"),
+    expand: Optional[str] = Query(None, description="contact | property | documents, comma-separated: inline related rows"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(models.Transaction) if format is None else select(*FAST_COLUMNS)
+    if stage is not None:
+        stmt = stmt.where(models.Transaction.stage == stage)
+    if side is not None:
+        stmt = stmt.where(models.Transaction.side == side)
+    names = parse_expand(models.Transaction, expand)
+    if format is not None:
+        if names:
+            raise HTTPException(status_code=400, detail="expand is not supported with format")
+        return await fast_list(db, stmt, models.Transaction.id, SORTS, sort=sort, after=after, limit=limit, format=format)
+    stmt = paginate(stmt, models.Transaction.id, SORTS, sort=sort, after=after, limit=limit)
+    rows = (await db.execute(stmt)).scalars().all()
+    items, next_cursor = page_of(rows, SORTS, sort=sort, limit=limit)
+    return {"items": await expanded_items(db, models.Transaction, schemas.TransactionOut, items, names), "next_cursor": next_cursor}
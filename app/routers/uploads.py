@@ -0,0 +1,110 @@
+"""
+Resumable uploads (app/uploads.py) for documents too large to send in one request.
+
+  POST   /uploads                 start: metadata, and optionally the total size and sha256
+  PUT    /uploads/{id}            one chunk as the raw body, at Upload-Offset (or ?offset=)
+  GET    /uploads/{id}            where to resume (also the Upload-Offset header)
+  POST   /uploads/{id}/complete   store the file and create the document
+  DELETE /uploads/{id}            abort
+"""
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import blobs, jobs, schemas, uploads
+from app.db import get_db
+from app.routers.documents import check_targets, create_document
+
+router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+def _upload_out(s: dict) -> dict:
+    return {
+        "id": s["id"],
+        "filename": s["filename"],
+        "size": s["size"],
+        "offset": s["received"],
+        "chunk_size": uploads.SUGGESTED_CHUNK,
+        "max_chunk": uploads.MAX_CHUNK,
+        "expires_at": s["expires_at"],
+        "upload_url": f"/uploads/{s['id']}",
+    }
+
+@router.post("/", status_code=201)
+async def create_upload(body: schemas.UploadCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    Returns the session (an UploadOut). When `sha256` names content that is already stored, the
+    document is created right away instead and returned with 200: there is nothing to upload.
+    """
+    await check_targets(db, body.contact_id, body.property_id, body.transaction_id)
+    sha256 = body.sha256.lower() if body.sha256 else None
+    if sha256:
+        size = await blobs.lookup(db, sha256)
+        if size is not None and (body.size is None or body.size == size):
+            response.status_code = 200
+            return await create_document(
+                db, sha256, size, filename=body.filename, mime_type=body.mime_type, contact_id=body.contact_id,
+                property_id=body.property_id, transaction_id=body.transaction_id, attrs=body.attrs,
+            )
+    session = await uploads.create(db, {**body.model_dump(), "sha256": sha256, "attrs": json.dumps(body.attrs)})
+    # sessions nobody finishes are swept once they expire
+    await jobs.enqueue(db, "uploads.expire", key="uploads.expire", delay=uploads.SESSION_HOURS * 3600 + 60)
+    await db.commit()
+    return _upload_out(session)
+
+@router.get("/{upload_id}", response_model=schemas.UploadOut)
+async def get_upload(upload_id: str, response: Response, db: AsyncSession = Depends(get_db)):
+    session = await uploads.get(db, upload_id)
+    response.headers["Upload-Offset"] = str(session["received"])
+    return _upload_out(session)
+
+@router.put("/{upload_id}")
+async def put_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    offset: Optional[int] = Query(None, ge=0, description="instead of the Upload-Offset header"),
+    upload_offset: Optional[int] = Header(None),
+    content_length: Optional[int] = Header(None),
+    x_chunk_sha256: Optional[str] = Header(None, description="hex SHA-256 of this chunk; a mismatch rejects it"),
+):
+    """
+    The body is the next chunk, starting at the offset received so far (409 with the right
+    Upload-Offset otherwise). A chunk that fails its checks or breaks off is dropped whole.
+    """
+    start = offset if offset is not None else upload_offset
+    if start is None:
+        raise HTTPException(status_code=400, detail="send the chunk's offset as Upload-Offset or ?offset=")
+    received = await uploads.write_chunk(upload_id, start, request.stream(), content_length, x_chunk_sha256)
+    response.headers["Upload-Offset"] = str(received)
+    return {"id": upload_id, "offset": received}
+
+@router.post("/{upload_id}/complete", response_model=schemas.DocumentOut)
+async def complete_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    A 409 for a contact, property or transaction deleted since the upload started ends the
+    session: the part file has already gone to the store, so start a new upload (which finds the
+    content stored and needs no bytes when it sends the sha256).
+    """
+    session = await uploads.get(db, upload_id)
+    await check_targets(db, session["contact_id"], session["property_id"], session["transaction_id"])
+    s = await uploads.finalize(db, upload_id)
+    try:
+        return await create_document(  # commits the session delete along with the document
+            db, s["key"], s["received"], filename=s["filename"], mime_type=s["mime_type"], contact_id=s["contact_id"],
+            property_id=s["property_id"], transaction_id=s["transaction_id"], attrs=s["attrs"] or {},
+        )
+    except HTTPException as e:
+        if e.status_code != 409:
+            raise
+        await uploads.discard(db, upload_id)  # create_document rolled back the delete; the part file is gone
+        await db.commit()
+        raise HTTPException(status_code=409, detail=f"{e.detail}; the upload was discarded, start a new one")
+
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    if not await uploads.abort(db, upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    await db.commit()
+    return {"id": upload_id, "deleted": True}
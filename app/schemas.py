@@ -1,6 +1,9 @@
-from typing import Optional, Any, Dict
+from datetime import datetime
+from typing import Optional, Any, Dict, List, Generic, TypeVar
 from pydantic import BaseModel, Field
 
+T = TypeVar("T")
+
 class ContactCreate(BaseModel):
     first_name: str
     last_name: str
@@ -20,6 +23,8 @@ class PropertyCreate(BaseModel):
     state_province: Optional[str] = None
     country: Optional[str] = "Canada"
     status: Optional[str] = "prospect"
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
     attrs: Dict[str, Any] = Field(default_factory=dict)
 
 class PropertyOut(PropertyCreate):
@@ -41,5 +46,88 @@ class TransactionOut(TransactionCreate):
     class Config:
         from_attributes = True
 
+class DocumentOut(BaseModel):
+    id: int
+    filename: str
+    mime_type: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    created_at: Optional[datetime] = None
+    contact_id: Optional[int] = None
+    property_id: Optional[int] = None
+    transaction_id: Optional[int] = None
+    download_url: str
+
+# ?expand= shapes: the relationship keys appear only when requested (the list routes use
+# response_model_exclude_unset, so an unexpanded response is byte-for-byte the plain *Out page)
+class ContactExpanded(ContactOut):
+    transactions: Optional[List[TransactionOut]] = None
+    documents: Optional[List[DocumentOut]] = None
+
+class PropertyExpanded(PropertyOut):
+    transactions: Optional[List[TransactionOut]] = None
+    documents: Optional[List[DocumentOut]] = None
+
+class TransactionExpanded(TransactionOut):
+    contact: Optional[ContactOut] = None
+    property: Optional[PropertyOut] = None
+    documents: Optional[List[DocumentOut]] = None
+
 class PatchAttrs(BaseModel):
     attrs: Dict[str, Any] = Field(default_factory=dict)
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # pass back as `after` to fetch the next page
+
+class JobCreate(BaseModel):
+    kind: str
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    key: Optional[str] = None  # while a job with this key is queued, another is not added
+    priority: Optional[int] = None  # default: the task's; higher runs first
+    delay: float = Field(0.0, ge=0)  # seconds before it may run
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    key: Optional[str] = None
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    locked_by: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+class QueryRequest(BaseModel):
+    entity: str
+    where: Optional[Dict[str, Any]] = None  # see app/query_dsl.py for the node types
+    sort: str = "id"
+    limit: int = Field(50, ge=1, le=1000)
+    after: Optional[str] = None
+
+class UploadCreate(BaseModel):
+    filename: str
+    mime_type: Optional[str] = None
+    size: Optional[int] = Field(None, ge=0)  # when given, chunks may not run past it and /complete needs all of it
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # checked at /complete; content already stored skips the upload
+    contact_id: Optional[int] = None
+    property_id: Optional[int] = None
+    transaction_id: Optional[int] = None
+    attrs: Dict[str, Any] = Field(default_factory=dict)
+
+class UploadOut(BaseModel):
+    id: str
+    filename: str
+    size: Optional[int] = None
+    offset: int  # bytes received; the next chunk starts here
+    chunk_size: int
+    max_chunk: int
+    expires_at: datetime
+    upload_url: str
@@ -0,0 +1,314 @@
+// --- Helpers ---
+const $ = (id) => document.getElementById(id);
+const statusEl = $("status");
+const ingestUI = $("ingest_ui");
+let lastDraft = null;
+
+// text from the API (names, addresses, resolver labels) goes through esc() before innerHTML
+const esc = (v) => String(v ?? "").replace(/[&<>"']/g, ch => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" })[ch]);
+
+function asAttrs(v) {
+  if (v === null || v === undefined) return "";
+  if (typeof v === "object") return `<code class="attrs">${esc(JSON.stringify(v))}</code>`;
+  return esc(v);
+}
+function safeJSON(text) {
+  if (!text || !text.trim()) return {};
+  try { return JSON.parse(text); } catch { alert("Attrs must be valid JSON"); throw new Error("bad json"); }
+}
+
+// --- Collapsible behavior ---
+document.querySelectorAll(".section h2").forEach(h2 => {
+  h2.onclick = () => {
+    const sec = h2.parentElement;
+    const caret = h2.querySelector(".caret");
+    const open = sec.classList.toggle("open");
+    caret.textContent = open ? "▼" : "►";
+    if (open) SHEETS[sec.id.replace("sec_", "")]?.render();  // a closed sheet has no size to virtualize against
+  };
+});
+
+// --- Smart bar: ping + enter + mic + submit ---
+async function ping() {
+  try {
+    const res = await fetch("/health");
+    statusEl.innerHTML = res.ok ? '<span class="ok">Connected</span>' : '<span class="err">Health failed</span>';
+  } catch {
+    statusEl.innerHTML = '<span class="err">Unable to reach backend</span>';
+  }
+}
+$("smart_input").addEventListener("keydown", (e) => {
+  if (e.key === "Enter") { e.preventDefault(); submitIngest(); }
+});
+$("submit_btn").onclick = submitIngest;
+
+(function setupMic(){
+  const btn = $("mic_btn"), input = $("smart_input");
+  if (!("webkitSpeechRecognition" in window) && !("SpeechRecognition" in window)) {
+    btn.disabled = true; btn.title = "Voice not supported by this browser"; return;
+  }
+  const SR = window.SpeechRecognition || window.webkitSpeechRecognition;
+  const rec = new SR(); rec.lang = "en-US"; rec.interimResults = false; rec.maxAlternatives = 1;
+  let listening = false;
+  btn.onclick = () => { if (listening) { rec.stop(); return; } rec.start(); listening = true; btn.textContent = "⏹️"; };
+  rec.onresult = (e) => { input.value = e.results[0][0].transcript; submitIngest(); };
+  rec.onend = () => { listening = false; btn.textContent = "🎤"; };
+  rec.onerror = () => { listening = false; btn.textContent = "🎤"; };
+})();
+
+async function submitIngest() {
+  const text = $("smart_input").value.trim();
+  if (!text) return;
+  ingestUI.textContent = "Thinking…";
+  lastDraft = null;
+  try {
+    const res = await fetch("/ingest", { method:"POST", headers:{ "Content-Type":"application/json" }, body: JSON.stringify({ text }) });
+    const data = await res.json();
+    handleIngestResponse(data);
+  } catch { ingestUI.innerHTML = '<span class="err">Failed to ingest</span>'; }
+}
+function handleIngestResponse(data) {
+  if (data.status === "created") {
+    ingestUI.innerHTML = `<span class="ok">Created ${data.entity} #${data.id}</span>`;
+    if (!live) refreshAll(); $("smart_input").value = ""; lastDraft = null; return;
+  }
+  if (data.status === "ask") {
+    lastDraft = data.draft || null;
+    const options = (data.options || []).map(opt => `<span class="pill" onclick="confirmIngest('${opt}')">${opt}</span>`).join("");
+    ingestUI.innerHTML = `<strong>${esc(data.question)}</strong>${candidatePills(data.candidates)}<div style="margin-top:8px;">${options}</div>`;
+    return;
+  }
+  ingestUI.textContent = "Unexpected response.";
+}
+// ranked matches from /ingest for a transaction's contact and property; click to pick
+function candidatePills(candidates) {
+  if (!candidates) return "";
+  return ["contact", "property"].map(kind => {
+    const key = kind + "_id", list = candidates[kind] || [];
+    const pills = list.map(c => `<span class="pill ${lastDraft && lastDraft[key] === c.id ? "on" : ""}" data-kind="${kind}"
+      onclick="pickCandidate('${kind}', ${Number(c.id)}, this)">${esc(c.label)} <span class="muted">${Math.round(c.confidence * 100)}%</span></span>`).join("");
+    return `<div style="margin-top:8px;"><span class="muted">${kind}:</span> ${pills || '<span class="muted">no match</span>'}</div>`;
+  }).join("");
+}
+function pickCandidate(kind, id, el) {
+  if (!lastDraft) return;
+  lastDraft[kind + "_id"] = id;
+  document.querySelectorAll(`.pill[data-kind="${kind}"]`).forEach(p => p.classList.toggle("on", p === el));
+}
+async function confirmIngest(choice) {
+  if (choice === "cancel") { ingestUI.textContent = "Cancelled."; lastDraft = null; return; }
+  if (!lastDraft) { ingestUI.textContent = "No draft to confirm."; return; }
+  if (choice === "transaction" && (!lastDraft.contact_id || !lastDraft.property_id)) {
+    if (!ingestUI.querySelector(".pick-hint")) ingestUI.insertAdjacentHTML("beforeend", '<div class="err pick-hint">Pick a contact and a property first (or mention a name and an address in the text).</div>');
+    return;
+  }
+  try {
+    const res = await fetch("/ingest/confirm", { method:"POST", headers:{ "Content-Type":"application/json" }, body: JSON.stringify({ choice, draft: lastDraft }) });
+    const data = await res.json();
+    if (data.status === "created") { ingestUI.innerHTML = `<span class="ok">Created ${data.entity} #${data.id}</span>`; if (!live) refreshAll(); $("smart_input").value = ""; lastDraft = null; }
+    else if (data.status === "attached") { ingestUI.innerHTML = `<span class="ok">Attached to contact #${data.id}</span>`; if (!live) refreshAll(); $("smart_input").value = ""; lastDraft = null; }
+    else if (data.status === "cancelled") { ingestUI.textContent = "Cancelled."; lastDraft = null; }
+    else { ingestUI.innerHTML = '<span class="err">Could not create item.</span>'; }
+  } catch { ingestUI.innerHTML = '<span class="err">Confirm failed.</span>'; }
+}
+
+// --- Row renderers, shared by the loaders and the live feed ---
+const RENDER = {
+  contacts: r => `<td>${r.id}</td><td>${esc(r.first_name)}</td><td>${esc(r.last_name)}</td>
+    <td>${esc(r.email)}</td><td>${esc(r.phone)}</td><td>${esc(r.status)}</td><td>${asAttrs(r.attrs)}</td>`,
+  properties: r => `<td>${r.id}</td><td>${esc(r.address)}</td><td>${esc(r.city)}</td>
+    <td>${esc(r.state_province)}</td><td>${esc(r.country)}</td><td>${esc(r.status)}</td><td>${asAttrs(r.attrs)}</td>`,
+  transactions: r => `<td>${r.id}</td><td>${r.contact ? esc(`${r.contact.first_name} ${r.contact.last_name}`) : r.contact_id}</td>
+    <td>${r.property ? esc(r.property.address) : r.property_id}</td>
+    <td>${esc(r.side)}</td><td>${esc(r.stage)}</td><td>${r.offer_price ?? ""}</td><td>${r.close_price ?? ""}</td><td>${asAttrs(r.attrs)}</td>`,
+  documents: d => `<td>${d.id}</td><td>${esc(d.filename)}</td><td>${esc(d.mime_type)}</td><td>${d.size||""}</td>
+    <td>${["contact:"+ (d.contact_id||""), "property:"+ (d.property_id||""), "transaction:"+ (d.transaction_id||"")].join(" ")}</td>
+    <td>${d.created_at ? new Date(d.created_at).toLocaleString() : ""}</td>
+    <td>${d.download_url ? `<a href="${d.download_url}">download</a>` : ""}</td>`,
+};
+
+// --- Virtualized sheets ---
+// Loaded rows stay in memory; the DOM only holds the ones in view plus OVERSCAN, between two
+// spacer rows. Pages come from the keyset-paginated list endpoint as the user nears the end,
+// in the sort picked by clicking a column header (sorting happens on the server).
+const ROW_HEIGHT = 34, OVERSCAN = 12, PAGE_SIZE = 200;
+
+class Sheet {
+  constructor(entity, extra = "") {
+    this.entity = entity; this.extra = extra; this.sort = "id";
+    this.box = $("sheet_" + entity); this.tbody = $("tbl_" + entity);
+    this.columns = this.box.querySelectorAll("thead th").length;
+    this.rows = []; this.byId = new Map(); this.cursor = null; this.more = true; this.pending = null; this.generation = 0;
+    this.box.addEventListener("scroll", () => this.schedule(), { passive: true });
+    this.box.querySelectorAll("thead th[data-sort]").forEach(th => th.onclick = () => this.sortBy(th.dataset.sort));
+  }
+  sortBy(name) {
+    this.sort = this.sort === name ? "-" + name : name;
+    this.box.querySelectorAll("thead th[data-sort]").forEach(th => {
+      th.textContent = th.textContent.replace(/ [▲▼]$/, "");
+      if (this.sort.replace("-", "") === th.dataset.sort) th.textContent += this.sort.startsWith("-") ? " ▼" : " ▲";
+    });
+    return this.reload();
+  }
+  async reload() {
+    this.generation++;
+    this.rows = []; this.byId = new Map(); this.cursor = null; this.more = true; this.pending = null;
+    this.box.scrollTop = 0;
+    await this.fetchMore();
+  }
+  fetchMore() {
+    if (!this.more) return Promise.resolve();
+    if (this.pending) return this.pending;
+    const generation = this.generation;
+    const after = this.cursor ? "&after=" + encodeURIComponent(this.cursor) : "";
+    this.pending = fetch(`/${this.entity}/?limit=${PAGE_SIZE}&sort=${this.sort}${this.extra}${after}`)
+      .then(res => res.ok ? res.json() : res.text().then(t => { throw new Error(t); }))
+      .then(page => {
+        if (generation !== this.generation) return;  // re-sorted meanwhile
+        for (const r of page.items || []) if (!this.byId.has(r.id)) { this.byId.set(r.id, r); this.rows.push(r); }
+        this.cursor = page.next_cursor; this.more = !!page.next_cursor;
+        this.pending = null;
+        this.render();
+      })
+      .catch(e => {
+        if (generation !== this.generation) return;
+        this.pending = null; this.more = false;
+        this.tbody.innerHTML = `<tr><td colspan="${this.columns}" class="err">${esc(e.message || e)}</td></tr>`;
+      });
+    return this.pending;
+  }
+  schedule() {
+    if (this.frame) return;
+    this.frame = requestAnimationFrame(() => { this.frame = null; this.render(); });
+  }
+  render() {
+    const height = this.box.clientHeight || 420, top = this.box.scrollTop;
+    const first = Math.max(0, Math.floor(top / ROW_HEIGHT) - OVERSCAN);
+    const last = Math.min(this.rows.length, Math.ceil((top + height) / ROW_HEIGHT) + OVERSCAN);
+    const pad = px => px ? `<tr class="pad"><td colspan="${this.columns}" style="height:${px}px"></td></tr>` : "";
+    this.tbody.innerHTML = pad(first * ROW_HEIGHT)
+      + this.rows.slice(first, last).map(r => `<tr data-id="${r.id}"${r._fresh ? ' class="fresh"' : ""}>${RENDER[this.entity](r)}</tr>`).join("")
+      + pad((this.rows.length - last) * ROW_HEIGHT);
+    $("count_" + this.entity).textContent = this.rows.length ? this.rows.length + (this.more ? "+" : "") + " rows" : "";
+    // within a few screens of the end: fetch the next page
+    if (this.more && !this.pending && (this.rows.length - last) * ROW_HEIGHT < 3 * height) this.fetchMore();
+  }
+  // live feed patches
+  put(row) {
+    const current = this.byId.get(row.id);
+    if (current) Object.assign(current, row);
+    else { row._fresh = true; this.byId.set(row.id, row); this.rows.unshift(row); }
+    this.schedule();
+  }
+  remove(id) {
+    if (!this.byId.delete(id)) return;
+    this.rows.splice(this.rows.findIndex(r => r.id === id), 1);
+    this.schedule();
+  }
+}
+
+// --- Loaders + Add Row for each sheet ---
+const loadContacts = () => SHEETS.contacts.reload();
+async function addContact() {
+  try {
+    const payload = {
+      first_name: $("c_first").value, last_name: $("c_last").value,
+      email: $("c_email").value || null, phone: $("c_phone").value || null,
+      status: $("c_status").value || "new", attrs: safeJSON($("c_attrs").value || "{}")
+    };
+    const res = await fetch("/contacts/", { method:"POST", headers:{ "Content-Type":"application/json" }, body: JSON.stringify(payload) });
+    if (!res.ok) { alert("Failed to add contact"); return; }
+    $("c_first").value=$("c_last").value=$("c_email").value=$("c_phone").value=$("c_status").value=$("c_attrs").value="";
+    if (!live) await loadContacts();  // otherwise the change feed adds the row
+  } catch {}
+}
+
+const loadProperties = () => SHEETS.properties.reload();
+async function addProperty() {
+  try {
+    const payload = {
+      address: $("p_address").value, city: $("p_city").value || null,
+      state_province: $("p_state").value || null, country: $("p_country").value || "Canada",
+      status: $("p_status").value || "prospect", attrs: safeJSON($("p_attrs").value || "{}")
+    };
+    const res = await resFetch("/properties/", payload);
+    if (!res.ok) { alert("Failed to add property"); return; }
+    $("p_address").value=$("p_city").value=$("p_state").value=$("p_country").value=$("p_status").value=$("p_attrs").value="";
+    if (!live) await loadProperties();  // otherwise the change feed adds the row
+  } catch {}
+}
+
+const loadTransactions = () => SHEETS.transactions.reload();
+async function addTransaction() {
+  try {
+    const payload = {
+      contact_id: Number($("t_contact_id").value), property_id: Number($("t_property_id").value),
+      side: $("t_side").value || "buy", stage: $("t_stage").value || "lead",
+      offer_price: $("t_offer").value ? Number($("t_offer").value) : null,
+      close_price: $("t_close").value ? Number($("t_close").value) : null,
+      attrs: safeJSON($("t_attrs").value || "{}")
+    };
+    const res = await resFetch("/transactions/", payload);
+    if (!res.ok) { alert("Failed to add transaction"); return; }
+    $("t_contact_id").value=$("t_property_id").value=$("t_side").value="buy";$("t_stage").value=$("t_offer").value=$("t_close").value=$("t_attrs").value="";
+    if (!live) await loadTransactions();  // otherwise the change feed adds the row
+  } catch {}
+}
+
+const loadDocuments = () => SHEETS.documents.reload();
+async function uploadDocument() {
+  const f = $("d_file").files[0]; if (!f) { alert("Choose a file first"); return; }
+  const fd = new FormData();
+  fd.append("file", f);
+  const c=$("d_contact_id").value, p=$("d_property_id").value, t=$("d_transaction_id").value, extra=$("d_attrs").value;
+  if (c) fd.append("contact_id", c); if (p) fd.append("property_id", p); if (t) fd.append("transaction_id", t); if (extra) fd.append("attrs", extra);
+  try {
+    const res = await fetch("/documents/upload", { method:"POST", body: fd });
+    if (!res.ok) { alert("Upload failed"); return; }
+    $("d_contact_id").value=$("d_property_id").value=$("d_transaction_id").value=$("d_attrs").value=""; $("d_file").value="";
+    if (!live) await loadDocuments();  // otherwise the change feed adds the row
+  } catch {}
+}
+
+// small helper to POST JSON
+async function resFetch(path, payload) {
+  return fetch(path, { method:"POST", headers:{ "Content-Type":"application/json" }, body: JSON.stringify(payload) });
+}
+
+const SHEETS = {
+  contacts: new Sheet("contacts"),
+  properties: new Sheet("properties"),
+  transactions: new Sheet("transactions", "&expand=contact,property"),
+  documents: new Sheet("documents"),
+};
+function refreshAll(){ loadContacts(); loadProperties(); loadTransactions(); loadDocuments(); }
+
+// --- Live feed: /changes/stream patches rows in place instead of reloading sheets ---
+let live = false;
+function applyChange(ev) {
+  const sheet = SHEETS[ev.entity];
+  if (!sheet) return;
+  if (ev.op === "bulk") { sheet.reload(); return; }  // an import: too many rows to patch
+  if (ev.op === "delete") { sheet.remove(ev.id); return; }
+  let row = ev.row;
+  if (ev.entity === "transactions") {  // keep showing names: reuse expanded rows already loaded
+    const prev = sheet.byId.get(ev.id) || {};
+    row = { ...row,
+      contact: prev.contact && prev.contact.id === row.contact_id ? prev.contact : SHEETS.contacts.byId.get(row.contact_id),
+      property: prev.property && prev.property.id === row.property_id ? prev.property : SHEETS.properties.byId.get(row.property_id) };
+  }
+  sheet.put(row);
+}
+function followChanges() {
+  // EventSource reconnects on its own and resumes after the last event id it saw
+  const es = new EventSource("/changes/stream");
+  es.onopen = () => { live = true; $("live_status").innerHTML = '· <span class="ok">live</span>'; };
+  es.onerror = () => { live = false; $("live_status").textContent = "· reconnecting…"; };
+  es.addEventListener("change", e => applyChange(JSON.parse(e.data)));
+  es.addEventListener("reset", refreshAll);
+}
+
+// Init
+ping();
+followChanges();
+refreshAll();
@@ -0,0 +1,189 @@
+"""
+Blob storage for document bytes.
+
+Blobs are content-addressed: the key is the SHA-256 of the bytes, computed while the upload streams
+through, so the same file uploaded twice lands on the same key. Which blobs exist and how many
+documents use each is tracked in the database (app/blobs.py), not here. Pick the backend with
+BLOB_BACKEND=local (default, files under BLOB_DIR) or BLOB_BACKEND=s3 (needs boto3; set S3_BUCKET and,
+for MinIO or another local stand-in, S3_ENDPOINT_URL).
+"""
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local")
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+CHUNK_SIZE = 1024 * 1024
+
+@dataclass
+class StoredBlob:
+    key: str  # sha256 hex digest
+    size: int
+
+@dataclass
+class SpooledBlob(StoredBlob):
+    path: str  # hashed temp copy, not yet in the store
+
+class BlobStore(ABC):
+    """Backends implement size/put_file/read_range/delete; spooling is shared. Store through app.blobs."""
+
+    def __init__(self, tmp_dir: str):
+        self.tmp_dir = tmp_dir
+        os.makedirs(tmp_dir, exist_ok=True)
+
+    @asynccontextmanager
+    async def spooled(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[SpooledBlob]:
+        """Spool `chunks` to a temp file while hashing; the file is removed on exit unless put_file() took it."""
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir, prefix="upload-")
+        try:
+            h = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    await run_in_threadpool(_write_hashed, f, h, chunk)
+                    size += len(chunk)
+            yield SpooledBlob(key=h.hexdigest(), size=size, path=tmp)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Size in bytes, None when the blob isn't stored."""
+
+    @abstractmethod
+    async def put_file(self, path: str, key: str) -> None:
+        """Store the file at `path` (already hashed to `key`); it may be moved rather than copied."""
+
+    @abstractmethod
+    def read_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) of the blob in CHUNK_SIZE pieces."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove the blob; a missing one is not an error."""
+
+def _write_hashed(f, h, chunk: bytes) -> None:
+    h.update(chunk)
+    f.write(chunk)
+
+class LocalBlobStore(BlobStore):
+    """Files under root/ab/cd/<sha256>; writes go through a temp file + rename so readers never see partial blobs."""
+
+    def __init__(self, root: str):
+        self.root = root
+        super().__init__(os.path.join(root, "tmp"))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await run_in_threadpool(os.stat, self.path(key))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def put_file(self, path: str, key: str) -> None:
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(path, dest)
+
+    def read_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        return iterate_in_threadpool(_iter_file(self.path(key), start, end))
+
+    async def delete(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+def _iter_file(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class S3BlobStore(BlobStore):
+    """Any S3-compatible service; boto3 is only needed when this backend is selected."""
+
+    def __init__(self, bucket: str, prefix: str = "blobs/", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("BLOB_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        super().__init__(os.path.join(tempfile.gettempdir(), "crm-blobs"))
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+        try:
+            head = await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    async def put_file(self, path: str, key: str) -> None:
+        # upload_file switches to multipart for large files and reads from disk in parts
+        await run_in_threadpool(self.client.upload_file, path, self.bucket, self._key(key))
+
+    def read_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        def chunks() -> Iterator[bytes]:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{end}")
+            yield from obj["Body"].iter_chunks(CHUNK_SIZE)
+        return iterate_in_threadpool(chunks())
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+
+@lru_cache(maxsize=None)
+def get_store() -> BlobStore:
+    if BLOB_BACKEND == "local":
+        return LocalBlobStore(BLOB_DIR)
+    if BLOB_BACKEND == "s3":
+        return S3BlobStore(
+            bucket=os.environ["S3_BUCKET"],
+            prefix=os.getenv("S3_PREFIX", "blobs/"),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+        )
+    raise RuntimeError(f"unknown BLOB_BACKEND {BLOB_BACKEND!r} (use local or s3)")
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range: bytes=...` header into an inclusive (start, end).
+    Returns None when the whole blob should be sent (no, malformed or multi-range header);
+    raises ValueError when the range is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not (first.isdigit() or last.isdigit()) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:  # suffix range: the last N bytes
+        n = int(last)
+        if n == 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - n, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
@@ -0,0 +1,144 @@
+"""
+Background job handlers (registered with app.jobs.task; run by the job worker).
+
+documents.process  re-hash an uploaded blob against its key and pull out its text into
+                   documents.content_text, in the worker's process pool. Plain-text types are
+                   decoded directly; PDFs need the optional pypdf package.
+                   Another document with the same content already processed is copied instead.
+dedupe             key and score contacts added since the last run (app/dedupe.py), queued
+                   (coalesced) whenever contacts are created.
+blobs.gc           delete blobs no document has used for the grace period (app/blobs.py);
+                   queued by document deletes, and requeues itself while blobs are still waiting.
+uploads.expire     delete resumable upload sessions (app/uploads.py) past their expiry with their
+                   part files; queued when a session starts, and requeues itself while any are open.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from app import blobs, dedupe, uploads
+from app.db import SessionLocal
+from app.jobs import cpu, enqueue, task
+from app.storage import CHUNK_SIZE, LocalBlobStore, get_store
+
+MAX_TEXT_CHARS = int(os.getenv("DOCUMENT_TEXT_MAX_CHARS", "200000"))
+TEXT_TYPES = ("application/json", "application/xml", "application/csv", "application/x-ndjson")
+
+# ---------- documents.process ----------
+
+def _is_text(mime_type: str) -> bool:
+    return mime_type.startswith("text/") or mime_type in TEXT_TYPES
+
+def hash_and_extract(path: str, mime_type: str, max_chars: int) -> Tuple[str, Optional[str], Optional[str]]:
+    """(sha256 of the file, its text or None, why there is no text). Runs in a pool process."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    if _is_text(mime_type):
+        with open(path, "rb") as f:
+            raw = f.read(max_chars * 4)  # utf-8 is at most 4 bytes a character
+        return h.hexdigest(), raw.decode("utf-8", errors="replace").replace("\x00", "")[:max_chars], None
+    if mime_type == "application/pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            return h.hexdigest(), None, "PDF text needs pypdf (pip install pypdf)"
+        parts, size = [], 0
+        for page in PdfReader(path).pages:
+            page_text = page.extract_text() or ""
+            parts.append(page_text)
+            size += len(page_text)
+            if size >= max_chars:
+                break
+        return h.hexdigest(), "\n".join(parts).replace("\x00", "")[:max_chars], None
+    return h.hexdigest(), None, f"no text extraction for {mime_type}"
+
+async def _local_path(store, key: str, size: int) -> Tuple[str, bool]:
+    """A filesystem path holding the blob, and whether it is a temp copy to delete afterwards."""
+    if isinstance(store, LocalBlobStore):
+        return store.path(key), False
+    fd, tmp = tempfile.mkstemp(dir=store.tmp_dir, prefix="job-")
+    with os.fdopen(fd, "wb") as f:
+        if size:
+            async for chunk in store.read_range(key, 0, size - 1):
+                f.write(chunk)
+    return tmp, True
+
+@task("documents.process", priority=10, max_attempts=3, timeout=600)
+async def process_document(payload: Dict[str, Any]) -> Dict[str, Any]:
+    async with SessionLocal() as db:
+        doc = (await db.execute(
+            text("SELECT id, sha256, mime_type FROM documents WHERE id = :id"), {"id": payload["id"]}
+        )).first()
+    if doc is None:
+        return {"skipped": "document deleted"}
+    if not doc.sha256:
+        return {"skipped": "content not in the blob store yet (run migrate-blobs)"}
+    async with SessionLocal() as db:  # identical content already verified and extracted
+        copied = (await db.execute(text(
+            "UPDATE documents d SET content_text = s.content_text FROM ("
+            " SELECT id, content_text FROM documents WHERE sha256 = :key AND id <> :id AND content_text IS NOT NULL LIMIT 1"
+            ") s WHERE d.id = :id RETURNING s.id"
+        ), {"key": doc.sha256, "id": doc.id})).scalar()
+        await db.commit()
+    if copied is not None:
+        return {"verified": True, "copied_from": copied}
+    store = get_store()
+    size = await store.size(doc.sha256)
+    if size is None:
+        raise RuntimeError(f"blob {doc.sha256} is missing from storage")
+    path, temporary = await _local_path(store, doc.sha256, size)
+    try:
+        digest, content, reason = await cpu(hash_and_extract, path, doc.mime_type or "", MAX_TEXT_CHARS)
+    finally:
+        if temporary:
+            os.unlink(path)
+    if digest != doc.sha256:
+        raise RuntimeError(f"blob {doc.sha256} is corrupt (its bytes hash to {digest})")
+    if content is not None:
+        async with SessionLocal() as db:
+            await db.execute(text("UPDATE documents SET content_text = :t WHERE id = :id"), {"t": content, "id": doc.id})
+            await db.commit()
+    return {"verified": True, "chars": len(content) if content is not None else None, **({"note": reason} if reason else {})}
+
+# ---------- dedupe ----------
+
+@task("dedupe", priority=-10, concurrency=1, timeout=1800)
+async def run_dedupe(payload: Dict[str, Any]) -> Dict[str, Any]:
+    contacts = candidates = 0
+    while True:
+        async with SessionLocal() as db:
+            res = await dedupe.run_batch(db, payload.get("batch_size", 1000))
+        if res.get("busy"):  # the CLI job, say; retried with backoff so nothing added meanwhile is missed
+            raise RuntimeError("another dedupe run holds the lock")
+        if not res["contacts"]:
+            break
+        contacts += res["contacts"]
+        candidates += res["candidates"]
+    return {"contacts": contacts, "candidates": candidates}
+
+# ---------- blobs.gc ----------
+
+@task("blobs.gc", priority=-20, concurrency=1, timeout=3600)
+async def collect_blobs(payload: Dict[str, Any]) -> Dict[str, Any]:
+    result = await blobs.collect()
+    if result["next_due_seconds"] is not None:  # come back when the next one is due
+        async with SessionLocal() as db:
+            await enqueue(db, "blobs.gc", key="blobs.gc", delay=result["next_due_seconds"] + 60)
+            await db.commit()
+    return result
+
+# ---------- uploads.expire ----------
+
+@task("uploads.expire", priority=-20, concurrency=1, timeout=600)
+async def expire_uploads(payload: Dict[str, Any]) -> Dict[str, Any]:
+    result = await uploads.expire()
+    if result["next_due_seconds"] is not None:
+        async with SessionLocal() as db:
+            await enqueue(db, "uploads.expire", key="uploads.expire", delay=result["next_due_seconds"] + 60)
+            await db.commit()
+    return result
@@ -0,0 +1,120 @@
+"""
+Ranked full-text + fuzzy search for /search/text.
+
+Each searchable table carries two stored generated columns built from the same text:
+`search_text` (names, emails, phones, addresses and the attrs["note"] that /ingest keeps) and
+`search_tsv`, its to_tsvector('simple', ...) with a GIN index. Typed words are matched as
+prefixes against search_tsv. When the pg_trgm extension is available, `search_text` also gets a
+trigram GIN index and rows whose text is word-similar to the query match too, which is what
+catches typos ("Dundsa" -> "Dundas"). All matches are ranked; headlines are only computed for the
+rows returned.
+"""
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import Text, func, literal, literal_column, or_, select, text
+from sqlalchemy.exc import DBAPIError
+
+TS_CONFIG = "simple"  # no stemming or stop words: names and street names are not English prose
+HEADLINE_OPTIONS = "StartSel=<b>, StopSel=</b>, MaxFragments=2, MinWords=3, MaxWords=12"
+
+# table -> plain columns fed into the search text (attrs["note"] is always added)
+SEARCH_COLUMNS = {
+    "contacts": ("first_name", "last_name", "email", "phone"),
+    "properties": ("address", "city", "state_province"),
+    "transactions": ("stage", "side"),
+}
+
+def search_text_expr(table_name: str):
+    """Immutable `coalesce(a, '') || ' ' || ...` expression, for GENERATED ALWAYS AS (...)."""
+    parts = [func.coalesce(literal_column(c, Text), "") for c in SEARCH_COLUMNS[table_name]]
+    parts.append(func.coalesce(literal_column("attrs", Text).op("->>")("note"), ""))
+    expr = parts[0]
+    for part in parts[1:]:
+        expr = expr.op("||")(" ").op("||")(part)
+    return expr
+
+def search_tsv_expr(table_name: str):
+    # literal config name: the expression is rendered into DDL, where a bind can't go
+    return func.to_tsvector(literal_column(f"'{TS_CONFIG}'"), search_text_expr(table_name))
+
+# ---------- pg_trgm ----------
+
+_trgm = False
+
+def trigram_enabled() -> bool:
+    return _trgm
+
+def set_trigram_enabled(enabled: bool) -> None:
+    global _trgm
+    _trgm = enabled
+
+def setup(sync_conn) -> None:
+    """Enable pg_trgm when the server allows it and add the trigram indexes; otherwise search is full-text only."""
+    global _trgm
+    try:
+        with sync_conn.begin_nested():
+            sync_conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError:
+        pass  # extension not installed on the server, or no privilege to create it
+    _trgm = bool(sync_conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+    if _trgm:
+        for table in SEARCH_COLUMNS:
+            sync_conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_search_trgm ON {table} USING gin (search_text gin_trgm_ops)"
+            ))
+
+# ---------- querying ----------
+
+# anything but whitespace and tsquery syntax, so emails and phone numbers reach the parser whole
+WORD_RE = re.compile(r"[^\s&|!():<>*'\\]+")
+
+def prefix_tsquery(q: str) -> Optional[str]:
+    """'Dundas St' -> 'dundas:* & st:*'; operator characters are dropped, so the result is always valid syntax."""
+    words = WORD_RE.findall(q.lower())
+    return " & ".join(f"{w}:*" for w in words) if words else None
+
+def _title(entity: str, row) -> str:
+    if entity == "contacts":
+        return " ".join(p for p in (row.first_name, row.last_name) if p) or f"Contact #{row.id}"
+    if entity == "properties":
+        return ", ".join(p for p in (row.address, row.city) if p) or f"Property #{row.id}"
+    return f"Transaction #{row.id} ({row.side} / {row.stage})"
+
+def build_search(table, q: str, tsquery: str, limit: int):
+    """Top `limit` rows of `table` for `q`, ranked, with a highlighted headline."""
+    tsq = func.to_tsquery(TS_CONFIG, tsquery)
+    tsv, body = table.c.search_tsv, table.c.search_text
+    match = tsv.op("@@")(tsq)
+    rank = func.ts_rank_cd(tsv, tsq)
+    if _trgm:
+        # `q <% text` is word_similarity(q, text) above pg_trgm.word_similarity_threshold; GIN-indexable
+        match = or_(match, literal(q, Text).op("<%")(body))
+        rank = rank + func.word_similarity(q, body)
+
+    shown = [table.c[c] for c in ("id",) + SEARCH_COLUMNS[table.name]]
+    # every match is ranked (a bounded top-N sort, so memory stays flat); capping the match set
+    # first would rank an arbitrary subset and could miss the best hits for common words
+    top = select(*shown, body, rank.label("rank")).where(match).order_by(rank.desc(), table.c.id).limit(limit).subquery()
+    headline = func.ts_headline(TS_CONFIG, top.c.search_text, tsq, HEADLINE_OPTIONS)
+    return select(*[top.c[c.name] for c in shown], top.c.rank, headline.label("headline")).order_by(top.c.rank.desc(), top.c.id)
+
+async def search(db, q: str, entities: List[str], limit: int) -> List[Dict]:
+    from app import models
+    tables = {t.name: t for t in models.Base.metadata.sorted_tables if t.name in SEARCH_COLUMNS}
+    tsquery = prefix_tsquery(q)
+    if tsquery is None:
+        return []
+    results = []
+    for entity in entities:
+        rows = await db.execute(build_search(tables[entity], q, tsquery, limit))
+        for r in rows:
+            results.append({
+                "entity": entity,
+                "id": r.id,
+                "title": _title(entity, r),
+                "headline": r.headline,
+                "rank": round(float(r.rank), 4),
+            })
+    results.sort(key=lambda r: r["rank"], reverse=True)
+    return results[:limit]
@@ -0,0 +1,201 @@
+"""
+Resumable uploads for large documents: create a session, PUT the file in chunks, finalize.
+
+Each chunk streams from the request body straight into the session's part file at its offset,
+through a fixed-size buffer, so memory per upload stays constant whatever the file size. A
+chunk is only accepted whole: when its length or its X-Chunk-SHA256 doesn't match, or the
+client disconnects, the part file is cut back to where the chunk started and the client sends
+it again. GET /uploads/{id} tells a client that lost track where to resume.
+
+Finalizing hashes the part file (in a thread, in CHUNK_SIZE reads) and hands it to app.blobs
+like any other upload: content already stored is not stored again, and the local backend
+takes the part file with a rename. Sessions expire SESSION_HOURS after their last chunk; the
+uploads.expire job deletes them and their part files.
+
+Part files live in the blob store's tmp_dir (under BLOB_DIR for the local backend), so every
+API process on the host sees them; with the S3 backend and several hosts, route an upload's
+requests to one host. Writers take an flock on the part file, so concurrent PUTs or a
+finalize racing a PUT get a 409 instead of interleaving.
+"""
+import fcntl
+import hashlib
+import os
+import secrets
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from app import blobs
+from app.db import SessionLocal
+from app.storage import CHUNK_SIZE, get_store
+
+SESSION_HOURS = float(os.getenv("UPLOAD_SESSION_HOURS", "24"))
+MAX_CHUNK = int(os.getenv("UPLOAD_MAX_CHUNK_MB", "64")) * 1024 * 1024
+SUGGESTED_CHUNK = 8 * 1024 * 1024
+SESSION_COLUMNS = "id, filename, mime_type, size, sha256, received, contact_id, property_id, transaction_id, attrs, expires_at"
+
+def part_path(session_id: str) -> str:
+    return os.path.join(get_store().tmp_dir, f"session-{session_id}.part")
+
+@contextmanager
+def _locked(session_id: str):
+    """The part file opened for writing under an exclusive flock; 409 while another request holds it."""
+    try:
+        f = open(part_path(session_id), "r+b")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(status_code=409, detail="another request is writing to this upload")
+        yield f
+    finally:
+        f.close()  # releases the lock
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _write(f, h, data: bytes) -> None:
+    h.update(data)
+    f.write(data)
+
+def _rewind(f, offset: int) -> None:
+    f.seek(offset)
+    f.truncate()
+
+def _sync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())  # an acknowledged chunk survives a crash
+
+# ---------- sessions ----------
+
+async def create(db, fields: Dict[str, Any]) -> Dict[str, Any]:
+    session_id = secrets.token_hex(16)
+    open(part_path(session_id), "wb").close()
+    row = (await db.execute(text(
+        "INSERT INTO upload_sessions (id, filename, mime_type, size, sha256, contact_id, property_id, transaction_id, attrs, expires_at) "
+        "VALUES (:id, :filename, :mime_type, :size, :sha256, :contact_id, :property_id, :transaction_id, CAST(:attrs AS jsonb), "
+        "now() + make_interval(secs => CAST(:hours AS float8) * 3600)) "
+        f"RETURNING {SESSION_COLUMNS}"
+    ), {**fields, "id": session_id, "hours": SESSION_HOURS})).one()
+    return dict(row._mapping)
+
+async def get(db, session_id: str) -> Dict[str, Any]:
+    row = (await db.execute(
+        text(f"SELECT {SESSION_COLUMNS} FROM upload_sessions WHERE id = :id AND expires_at > now()"), {"id": session_id}
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Upload not found (or expired)")
+    return dict(row._mapping)
+
+async def write_chunk(session_id: str, offset: int, body: AsyncIterator[bytes],
+                      length: Optional[int], checksum: Optional[str]) -> int:
+    """Append one chunk at `offset` (which must be the bytes received so far); returns the new offset."""
+    with _locked(session_id) as f:
+        async with SessionLocal() as db:  # read under the lock: no other chunk can move it meanwhile
+            session = await get(db, session_id)
+        if offset != session["received"]:
+            raise HTTPException(status_code=409, detail=f"expected offset {session['received']}",
+                                headers={"Upload-Offset": str(session["received"])})
+        await run_in_threadpool(_rewind, f, offset)  # drop bytes of a chunk that never completed
+        h = hashlib.sha256()
+        size = 0
+        buf = bytearray()
+        try:
+            async for piece in body:
+                size += len(piece)
+                if size > MAX_CHUNK:
+                    raise HTTPException(status_code=413, detail=f"chunks are limited to {MAX_CHUNK} bytes")
+                if session["size"] is not None and offset + size > session["size"]:
+                    raise HTTPException(status_code=413, detail=f"chunk runs past the declared size {session['size']}")
+                buf += piece
+                if len(buf) >= CHUNK_SIZE:
+                    await run_in_threadpool(_write, f, h, bytes(buf))
+                    buf.clear()
+            if buf:
+                await run_in_threadpool(_write, f, h, bytes(buf))
+            if length is not None and size != length:
+                raise HTTPException(status_code=400, detail=f"received {size} of {length} bytes; send the chunk again")
+            if checksum and h.hexdigest() != checksum.lower():
+                raise HTTPException(status_code=400, detail="chunk does not match X-Chunk-SHA256; send it again")
+            await run_in_threadpool(_sync, f)
+        except BaseException as e:  # the chunk is discarded whole
+            await run_in_threadpool(_rewind, f, offset)
+            if isinstance(e, ClientDisconnect):
+                raise HTTPException(status_code=400, detail=f"the chunk broke off after {size} bytes; send it again")
+            raise
+        async with SessionLocal() as db:
+            await db.execute(text(
+                "UPDATE upload_sessions SET received = :received, "
+                "expires_at = now() + make_interval(secs => CAST(:hours AS float8) * 3600) WHERE id = :id"
+            ), {"id": session_id, "received": offset + size, "hours": SESSION_HOURS})
+            await db.commit()
+        return offset + size
+
+async def finalize(db, session_id: str) -> Dict[str, Any]:
+    """
+    Hash and store the complete file, delete the session (in `db`'s transaction, which the
+    caller commits with the document) and return the session with `key`.
+    """
+    with _locked(session_id) as f:
+        session = await get(db, session_id)
+        if session["size"] is not None and session["received"] != session["size"]:
+            raise HTTPException(status_code=409, detail=f"only {session['received']} of {session['size']} bytes received",
+                                headers={"Upload-Offset": str(session["received"])})
+        path = part_path(session_id)
+        await run_in_threadpool(_rewind, f, session["received"])
+        key = await run_in_threadpool(_hash_file, path)
+        if session["sha256"] and key != session["sha256"]:
+            await discard(db, session_id)
+            await db.commit()
+            raise HTTPException(status_code=422, detail=f"the file hashes to {key}, not {session['sha256']}; start a new upload")
+        await blobs.store_file(path, key, session["received"])
+        await db.execute(text("DELETE FROM upload_sessions WHERE id = :id"), {"id": session_id})
+    if os.path.exists(path):  # content that was already stored, or a backend that copies
+        os.unlink(path)
+    return {**session, "key": key}
+
+async def discard(db, session_id: str) -> bool:
+    res = await db.execute(text("DELETE FROM upload_sessions WHERE id = :id RETURNING id"), {"id": session_id})
+    try:
+        os.unlink(part_path(session_id))
+    except FileNotFoundError:
+        pass
+    return res.scalar() is not None
+
+async def abort(db, session_id: str) -> bool:
+    """Discard a session, waiting for no chunk (409 while one is being written)."""
+    try:
+        with _locked(session_id):
+            return await discard(db, session_id)
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+        return await discard(db, session_id)  # the row without its part file
+
+async def expire() -> Dict[str, Any]:
+    """Delete expired sessions and their part files; returns counts and when the next one expires."""
+    removed = 0
+    async with SessionLocal() as db:
+        ids = (await db.execute(text(
+            "SELECT id FROM upload_sessions WHERE expires_at <= now() FOR UPDATE SKIP LOCKED"
+        ))).scalars().all()
+        for session_id in ids:
+            try:
+                removed += await abort(db, session_id)
+            except HTTPException:  # a chunk is still being written to it: next time
+                pass
+        await db.commit()
+        row = (await db.execute(text(
+            "SELECT count(*) AS open, extract(epoch FROM min(expires_at) - now()) AS due_in FROM upload_sessions"
+        ))).one()
+    return {"expired": removed, "open": row.open, "next_due_seconds": max(float(row.due_in), 0.0) if row.open else None}
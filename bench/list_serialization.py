@@ -0,0 +1,90 @@
+"""
+Default vs fast-path serialization for a 100k-row listing.
+
+    python bench/list_serialization.py              # in-memory rows, serialization only
+    python bench/list_serialization.py --db         # also time fetch + encode against DATABASE_URL
+                                                    # (needs >= --rows contacts)
+
+"default" is what a response_model list endpoint does: ORM objects validated through
+schemas.ContactOut (from_attributes), dumped to JSON-able data, encoded with json.dumps.
+"fast" is app.fastjson: plain tuples zipped into dicts and encoded with orjson.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app import models, schemas
+from app.fastjson import dumps, out_columns
+
+PAGE = TypeAdapter(schemas.Page[schemas.ContactOut])
+COLUMNS = out_columns(models.Contact, schemas.ContactOut)
+KEYS = [c.name for c in COLUMNS]
+
+def default_path(objs) -> bytes:
+    page = PAGE.validate_python({"items": objs, "next_cursor": None}, from_attributes=True)
+    return json.dumps(PAGE.dump_python(page, mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def fast_path(rows) -> bytes:
+    return dumps({"items": [dict(zip(KEYS, r)) for r in rows], "next_cursor": None})
+
+def timed(label: str, fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t)
+    print(f"  {label:<28} {best * 1000:9.1f} ms   {len(out) / 1e6:6.1f} MB")
+    return best
+
+def synthetic(n: int):
+    objs: List[models.Contact] = []
+    rows = []
+    for i in range(n):
+        values = {"id": i, "first_name": f"First{i}", "last_name": f"Last{i}", "email": f"user{i}@example.com",
+                  "phone": f"+1416555{i % 10000:04d}", "status": "new", "attrs": {"source": "bench", "score": i % 100}}
+        rows.append(tuple(values[k] for k in KEYS))
+        objs.append(models.Contact(**values))
+    return objs, rows
+
+async def from_db(n: int):
+    from app.db import SessionLocal
+    async with SessionLocal() as db:
+        t = time.perf_counter()
+        objs = (await db.execute(select(models.Contact).order_by(models.Contact.id).limit(n))).scalars().all()
+        orm_fetch = time.perf_counter() - t
+        t = time.perf_counter()
+        rows = (await db.execute(select(*COLUMNS).order_by(models.Contact.id).limit(n))).all()
+        tuple_fetch = time.perf_counter() - t
+    return objs, rows, orm_fetch, tuple_fetch
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--db", action="store_true", help="fetch rows from DATABASE_URL as well")
+    args = parser.parse_args()
+
+    print(f"serialization, {args.rows} synthetic contacts")
+    objs, rows = synthetic(args.rows)
+    slow = timed("default (pydantic + json)", default_path, objs)
+    fast = timed("fast (tuples + orjson)", fast_path, rows)
+    print(f"  speedup {slow / fast:.1f}x")
+
+    if args.db:
+        objs, rows, orm_fetch, tuple_fetch = asyncio.run(from_db(args.rows))
+        print(f"fetch + serialize, {len(rows)} contacts from the database")
+        slow = orm_fetch + timed("default (ORM + pydantic)", default_path, objs, repeat=1)
+        fast = tuple_fetch + timed("fast (tuples + orjson)", fast_path, rows, repeat=1)
+        print(f"  fetch: ORM {orm_fetch * 1000:.1f} ms, tuples {tuple_fetch * 1000:.1f} ms")
+        print(f"  total speedup {slow / fast:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cold-start timing: import of app.main and the startup hook, against DATABASE_URL.
+
+    python -m app.cli migrate && python bench/startup.py [--runs 5] [--max-ms 1500]
+
+For comparison it also times the schema work every boot used to do (create_all plus the
+idempotent upgrade DDL, i.e. all migrations re-run), inside a transaction that is rolled back.
+Exits non-zero if the median import + startup time exceeds --max-ms, so it can gate CI.
+tests/test_startup.py checks the same in the test suite: startup() runs only the version check,
+within STARTUP_MAX_MS.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = r"""
+import asyncio, os, time
+os.environ["RESOLVER_WARM"] = "0"  # the background index build isn't part of startup
+t0 = time.perf_counter()
+from app.main import app, startup
+t1 = time.perf_counter()
+async def boot():
+    await startup()
+    t2 = time.perf_counter()
+    from app.db import engine
+    await engine.dispose()
+    return t2
+t2 = asyncio.run(boot())
+print(f"{(t1 - t0) * 1000:.1f} {(t2 - t1) * 1000:.1f}")
+"""
+
+OLD_BOOT = r"""
+import asyncio, time
+from app.db import engine
+from app.migrations import MIGRATIONS
+async def old_boot():
+    async with engine.connect() as conn:
+        t = time.perf_counter()
+        await conn.run_sync(lambda c: [m.apply(c) for m in MIGRATIONS])
+        dt = time.perf_counter() - t
+        await conn.rollback()
+    await engine.dispose()
+    print(f"{dt * 1000:.1f}")
+asyncio.run(old_boot())
+"""
+
+def run(code: str) -> str:
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if median import + startup exceeds this")
+    args = parser.parse_args()
+
+    imports, startups = [], []
+    for _ in range(args.runs):
+        imp, start = map(float, run(PROBE).split())
+        imports.append(imp)
+        startups.append(start)
+    old = [float(run(OLD_BOOT)) for _ in range(min(args.runs, 3))]
+
+    total = statistics.median(i + s for i, s in zip(imports, startups))
+    print(f"import app.main        median {statistics.median(imports):8.1f} ms")
+    print(f"startup (version check) median {statistics.median(startups):7.1f} ms")
+    print(f"import + startup       median {total:8.1f} ms")
+    print(f"previous per-boot schema work  {statistics.median(old):8.1f} ms (now only in `app.cli migrate`)")
+    if args.max_ms is not None and total > args.max_ms:
+        sys.exit(f"startup {total:.1f} ms exceeds --max-ms {args.max_ms}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Tests that need Postgres take the `pg` fixture and are skipped unless DATABASE_URL points at a
+reachable database migrated to the current schema (`python -m app.cli migrate`).
+
+    DATABASE_URL=postgresql+asyncpg://... python -m pytest -q
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def run(fn, *args):
+    """Run the coroutine function `fn(conn, *args)` on a fresh connection, rolled back afterwards."""
+    from app.db import engine
+
+    async def go():
+        try:
+            async with engine.connect() as conn:
+                try:
+                    return await fn(conn, *args)
+                finally:
+                    await conn.rollback()
+        finally:
+            await engine.dispose()  # each asyncio.run() has its own loop; don't reuse pooled connections
+    return asyncio.run(go())
+
+@pytest.fixture(scope="session")
+def pg():
+    if not os.getenv("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
+    from app.migrations import SchemaOutdated, check
+    try:
+        run(check)
+    except SchemaOutdated as e:
+        pytest.skip(str(e))
+    except Exception as e:  # unreachable host, bad credentials, ...
+        pytest.skip(f"no database: {e}")
+    return run
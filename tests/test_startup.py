@@ -0,0 +1,40 @@
+"""Boot cost: startup() is one version-check round trip, never schema work (see bench/startup.py)."""
+import asyncio
+import os
+import time
+
+from sqlalchemy import event, text
+
+STARTUP_MAX_MS = float(os.getenv("STARTUP_MAX_MS", "500"))
+
+def test_startup_is_one_version_check(pg, monkeypatch):
+    from app import jobs, main, resolver
+    from app.db import engine
+    from app.migrations import STARTUP_QUERY
+
+    # background work startup() may kick off is not part of the boot path being timed
+    monkeypatch.setattr(main, "MIGRATE_ON_STARTUP", False)
+    monkeypatch.setattr(resolver, "WARM_ON_STARTUP", False)
+    monkeypatch.setattr(jobs, "IN_PROCESS", False)
+
+    statements = []
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    async def boot() -> float:
+        try:
+            async with engine.connect() as conn:  # dialect initialization on first connect isn't startup's
+                await conn.execute(text("SELECT 1"))
+            event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+            try:
+                t = time.perf_counter()
+                await main.startup()
+                return (time.perf_counter() - t) * 1000
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        finally:
+            await engine.dispose()
+
+    ms = asyncio.run(boot())
+    assert statements == [str(STARTUP_QUERY)], statements
+    assert ms < STARTUP_MAX_MS, f"startup() took {ms:.1f} ms (STARTUP_MAX_MS={STARTUP_MAX_MS})"